@@ -0,0 +1,26 @@
+"""
+ASGI config for app project.
+
+Django 2.2 does not provide an ASGI handler, so the WSGI application is
+served through core.asgi.ASGIAdapter. Connections and request bodies are
+handled on the event loop and only complete requests take a worker thread.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+"""
+
+import os
+
+from django.conf import settings
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
+
+django_application = get_wsgi_application()
+
+from core.asgi import ASGIAdapter  # noqa: E402
+
+application = ASGIAdapter(
+    django_application,
+    max_threads=settings.ASGI_THREADS,
+    max_body_size=settings.ASGI_MAX_BODY_SIZE
+)
@@ -20,12 +20,17 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 # See https://docs.djangoproject.com/en/2.2/howto/deployment/checklist/
 
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = '+j8brg#go-(w1i*m&tn!r*1rz8h@0jfvf@@nob*o3sf8=chcw3'
+SECRET_KEY = os.environ.get(
+    'SECRET_KEY',
+    '+j8brg#go-(w1i*m&tn!r*1rz8h@0jfvf@@nob*o3sf8=chcw3'
+)
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = bool(int(os.environ.get('DEBUG', 1)))
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = [
+    host for host in os.environ.get('ALLOWED_HOSTS', '').split(',') if host
+]
 
 
 # Application definition
@@ -40,12 +45,13 @@ INSTALLED_APPS = [
     'rest_framework',
     'rest_framework.authtoken',
     'corsheaders',
-    'core',
+    'core.apps.CoreConfig',
     'user',
     'book',
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.security.SecurityMiddleware',
@@ -86,14 +92,38 @@ WSGI_APPLICATION = 'app.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'core.backends.postgresql',
         'HOST': os.environ.get('DB_HOST'),
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASS'),
+        # 接続を使い回す秒数。プールを使う場合は0のままにし、
+        # リクエストの終わりに接続をプールへ返す
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 0)),
+        # プロセス内の接続プール。MAX_SIZEが0の場合は使わない
+        'POOL': {
+            'MAX_SIZE': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+            'TIMEOUT': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+            'CHECK_INTERVAL': 30,
+            'MAX_LIFETIME': 3600,
+        },
     }
 }
 
+# ASGIで動かすときにリクエストを処理するスレッドの数
+# 画像処理のワーカーと合わせて接続プールの大きさを超えないようにする
+ASGI_THREADS = int(os.environ.get(
+    'ASGI_THREADS',
+    max(DATABASES['default']['POOL']['MAX_SIZE'] -
+        int(os.environ.get('BOOK_IMAGE_WORKERS', 2)), 1)
+))
+
+# ASGIで受け付けるリクエストの本文の最大バイト数。画像のアップロード
+# (BOOK_IMAGE_UPLOAD の MAX_BYTES) に multipart の余裕を加える
+ASGI_MAX_BODY_SIZE = int(os.environ.get(
+    'ASGI_MAX_BODY_SIZE', 11 * 1024 * 1024
+))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -137,4 +167,89 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = '/vol/web/media'
 STATIC_ROOT = '/vol/web/static'
 
+# アップロードは 0600 の一時ファイルを移動して保存するため、
+# ウェブサーバーが読めるように権限を設定する
+FILE_UPLOAD_PERMISSIONS = 0o644
+
+# MODE が django の場合はDjangoがファイルを返し、x-accel-redirect
+# (nginx) または x-sendfile (Apache等) の場合はウェブサーバーに任せる
+MEDIA_SERVE = {
+    'MODE': os.environ.get('MEDIA_SERVE_MODE', 'django'),
+    'INTERNAL_PREFIX': '/protected-media/',
+}
+
 AUTH_USER_MODEL = 'core.User'
+
+
+# Book image processing
+# EAGER を True にするとリクエスト内で同期的に処理する
+
+BOOK_IMAGE_PROCESSING = {
+    'WORKERS': int(os.environ.get('BOOK_IMAGE_WORKERS', 2)),
+    'EAGER': False,
+}
+
+# 一覧を .values() の行から直接シリアライズする
+
+FAST_LIST_SERIALIZATION = True
+
+# BACKEND は local (プロセス内のLRU)、キャッシュのエイリアス、
+# または無効にする場合は None
+
+BOOK_RESPONSE_CACHE = {
+    'BACKEND': 'local',
+    'MAX_SIZE': 1000,
+    'TIMEOUT': 300,
+}
+
+BOOK_IMAGE_UPLOAD = {
+    'MAX_BYTES': 10 * 1024 * 1024,
+    'MAX_PIXELS': 40 * 1000 * 1000,
+    'FORMATS': ('JPEG', 'PNG', 'GIF', 'WEBP'),
+}
+
+# リクエストの計測。/metrics にPrometheusの形式で出力する
+# DEBUG が無効の場合、/metrics は TOKEN を設定したときだけ公開する。
+# 複数のワーカープロセスの値は環境変数 PROMETHEUS_MULTIPROC_DIR の
+# ディレクトリで集計する (gunicorn.conf.py で設定する)。
+# SLOW_REQUEST_SECONDS を超えたリクエストは時間のかかった
+# SLOW_REQUEST_SQL 個までのSQLと共にログに出力する (None で無効)
+
+METRICS = {
+    'ENABLED': bool(int(os.environ.get('METRICS_ENABLED', 1))),
+    'TOKEN': os.environ.get('METRICS_TOKEN'),
+    'SLOW_REQUEST_SECONDS': float(
+        os.environ.get('METRICS_SLOW_REQUEST_SECONDS', 1)
+    ) or None,
+    'SLOW_REQUEST_SQL': 10,
+}
+
+
+# Django REST framework
+# https://www.django-rest-framework.org/api-guide/settings/
+
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': (
+        'core.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'core.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
+}
+
+
+# Token authentication cache
+# BACKEND にキャッシュのエイリアスを指定するとプロセス間で共有し、
+# トークンの削除やユーザーの無効化が全てのワーカーに即座に反映される。
+# 指定しない場合はワーカーごとのLRUを使い、他のワーカーでは
+# 最大 LOCAL_TIMEOUT 秒の間、失効したトークンが受け付けられる
+
+TOKEN_AUTH_CACHE = {
+    'MAX_SIZE': 10000,
+    'TIMEOUT': 60,
+    'LOCAL_TIMEOUT': 5,
+    'BACKEND': None,
+}
@@ -13,14 +13,25 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
+
 from django.contrib import admin
-from django.urls import path, include
-from django.conf.urls.static import static
+from django.urls import path, include, re_path
 from django.conf import settings
 
+from core.views import healthz, metrics, readyz, serve_media
+
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/user/', include('user.urls')),
     path('api/book/', include('book.urls')),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    path('healthz', healthz, name='healthz'),
+    path('readyz', readyz, name='readyz'),
+    path('metrics', metrics, name='metrics'),
+    re_path(
+        r'^%s(?P<path>.+)$' % re.escape(settings.MEDIA_URL.lstrip('/')),
+        serve_media,
+        name='media'
+    ),
+]
@@ -0,0 +1,64 @@
+"""APIの性能を測定するベンチマーク
+
+manage.py と同じディレクトリから実行する::
+
+    python -m benchmarks.serializers --books 5000
+
+データは1つのトランザクションの中で作成し、終了時に取り消す
+"""
+import os
+import statistics
+import time
+from contextlib import contextmanager
+
+import django
+
+
+def setup():
+    """Djangoを初期化する"""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
+    django.setup()
+
+
+class Rollback(Exception):
+    """トランザクションを取り消すための例外"""
+
+
+@contextmanager
+def rollback():
+    """ブロック内のデータベースへの書き込みを最後に取り消す"""
+    from django.db import transaction
+
+    try:
+        with transaction.atomic():
+            yield
+            raise Rollback
+    except Rollback:
+        pass
+
+
+def measure(func, repeat=5):
+    """関数を繰り返し実行し、実行時間(秒)のリストを返す"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    return timings
+
+
+def percentile(values, fraction):
+    """ソート済みの値のパーセンタイルを返す"""
+    index = min(len(values) - 1, int(len(values) * fraction))
+    return values[index]
+
+
+def report(name, timings, baseline=None):
+    """実行時間の最小値と中央値を表示する"""
+    best = min(timings)
+    line = (f'{name:<32} best {best * 1000:9.2f} ms  '
+            f'median {statistics.median(timings) * 1000:9.2f} ms')
+    if baseline is not None:
+        line += f'  x{min(baseline) / best:.2f}'
+    print(line)
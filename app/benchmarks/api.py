@@ -0,0 +1,224 @@
+"""APIのエンドポイントごとのスループット、レイテンシ、クエリ数の測定
+
+サーバーは起動せず、テストクライアントでプロセス内からリクエストする::
+
+    python -m benchmarks.api --books 100000 --users 10 \\
+        --save baseline.json
+    python -m benchmarks.api --books 100000 --users 10 \\
+        --compare baseline.json
+
+--compare を指定すると、中央値が --threshold の割合を超えて遅くなった
+エンドポイントと、クエリ数が増えたエンドポイントを表示し、終了コード1で
+終了する。規模の違う結果同士は比べない
+"""
+import argparse
+import io
+import json
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks import percentile, rollback, seed, setup
+
+
+def jpeg(size=(800, 600)):
+    """アップロードに使うJPEG画像を返す"""
+    from PIL import Image
+
+    content = io.BytesIO()
+    Image.new('RGB', size, (120, 80, 40)).save(content, format='JPEG')
+    content.name = 'bench.jpg'
+    content.seek(0)
+
+    return content
+
+
+def endpoints(client, user, password):
+    """(名前, 期待するステータス, リクエストを送る関数, 一覧のキャッシュを
+    使うかどうか) のリストを返す
+    """
+    from django.urls import reverse
+
+    book = user.book_set.order_by('id').first()
+    books_url = reverse('book:book-list')
+    tags_url = reverse('book:tag-list')
+    token_url = reverse('user:token')
+    upload_url = reverse('book:book-upload-image', args=[book.id])
+
+    def upload():
+        image = jpeg()
+        return client.post(upload_url, {'image': image}, format='multipart')
+
+    return [
+        ('books', 200, lambda: client.get(books_url), True),
+        ('books?page_size=500', 200,
+         lambda: client.get(books_url, {'page_size': 500}), True),
+        ('books?search', 200,
+         lambda: client.get(books_url, {'search': 'Book 1'}), True),
+        ('books/<id>', 200,
+         lambda: client.get(reverse('book:book-detail', args=[book.id])),
+         False),
+        ('tags', 200, lambda: client.get(tags_url), True),
+        ('tags?with_counts', 200,
+         lambda: client.get(tags_url, {'with_counts': 1}), True),
+        ('token', 200, lambda: client.post(
+            token_url, {'email': user.email, 'password': password}
+        ), False),
+        ('upload-image', 202, upload, False),
+    ]
+
+
+def count_queries(func):
+    """関数の実行中に発行されたクエリの数を返す"""
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    with CaptureQueriesContext(connection) as queries:
+        func()
+
+    return len(queries)
+
+
+def run(name, expected, func, requests):
+    """エンドポイントを繰り返し呼び出し、測定結果を返す"""
+    def call():
+        res = func()
+        if res.status_code != expected:
+            raise SystemExit(f'{name}: expected {expected}, '
+                             f'got {res.status_code} {res.content[:200]!r}')
+        return res
+
+    # 1回目は接続やキャッシュを温めるため測らない
+    size = len(call().content)
+    queries = count_queries(call)
+
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(requests):
+        begin = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - begin)
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'requests': requests,
+        'throughput': requests / elapsed,
+        'p50': statistics.median(latencies),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+        'queries': queries,
+        'bytes': size,
+    }
+
+
+def report(name, result):
+    """1つのエンドポイントの測定結果を表示する"""
+    print(
+        f'{name:<30} {result["throughput"]:8.1f} req/s  '
+        f'p50 {result["p50"] * 1000:8.2f} ms  '
+        f'p95 {result["p95"] * 1000:8.2f} ms  '
+        f'p99 {result["p99"] * 1000:8.2f} ms  '
+        f'{result["queries"]:3d} queries  '
+        f'{result["bytes"] / 1024:8.1f} KiB'
+    )
+
+
+def compare(results, baseline, threshold):
+    """基準の結果と比べ、遅くなったエンドポイントの説明のリストを返す"""
+    if results['scale'] != baseline['scale']:
+        raise SystemExit(f'Scale {results["scale"]} differs from '
+                         f'the baseline {baseline["scale"]}')
+
+    regressions = []
+    for name, before in baseline['endpoints'].items():
+        after = results['endpoints'].get(name)
+        if after is None:
+            continue
+        if after['p50'] > before['p50'] * (1 + threshold):
+            regressions.append(
+                f'{name}: p50 {before["p50"] * 1000:.2f} ms -> '
+                f'{after["p50"] * 1000:.2f} ms'
+            )
+        if after['queries'] > before['queries']:
+            regressions.append(
+                f'{name}: {before["queries"]} -> {after["queries"]} queries'
+            )
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--books', type=int, default=1000,
+                        help='Total books to seed (1000 to 1000000)')
+    parser.add_argument('--users', type=int, default=1,
+                        help='Users to spread the books over')
+    parser.add_argument('--tags', type=int, default=20,
+                        help='Tags per user')
+    parser.add_argument('--requests', type=int, default=50,
+                        help='Timed requests per endpoint')
+    parser.add_argument('--endpoint', action='append', dest='endpoints',
+                        help='Only measure this endpoint (repeatable)')
+    parser.add_argument('--save', help='Write the results to a JSON file')
+    parser.add_argument('--compare', help='JSON file of baseline results')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Allowed p50 slowdown against the baseline')
+    args = parser.parse_args()
+
+    setup()
+    from django.conf import settings
+    from django.test import override_settings
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+
+    scale = {'books': args.books, 'users': args.users, 'tags': args.tags}
+    results = {'scale': scale, 'endpoints': {}}
+
+    with rollback(), tempfile.TemporaryDirectory() as media_root, \
+            override_settings(MEDIA_ROOT=media_root):
+        start = time.perf_counter()
+        users = seed.seed_libraries(args.users, args.books, tags=args.tags)
+        print(f'Seeded {args.books} books for {args.users} users '
+              f'in {time.perf_counter() - start:.1f}s')
+
+        # 最初のユーザーの本の数が測定する一覧の大きさになる
+        user = users[0]
+        client = APIClient(SERVER_NAME='localhost')
+        res = client.post(reverse('user:token'),
+                          {'email': user.email, 'password': 'benchpass'})
+        client.credentials(HTTP_AUTHORIZATION=f'Token {res.data["token"]}')
+
+        # 一覧はレスポンスキャッシュを無効にしてクエリとシリアライズを
+        # 測り、キャッシュに当たる場合は別の行として測る
+        uncached = {**settings.BOOK_RESPONSE_CACHE, 'BACKEND': None}
+        for name, expected, func, cached in endpoints(client, user,
+                                                      'benchpass'):
+            if args.endpoints and name not in args.endpoints:
+                continue
+            with override_settings(BOOK_RESPONSE_CACHE=uncached):
+                result = run(name, expected, func, args.requests)
+            results['endpoints'][name] = result
+            report(name, result)
+            if cached and settings.BOOK_RESPONSE_CACHE['BACKEND']:
+                name = f'{name} (cached)'
+                result = run(name, expected, func, args.requests)
+                results['endpoints'][name] = result
+                report(name, result)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+"""起動中のサーバーに負荷をかけ、スループットとレイテンシを測る
+
+Djangoは初期化せず、HTTPだけでサーバーに接続する::
+
+    python -m benchmarks.loadtest --url http://localhost:8000 \\
+        --email bench@example.com --password password \\
+        --concurrency 16 --duration 30
+
+各スレッドはキープアライブした接続で --path を順に取得する。
+--concurrency にカンマ区切りで複数の値を渡すと、同時接続数を
+増やしながら測り、WSGI (gthread) とASGIで限界を比べられる::
+
+    gunicorn -c app/gunicorn.conf.py app.wsgi
+    gunicorn -c app/gunicorn.conf.py -k uvicorn.workers.UvicornWorker \\
+        app.asgi
+    python -m benchmarks.loadtest --concurrency 16,64,256,1024 ...
+"""
+import argparse
+import http.client
+import json
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit
+
+from benchmarks import percentile
+
+
+DEFAULT_PATHS = (
+    '/api/book/books/',
+    '/api/book/books/?page_size=500',
+    '/api/book/tags/?with_counts=1',
+    '/api/book/books/stats/',
+)
+
+
+def connect(url):
+    """URLのホストへのHTTP接続を返す"""
+    parts = urlsplit(url)
+    connection_class = http.client.HTTPSConnection \
+        if parts.scheme == 'https' else http.client.HTTPConnection
+
+    return connection_class(parts.netloc, timeout=30)
+
+
+def obtain_token(url, email, password):
+    """ユーザーの認証トークンを取得する"""
+    conn = connect(url)
+    conn.request(
+        'POST',
+        '/api/user/token/',
+        body=json.dumps({'email': email, 'password': password}),
+        headers={'Content-Type': 'application/json'}
+    )
+    res = conn.getresponse()
+    body = res.read()
+    conn.close()
+    if res.status != 200:
+        raise SystemExit(f'Could not obtain a token: {res.status} {body!r}')
+
+    return json.loads(body)['token']
+
+
+class Worker(threading.Thread):
+    """期限まで同じ接続でリクエストを送り続けるスレッド"""
+
+    def __init__(self, url, paths, headers, deadline):
+        super().__init__(daemon=True)
+        self.url = url
+        self.paths = paths
+        self.headers = headers
+        self.deadline = deadline
+        self.latencies = {path: [] for path in paths}
+        self.errors = 0
+
+    def run(self):
+        conn = connect(self.url)
+        i = 0
+        while time.monotonic() < self.deadline:
+            path = self.paths[i % len(self.paths)]
+            i += 1
+            start = time.perf_counter()
+            try:
+                conn.request('GET', path, headers=self.headers)
+                res = conn.getresponse()
+                res.read()
+            except (OSError, http.client.HTTPException):
+                self.errors += 1
+                conn.close()
+                conn = connect(self.url)
+                continue
+
+            if res.status != 200:
+                self.errors += 1
+            else:
+                self.latencies[path].append(time.perf_counter() - start)
+        conn.close()
+
+
+def report(name, latencies, elapsed):
+    """リクエスト数/秒とレイテンシの分布を表示する"""
+    if not latencies:
+        print(f'{name:<40} no successful requests')
+        return
+
+    latencies = sorted(latencies)
+    print(
+        f'{name:<40} {len(latencies) / elapsed:9.1f} req/s  '
+        f'p50 {statistics.median(latencies) * 1000:8.2f} ms  '
+        f'p99 {percentile(latencies, 0.99) * 1000:8.2f} ms  '
+        f'max {latencies[-1] * 1000:8.2f} ms'
+    )
+
+
+def run(url, paths, headers, concurrency, duration):
+    """concurrency 本の接続で duration 秒負荷をかけ、経過時間とスレッドを返す"""
+    start = time.monotonic()
+    workers = [Worker(url, paths, headers, start + duration)
+               for _ in range(concurrency)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    return time.monotonic() - start, workers
+
+
+def concurrency_levels(value):
+    """カンマ区切りの同時接続数を解釈する"""
+    try:
+        levels = [int(level) for level in value.split(',')]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'Invalid concurrency {value!r}')
+    if not levels or min(levels) < 1:
+        raise argparse.ArgumentTypeError(f'Invalid concurrency {value!r}')
+
+    return levels
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--url', default='http://localhost:8000')
+    parser.add_argument('--token', help='Token of the user to act as')
+    parser.add_argument('--email')
+    parser.add_argument('--password')
+    parser.add_argument('--path', action='append', dest='paths',
+                        help='Path to request (repeatable)')
+    parser.add_argument('--concurrency', type=concurrency_levels,
+                        default=[8],
+                        help='Connections, or a comma separated list to sweep')
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--warmup', type=float, default=2)
+    args = parser.parse_args()
+
+    token = args.token or obtain_token(args.url, args.email, args.password)
+    headers = {
+        'Authorization': f'Token {token}',
+        'Accept': 'application/json',
+    }
+    paths = tuple(args.paths or DEFAULT_PATHS)
+
+    # 接続プールやキャッシュが温まるまでの結果は捨てる
+    if args.warmup:
+        run(args.url, paths, headers, args.concurrency[0], args.warmup)
+
+    for concurrency in args.concurrency:
+        elapsed, workers = run(args.url, paths, headers, concurrency,
+                               args.duration)
+        print(f'{concurrency} connections, {elapsed:.1f}s '
+              f'against {args.url}')
+        for path in paths:
+            report(path, [latency for worker in workers
+                          for latency in worker.latencies[path]], elapsed)
+        report('total', [latency for worker in workers
+                         for latencies in worker.latencies.values()
+                         for latency in latencies], elapsed)
+        print(f'errors: {sum(worker.errors for worker in workers)}')
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""JSONRenderer と FastJSONRenderer のエンコード時間とメモリ確保量の比較"""
+import argparse
+import io
+import tracemalloc
+import uuid
+from collections import OrderedDict
+
+from benchmarks import measure, report, setup
+
+
+def sample_books(count):
+    """BookRowSerializer の出力と同じ形の本の一覧を返す"""
+    return [
+        OrderedDict((
+            ('id', i),
+            ('title', f'本のタイトル {i}'),
+            ('tags', [i % 7, i % 11, i % 13]),
+            ('price', f'{i % 1000}.99'),
+            ('link', f'https://example.com/books/{uuid.uuid4()}'),
+        ))
+        for i in range(count)
+    ]
+
+
+def peak_allocation(func):
+    """関数の実行中に確保されたメモリの最大量(バイト)を返す"""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--books', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup()
+    from rest_framework.parsers import JSONParser
+    from rest_framework.renderers import JSONRenderer
+
+    from core.parsers import FastJSONParser
+    from core.renderers import FastJSONRenderer, orjson
+
+    if orjson is None:
+        raise SystemExit('orjson is not installed')
+
+    data = {'next': None, 'previous': None,
+            'results': sample_books(args.books)}
+    renderers = (('JSONRenderer', JSONRenderer()),
+                 ('FastJSONRenderer', FastJSONRenderer()))
+
+    print(f'{args.books} books, render')
+    baseline = None
+    for name, renderer in renderers:
+        timings = measure(lambda: renderer.render(data), args.repeat)
+        report(name, timings, baseline)
+        peak = peak_allocation(lambda: renderer.render(data))
+        print(f'{"":<32} peak allocation {peak / 1024:9.0f} KiB')
+        baseline = baseline or timings
+
+    content = JSONRenderer().render(data)
+    print(f'{args.books} books, parse {len(content) / 1024:.0f} KiB')
+    baseline = measure(
+        lambda: JSONParser().parse(io.BytesIO(content)), args.repeat
+    )
+    report('JSONParser', baseline)
+    report('FastJSONParser', measure(
+        lambda: FastJSONParser().parse(io.BytesIO(content)), args.repeat
+    ), baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+import random
+
+
+def seed_library(email, books, tags=20, tags_per_book=3, batch_size=5000):
+    """合成したユーザー、タグ、本を作成し、ユーザーを返す"""
+    from django.contrib.auth import get_user_model
+
+    from core.models import Book, Tag
+
+    user = get_user_model().objects.create_user(email, 'benchpass')
+    Tag.objects.bulk_create(
+        [Tag(user=user, name=f'Tag {i}') for i in range(tags)]
+    )
+    tag_ids = [tag.id for tag in Tag.objects.filter(user=user)]
+
+    through = Book.tags.through
+    rng = random.Random(email)
+    for offset in range(0, books, batch_size):
+        count = min(batch_size, books - offset)
+        Book.objects.bulk_create(
+            Book(
+                user=user,
+                title=f'Book {offset + i}',
+                price=f'{rng.randint(100, 99999) / 100:.2f}',
+                link=f'https://example.com/books/{offset + i}'
+            )
+            for i in range(count)
+        )
+        book_ids = Book.objects.filter(user=user) \
+            .order_by('-id').values_list('id', flat=True)[:count]
+        through.objects.bulk_create(
+            through(book_id=book_id, tag_id=tag_id)
+            for book_id in book_ids
+            for tag_id in rng.sample(tag_ids, min(tags_per_book, tags))
+        )
+
+    return user
+
+
+def seed_libraries(users, books, **options):
+    """books 冊の本を users 人のユーザーに分けて作成し、ユーザーを返す"""
+    return [
+        seed_library(
+            f'bench{i}@example.com',
+            books // users + (1 if i < books % users else 0),
+            **options
+        )
+        for i in range(users)
+    ]
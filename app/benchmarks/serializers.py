@@ -0,0 +1,46 @@
+"""ModelSerializer と .values() による高速な一覧の経路の比較"""
+import argparse
+
+from benchmarks import measure, report, rollback, seed, setup
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--books', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup()
+    from django.db.models import Prefetch
+    from rest_framework.renderers import JSONRenderer
+
+    from book.serializers import BookRowSerializer, BookSerializer
+    from core.models import Book, Tag
+
+    with rollback():
+        user = seed.seed_library('bench@example.com', args.books)
+        queryset = Book.objects.filter(user=user).order_by('-id')
+        renderer = JSONRenderer()
+
+        def model_serializer():
+            books = queryset.prefetch_related(
+                Prefetch('tags', queryset=Tag.objects.order_by('id'))
+            )
+            return renderer.render(BookSerializer(books, many=True).data)
+
+        def row_serializer():
+            rows = BookRowSerializer.rows(queryset)
+            return renderer.render(BookRowSerializer(rows, many=True).data)
+
+        if model_serializer() != row_serializer():
+            raise SystemExit('Serialized output differs')
+
+        print(f'{args.books} books, query + serialize + render')
+        baseline = measure(model_serializer, args.repeat)
+        report('BookSerializer', baseline)
+        report('BookRowSerializer', measure(row_serializer, args.repeat),
+               baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+import csv
+from collections import defaultdict
+from itertools import islice
+
+from rest_framework.renderers import BaseRenderer
+
+from core.models import Book
+from core.renderers import FastJSONRenderer
+
+
+# CSVでタグの名前を区切る文字
+TAG_SEPARATOR = '|'
+CSV_COLUMNS = ('id', 'title', 'price', 'link', 'tags')
+
+
+def iter_books(queryset, chunk_size=2000):
+    """本をタグと共に (id, title, price, link, tags) として順に返す
+
+    本はサーバーサイドカーソルで chunk_size 件ずつ読み、タグは
+    チャンクごとに1回のクエリで取得するため、本の数に関係なく
+    メモリの使用量が一定になる。tags は (id, name) のリスト
+    """
+    rows = queryset.values_list('id', 'title', 'price', 'link') \
+        .iterator(chunk_size=chunk_size)
+
+    for chunk in iter(lambda: list(islice(rows, chunk_size)), []):
+        tags = defaultdict(list)
+        through = Book.tags.through.objects.filter(
+            book_id__in=[row[0] for row in chunk]
+        ).order_by('tag_id').values_list('book_id', 'tag_id', 'tag__name')
+        for book_id, tag_id, name in through:
+            tags[book_id].append((tag_id, name))
+
+        for row in chunk:
+            yield row + (tags[row[0]],)
+
+
+class Echo:
+    """書き込まれた値をそのまま返すファイルのようなオブジェクト"""
+
+    def write(self, value):
+        return value
+
+
+class NDJSONRenderer(BaseRenderer):
+    """1行に1つのJSONオブジェクトを書き出すレンダラー"""
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # エラーのレスポンスなどを1行のJSONとして返す
+        return FastJSONRenderer().render(data) + b'\n'
+
+    def stream(self, books):
+        """本を1行ずつJSONにして返す"""
+        renderer = FastJSONRenderer()
+        for book_id, title, price, link, tags in books:
+            yield renderer.render({
+                'id': book_id,
+                'title': title,
+                'price': f'{price:f}',
+                'link': link,
+                'tags': [{'id': tag_id, 'name': name}
+                         for tag_id, name in tags],
+            }) + b'\n'
+
+
+class CSVRenderer(NDJSONRenderer):
+    """本をCSVとして書き出すレンダラー"""
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def stream(self, books):
+        """本を1行ずつCSVにして返す"""
+        writer = csv.writer(Echo())
+        yield writer.writerow(CSV_COLUMNS)
+        for book_id, title, price, link, tags in books:
+            yield writer.writerow((
+                book_id,
+                title,
+                f'{price:f}',
+                link,
+                TAG_SEPARATOR.join(name for _, name in tags),
+            ))
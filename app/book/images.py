@@ -0,0 +1,145 @@
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from PIL import Image
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from core.models import Book
+from core.storage import image_storage, release_images
+
+
+logger = logging.getLogger(__name__)
+
+# 生成する画像のフィールドと最大サイズ
+VARIANTS = (
+    ('image_thumbnail', (150, 150)),
+    ('image_medium', (600, 600)),
+)
+
+_executor = None
+
+
+def get_executor():
+    """画像処理用のワーカープールを返す"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.BOOK_IMAGE_PROCESSING['WORKERS'],
+            thread_name_prefix='book-image'
+        )
+
+    return _executor
+
+
+def render_variant(image, size):
+    """画像を指定サイズ以内に縮小したJPEGのバイト列を返す"""
+    variant = image.copy()
+    variant.thumbnail(size, Image.LANCZOS)
+    if variant.mode not in ('RGB', 'L'):
+        variant = variant.convert('RGB')
+
+    buffer = io.BytesIO()
+    variant.save(buffer, format='JPEG', quality=85, optimize=True)
+    return buffer.getvalue()
+
+
+def process_book_image(book_id):
+    """本の画像からサムネイルと中サイズの画像を生成する"""
+    book = Book.objects.filter(id=book_id).exclude(image='').first()
+    if book is None or not book.image:
+        return
+
+    source = book.image.name
+    fields = [field for field, _ in VARIANTS]
+
+    # 同じ内容の画像が処理済みであれば縮小画像を使い回す
+    processed = Book.objects.filter(
+        image=source,
+        image_status=Book.IMAGE_READY
+    ).values(*fields).first()
+    if processed is not None:
+        Book.objects.filter(id=book_id, image=source).update(
+            image_status=Book.IMAGE_READY,
+            image_status_updated=timezone.now(),
+            **processed
+        )
+        return
+
+    Book.objects.filter(id=book_id, image=source).update(
+        image_status=Book.IMAGE_PROCESSING,
+        image_status_updated=timezone.now()
+    )
+
+    # この処理で新しく作ったファイル。結果を書き込めなければすぐに消す
+    created = []
+    try:
+        with book.image.open('rb') as f:
+            image = Image.open(f)
+            image.load()
+        name = os.path.splitext(os.path.basename(source))[0]
+        for field, size in VARIANTS:
+            variant = getattr(book, field)
+            content = ContentFile(render_variant(image, size))
+            exists = image_storage.exists(image_storage.content_name(
+                variant.field.generate_filename(book, f'{name}.jpg'),
+                content
+            ))
+            variant.save(f'{name}.jpg', content, save=False)
+            if not exists:
+                created.append(variant.name)
+    except (IOError, ValueError):
+        logger.exception('Failed to process image for book %s', book_id)
+        release_images(created, grace=0)
+        values = {'image_status': Book.IMAGE_FAILED}
+    else:
+        values = {field: getattr(book, field).name for field in fields}
+        values['image_status'] = Book.IMAGE_READY
+
+    # 処理中に別の画像がアップロードされていれば結果を書き込まない
+    values['image_status_updated'] = timezone.now()
+    if not Book.objects.filter(id=book_id, image=source).update(**values):
+        release_images(created, grace=0)
+
+
+def _process_in_worker(book_id):
+    """ワーカースレッドで画像を処理し、スレッドの接続を閉じる"""
+    close_old_connections()
+    try:
+        process_book_image(book_id)
+    except Exception:
+        logger.exception('Unexpected error processing book %s', book_id)
+    finally:
+        connections.close_all()
+
+
+def schedule_book_image(book):
+    """トランザクションの確定後に本の画像の処理を予約する"""
+    if settings.BOOK_IMAGE_PROCESSING['EAGER']:
+        process_book_image(book.id)
+        return
+
+    transaction.on_commit(
+        lambda: get_executor().submit(_process_in_worker, book.id)
+    )
+
+
+def stale_book_images(older_than):
+    """older_than 秒以上 pending または processing のままの本を返す
+
+    ワーカーの停止などで失われた処理を見つけるために使う
+    """
+    threshold = timezone.now() - timedelta(seconds=older_than)
+    return Book.objects.filter(
+        image_status__in=(Book.IMAGE_PENDING, Book.IMAGE_PROCESSING)
+    ).filter(
+        Q(image_status_updated__lte=threshold) |
+        Q(image_status_updated__isnull=True)
+    )
@@ -0,0 +1,133 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.http import parse_etags, quote_etag
+
+from rest_framework import status
+from rest_framework.response import Response
+
+from core.cache import LRUCache
+from core.models import LibraryVersion
+
+
+local_list_cache = LRUCache(
+    max_size=settings.BOOK_RESPONSE_CACHE['MAX_SIZE'],
+    timeout=settings.BOOK_RESPONSE_CACHE['TIMEOUT']
+)
+
+
+def get_list_cache():
+    """設定されたレスポンスキャッシュのバックエンドを返す"""
+    backend = settings.BOOK_RESPONSE_CACHE['BACKEND']
+    if backend is None:
+        return None
+    elif backend == 'local':
+        return local_list_cache
+
+    return caches[backend]
+
+
+def request_digest(request):
+    """レスポンスの内容を左右するリクエストの要素のハッシュを返す"""
+    variant = '|'.join((
+        request.get_host(),
+        request.get_full_path(),
+        request.META.get('HTTP_ACCEPT', ''),
+    ))
+
+    return hashlib.sha1(variant.encode()).hexdigest()[:16]
+
+
+class VersionedCollectionMixin:
+    """ユーザーのコレクションのバージョンを扱うビューセットのミックスイン
+
+    version_collection には LibraryVersion のフィールド名を指定する
+    """
+    version_collection = None
+
+    def get_collection_version(self):
+        """現在のユーザーのコレクションのバージョンを返す"""
+        if not hasattr(self, '_collection_version'):
+            self._collection_version = LibraryVersion.objects.get_version(
+                self.request.user,
+                self.version_collection
+            )
+
+        return self._collection_version
+
+    def bump_collection_version(self, *collections):
+        """現在のユーザーのコレクションのバージョンを上げる"""
+        LibraryVersion.objects.bump(
+            self.request.user,
+            *(collections or (self.version_collection,))
+        )
+
+
+class ConditionalListMixin(VersionedCollectionMixin):
+    """コレクションのバージョンから一覧のETagを計算するミックスイン
+
+    If-None-Match が一致すれば、一覧のクエリもシリアライズも行わずに
+    304を返す
+    """
+
+    def get_list_etag(self, request):
+        """一覧のレスポンスを一意に表すETagを返す"""
+        return quote_etag('-'.join((
+            self.version_collection,
+            str(request.user.pk),
+            str(self.get_collection_version()),
+            request_digest(request),
+        )))
+
+    def list(self, request, *args, **kwargs):
+        etag = self.get_list_etag(request)
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            return Response(
+                status=status.HTTP_304_NOT_MODIFIED,
+                headers={'ETag': etag}
+            )
+
+        response = super().list(request, *args, **kwargs)
+        response['ETag'] = etag
+        return response
+
+
+class CachedListMixin(VersionedCollectionMixin):
+    """シリアライズ済みの一覧をキャッシュするミックスイン
+
+    キャッシュのキーにコレクションのバージョンを含めるため、
+    書き込みでバージョンが上がると古いエントリは参照されなくなり、
+    LRUか有効期限によって破棄される
+    """
+
+    def get_list_cache_key(self, request):
+        """一覧のキャッシュのキーを返す"""
+        return ':'.join((
+            'book-api',
+            self.version_collection,
+            str(request.user.pk),
+            self.action,
+            str(self.get_collection_version()),
+            request_digest(request),
+        ))
+
+    def list(self, request, *args, **kwargs):
+        cache = get_list_cache()
+        if cache is None:
+            return super().list(request, *args, **kwargs)
+
+        key = self.get_list_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(
+                key,
+                response.data,
+                settings.BOOK_RESPONSE_CACHE['TIMEOUT']
+            )
+
+        return response
@@ -0,0 +1,18 @@
+from rest_framework.pagination import CursorPagination
+
+
+class BookCursorPagination(CursorPagination):
+    """本の一覧のためのカーソルページネーション
+
+    OFFSETを使わずに直前のページの最後のIDから読み進めるため、
+    深いページでもクエリのコストが変わらない
+    """
+    ordering = '-id'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class TagCursorPagination(BookCursorPagination):
+    """タグの一覧のためのカーソルページネーション"""
+    ordering = ('-name', '-id')
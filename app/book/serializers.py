@@ -1,23 +1,183 @@
+from collections import OrderedDict, defaultdict
+
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.db.models import Q
+from django.utils.translation import ugettext_lazy as _
+
 from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
 
-from core.models import Tag, Book
+from core.metrics import TimedListSerializer, TimedSerializerMixin
+from core.models import Tag, Book, LibrarySummary, TagSummary
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """タグオブジェクトのためのシリアライザー"""
 
     class Meta:
         model = Tag
         fields = ('id', 'name')
         read_only_fields = ('id',)
+        list_serializer_class = TimedListSerializer
+
+
+class TagUsageSerializer(TagSerializer):
+    """タグを付けられた本の数と共にタグを読み出すシリアライザー"""
+    books = serializers.IntegerField(read_only=True)
+
+    class Meta(TagSerializer.Meta):
+        fields = TagSerializer.Meta.fields + ('books',)
+        read_only_fields = fields
+
+
+class BatchedManyRelatedField(serializers.ManyRelatedField):
+    """全てのIDを1回のクエリで解決する多対多のフィールド
+
+    ManyRelatedField はIDごとにクエリを発行するため、IDをまとめて
+    in_bulk で解決し、存在しないIDはまとめてエラーとして返す
+    """
+    default_error_messages = {
+        'does_not_exist':
+            _('Invalid pks {pk_values} - objects do not exist.'),
+    }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._resolved = {}
+
+    def to_pk(self, data):
+        """入力された値を主キーに変換する"""
+        queryset = self.child_relation.get_queryset()
+        try:
+            return queryset.model._meta.pk.to_python(data)
+        except (TypeError, ValidationError):
+            self.child_relation.fail(
+                'incorrect_type',
+                data_type=type(data).__name__
+            )
+
+    def preload(self, data):
+        """一括操作の全ての項目のIDを先にまとめて解決する"""
+        pks = set()
+        for item in data:
+            try:
+                pks.add(self.to_pk(item))
+            except serializers.ValidationError:
+                pass
+
+        self._resolve(pks)
+
+    def _resolve(self, pks):
+        """まだ解決していないIDを1回のクエリで解決する"""
+        pks = set(pks) - self._resolved.keys()
+        if pks:
+            objects = self.child_relation.get_queryset().in_bulk(pks)
+            for pk in pks:
+                self._resolved[pk] = objects.get(pk)
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+
+        pks = [self.to_pk(item) for item in data]
+        self._resolve(pks)
+        missing = [pk for pk in pks if self._resolved[pk] is None]
+        if missing:
+            self.fail('does_not_exist', pk_values=missing)
+
+        return [self._resolved[pk] for pk in pks]
+
+
+class UserTagField(serializers.PrimaryKeyRelatedField):
+    """リクエストしたユーザーのタグだけを受け付けるフィールド
+
+    many=True では BatchedManyRelatedField として全てのIDをまとめて解決する
+    """
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+
+        return BatchedManyRelatedField(**list_kwargs)
+
+    def get_queryset(self):
+        return Tag.objects.filter(user=self.context['request'].user)
+
 
+class BookListSerializer(TimedListSerializer):
+    """本を一括で作成・更新するためのシリアライザー"""
+    batch_size = 1000
 
-class BookSerializer(serializers.ModelSerializer):
+    def to_internal_value(self, data):
+        # 全ての項目のタグをまとめて解決し、項目ごとのクエリをなくす
+        tags = self.child.fields.get('tags')
+        if isinstance(tags, BatchedManyRelatedField) and \
+                isinstance(data, list):
+            tags.preload(
+                pk for item in data if isinstance(item, dict)
+                for pk in item.get('tags') or ()
+                if isinstance(item.get('tags'), list)
+            )
+
+        return super().to_internal_value(data)
+
+    def _set_tags(self, books, tags_list):
+        """中間テーブルに直接書き込んで本のタグを置き換える"""
+        through = Book.tags.through
+        through.objects.filter(book__in=books).delete()
+        through.objects.bulk_create(
+            [
+                through(book_id=book.id, tag_id=tag.id)
+                for book, tags in zip(books, tags_list)
+                for tag in set(tags)
+            ],
+            batch_size=self.batch_size
+        )
+
+    def create(self, validated_data):
+        tags_list = [attrs.pop('tags', []) for attrs in validated_data]
+        books = [Book(**attrs) for attrs in validated_data]
+
+        if connection.features.can_return_ids_from_bulk_insert:
+            Book.objects.bulk_create(books, batch_size=self.batch_size)
+        else:
+            # 作成したIDを返せないバックエンドでは1件ずつ保存する
+            for book in books:
+                book.save()
+
+        self._set_tags(books, tags_list)
+        return books
+
+    def update(self, instances, validated_data):
+        fields = set()
+        tagged_books, tags_list = [], []
+        for book, attrs in zip(instances, validated_data):
+            if 'tags' in attrs:
+                tagged_books.append(book)
+                tags_list.append(attrs.pop('tags'))
+            for field, value in attrs.items():
+                setattr(book, field, value)
+                fields.add(field)
+
+        if fields:
+            Book.objects.bulk_update(
+                instances, fields, batch_size=self.batch_size
+            )
+        if tagged_books:
+            self._set_tags(tagged_books, tags_list)
+
+        return instances
+
+
+class BookSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Bookシリアライザー"""
-    tags = serializers.PrimaryKeyRelatedField(
-        many=True,
-        queryset=Tag.objects.all()
-    )
+    tags = UserTagField(many=True)
 
     class Meta:
         model = Book
@@ -26,16 +186,189 @@ class BookSerializer(serializers.ModelSerializer):
             'link',
         )
         read_only_fields = ('id',)
+        list_serializer_class = BookListSerializer
 
 
 class BookDetailSerializer(BookSerializer):
     tags = TagSerializer(many=True, read_only=True)
 
+    class Meta(BookSerializer.Meta):
+        fields = BookSerializer.Meta.fields + (
+            'image', 'image_status', 'image_thumbnail', 'image_medium',
+        )
+        read_only_fields = (
+            'id', 'image', 'image_status', 'image_thumbnail', 'image_medium',
+        )
+
+
+class UploadedImageField(serializers.ImageField):
+    """アップロード中にヘッダーを検証済みの画像を受け取るフィールド
+
+    BookImageUploadHandler が検証したファイルはPillowで開き直さない
+    """
+
+    def to_internal_value(self, data):
+        if getattr(data, 'image_format', None):
+            return serializers.FileField.to_internal_value(self, data)
+
+        return super().to_internal_value(data)
+
 
 class BookImageSerializer(serializers.ModelSerializer):
     """画像を本にアップロードするためのシリアライザー"""
+    image = UploadedImageField()
 
     class Meta:
         model = Book
-        fields = ('id', 'image')
-        read_only_fields = ('id',)
+        fields = (
+            'id', 'image', 'image_status', 'image_thumbnail', 'image_medium',
+        )
+        read_only_fields = (
+            'id', 'image_status', 'image_thumbnail', 'image_medium',
+        )
+
+
+class BookIdField(serializers.IntegerField):
+    """一括操作で指定する本のIDのフィールド
+
+    JSONの true や false は整数として扱わない
+    """
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('min_value', 1)
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('invalid')
+
+        return super().to_internal_value(data)
+
+
+class BookBulkDestroySerializer(serializers.Serializer):
+    """本を一括で削除するためのシリアライザー"""
+    ids = serializers.ListField(child=BookIdField())
+
+
+class TagStatsSerializer(serializers.ModelSerializer):
+    """タグごとの本の集計のためのシリアライザー"""
+    id = serializers.IntegerField(source='tag_id')
+    name = serializers.CharField(source='tag.name')
+    average_price = serializers.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        read_only=True
+    )
+
+    class Meta:
+        model = TagSummary
+        fields = ('id', 'name', 'books', 'total_price', 'average_price')
+        read_only_fields = fields
+
+
+class LibraryStatsSerializer(TimedSerializerMixin,
+                             serializers.ModelSerializer):
+    """ユーザーの本の集計のためのシリアライザー"""
+    average_price = serializers.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        read_only=True
+    )
+    tags = TagStatsSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = LibrarySummary
+        fields = ('books', 'total_price', 'average_price', 'tags')
+        read_only_fields = fields
+
+
+class TagRowSerializer(serializers.BaseSerializer):
+    """.values() の行からタグを読み出すシリアライザー
+
+    TagSerializer と同じ出力をフィールドの解析なしで組み立てる
+    """
+    columns = ('id', 'name')
+
+    class Meta:
+        list_serializer_class = TimedListSerializer
+
+    @classmethod
+    def rows(cls, queryset):
+        """シリアライズに必要な列だけを取得するクエリセットを返す"""
+        return queryset.values(*cls.columns)
+
+    def to_representation(self, row):
+        return OrderedDict((('id', row['id']), ('name', row['name'])))
+
+
+class TagUsageRowSerializer(TagRowSerializer):
+    """.values() の行から本の数と共にタグを読み出すシリアライザー
+
+    TagUsageSerializer と同じ出力を組み立てる
+    """
+    columns = ('id', 'name', 'books')
+
+    def to_representation(self, row):
+        return OrderedDict((
+            ('id', row['id']),
+            ('name', row['name']),
+            ('books', row['books']),
+        ))
+
+
+class BookRowListSerializer(TimedListSerializer):
+    """本の行の一覧に、まとめて取得したタグのIDを付けて読み出す"""
+
+    def to_representation(self, data):
+        rows = list(data)
+        if rows and 'tag_ids' not in rows[0]:
+            tag_ids = defaultdict(list)
+            through = Book.tags.through.objects.filter(
+                book_id__in=[row['id'] for row in rows]
+            ).order_by('tag_id').values_list('book_id', 'tag_id')
+            for book_id, tag_id in through:
+                tag_ids[book_id].append(tag_id)
+            for row in rows:
+                row['tag_ids'] = tag_ids[row['id']]
+
+        return super().to_representation(rows)
+
+
+class BookRowSerializer(serializers.BaseSerializer):
+    """.values() の行から本を読み出すシリアライザー
+
+    一覧のための読み出し専用の高速な経路で、BookSerializer と
+    同じ出力をフィールドの解析やフィールドごとの呼び出しなしで組み立てる
+    """
+    columns = ('id', 'title', 'price', 'link')
+    price = serializers.DecimalField(max_digits=5, decimal_places=2)
+
+    class Meta:
+        list_serializer_class = BookRowListSerializer
+
+    @classmethod
+    def rows(cls, queryset):
+        """シリアライズに必要な列だけを取得するクエリセットを返す
+
+        PostgreSQLではタグのIDを配列に集約して同じクエリで取得する
+        """
+        queryset = queryset.prefetch_related(None).values(*cls.columns)
+        if connection.vendor == 'postgresql':
+            from django.contrib.postgres.aggregates import ArrayAgg
+
+            queryset = queryset.annotate(tag_ids=ArrayAgg(
+                'tags__id',
+                filter=Q(tags__isnull=False),
+                ordering='tags__id'
+            ))
+
+        return queryset
+
+    def to_representation(self, row):
+        return OrderedDict((
+            ('id', row['id']),
+            ('title', row['title']),
+            ('tags', row['tag_ids']),
+            ('price', self.price.to_representation(row['price'])),
+            ('link', row['link']),
+        ))
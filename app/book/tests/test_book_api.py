@@ -1,21 +1,33 @@
+import csv
+import json
 import tempfile
 import os
+from unittest.mock import patch
 
 from PIL import Image
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from core.models import Book, Tag
+from core.lookups import trigram_available
+from core.models import Book, LibrarySummary, Tag, TagSummary
 
-from book.serializers import BookSerializer, BookDetailSerializer
+from book.images import process_book_image, render_variant
+from book.serializers import BookSerializer, BookDetailSerializer, \
+                             BookRowSerializer
 
 
 BOOKS_URL = reverse('book:book-list')
+BULK_URL = reverse('book:book-bulk')
+EXPORT_URL = reverse('book:book-export')
+STATS_URL = reverse('book:book-stats')
 
 
 def sample_tag(user, name='Main book'):
@@ -39,6 +51,15 @@ def sample_book(user, **params):
     return Book.objects.create(user=user, **defaults)
 
 
+def count_queries(client, url):
+    """GETリクエストで発行されたクエリ数を返す"""
+    with CaptureQueriesContext(connection) as ctx:
+        res = client.get(url)
+
+    assert res.status_code == status.HTTP_200_OK
+    return len(ctx.captured_queries)
+
+
 def image_upload_url(book_id):
     """本の画像をアップロードするためのURLを返す"""
     return reverse('book:book-upload-image', args=[book_id])
@@ -78,7 +99,7 @@ class PrivateBOOKApiTests(TestCase):
         books = Book.objects.all().order_by('-id')
         serializer = BookSerializer(books, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_books_limited_to_user(self):
         """ユーザーの本を取得するテスト"""
@@ -94,8 +115,8 @@ class PrivateBOOKApiTests(TestCase):
         books = Book.objects.filter(user=self.user)
         serializer = BookSerializer(books, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_view_book_detail(self):
         """本の詳細を表示する"""
@@ -139,6 +160,68 @@ class PrivateBOOKApiTests(TestCase):
         self.assertIn(tag1, tags)
         self.assertIn(tag2, tags)
 
+    def count_tag_queries(self, method, url, payload):
+        """リクエストでタグのIDを解決したクエリの数とレスポンスを返す"""
+        with CaptureQueriesContext(connection) as ctx:
+            res = method(url, payload, format='json')
+
+        # 本に付いたタグの読み出し(中間テーブルとの結合)は数えない
+        tag_queries = [
+            query for query in ctx.captured_queries
+            if query['sql'].startswith('SELECT') and
+            'FROM "core_tag"' in query['sql'] and
+            'core_book_tags' not in query['sql']
+        ]
+        return len(tag_queries), res
+
+    def test_create_book_resolves_tags_in_one_query(self):
+        """タグの数に関係なく1回のクエリでタグを解決するテスト"""
+        tags = [sample_tag(user=self.user, name=f'Tag {i}') for i in range(5)]
+
+        queries, res = self.count_tag_queries(self.client.post, BOOKS_URL, {
+            'title': 'Book', 'price': '5.00',
+            'tags': [tag.id for tag in tags],
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(queries, 1)
+
+    def test_create_book_with_foreign_tags(self):
+        """他のユーザーのタグや存在しないタグがまとめて拒否されるテスト"""
+        tag = sample_tag(user=self.user)
+        other = get_user_model().objects.create_user('other@gmail.com', 'pw')
+        foreign = sample_tag(user=other)
+
+        res = self.client.post(BOOKS_URL, {
+            'title': 'Book', 'price': '5.00',
+            'tags': [tag.id, foreign.id, 999999],
+        }, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn(f'[{foreign.id}, 999999]', res.data['tags'][0])
+        self.assertFalse(Book.objects.exists())
+
+    def test_update_book_with_foreign_tag(self):
+        """他のユーザーのタグで本を更新できないテスト"""
+        book = sample_book(user=self.user)
+        other = get_user_model().objects.create_user('other@gmail.com', 'pw')
+        foreign = sample_tag(user=other)
+
+        res = self.client.patch(detail_url(book.id), {'tags': [foreign.id]},
+                                format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(book.tags.exists())
+
+    def test_create_book_with_invalid_tag_type(self):
+        """IDではないタグがエラーになるテスト"""
+        res = self.client.post(BOOKS_URL, {
+            'title': 'Book', 'price': '5.00', 'tags': ['abc'],
+        }, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('tags', res.data)
+
     def test_partial_update_recipe(self):
         """パッチで本を更新するテスト"""
         book = sample_book(user=self.user)
@@ -173,6 +256,616 @@ class PrivateBOOKApiTests(TestCase):
         tags = book.tags.all()
         self.assertEqual(len(tags), 0)
 
+    def test_filter_books_by_tags(self):
+        """いずれかのタグを持つ本を返すテスト"""
+        book1 = sample_book(user=self.user, title='Python')
+        book2 = sample_book(user=self.user, title='Django')
+        book3 = sample_book(user=self.user, title='Novel')
+        tag1 = sample_tag(user=self.user, name='Programming')
+        tag2 = sample_tag(user=self.user, name='Web')
+        book1.tags.add(tag1)
+        book2.tags.add(tag1, tag2)
+
+        res = self.client.get(BOOKS_URL, {'tags': f'{tag1.id},{tag2.id}'})
+
+        serializer1 = BookSerializer(book1)
+        serializer2 = BookSerializer(book2)
+        serializer3 = BookSerializer(book3)
+        self.assertEqual(len(res.data['results']), 2)
+        self.assertIn(serializer1.data, res.data['results'])
+        self.assertIn(serializer2.data, res.data['results'])
+        self.assertNotIn(serializer3.data, res.data['results'])
+
+    def test_filter_books_by_all_tags(self):
+        """全てのタグを持つ本だけを返すテスト"""
+        book1 = sample_book(user=self.user, title='Python')
+        book2 = sample_book(user=self.user, title='Django')
+        tag1 = sample_tag(user=self.user, name='Programming')
+        tag2 = sample_tag(user=self.user, name='Web')
+        book1.tags.add(tag1)
+        book2.tags.add(tag1, tag2)
+
+        res = self.client.get(
+            BOOKS_URL,
+            {'tags': f'{tag1.id},{tag2.id}', 'tags_match': 'all'}
+        )
+
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'][0]['id'], book2.id)
+
+    def test_filter_books_invalid_tags(self):
+        """不正なタグIDでの絞り込みが失敗するテスト"""
+        res = self.client.get(BOOKS_URL, {'tags': '1,abc'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def search_titles(self, search):
+        """検索に一致した本のタイトルを返す"""
+        res = self.client.get(BOOKS_URL, {'search': search})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return sorted(book['title'] for book in res.data['results'])
+
+    def test_search_books(self):
+        """タイトルとタグの名前で本を検索するテスト"""
+        tag = sample_tag(user=self.user, name='Programming')
+        sample_book(user=self.user, title='Learning Python').tags.add(tag)
+        sample_book(user=self.user, title='Two Scoops of Django')
+        sample_book(user=self.user, title='吾輩は猫である')
+        other = get_user_model().objects.create_user('other@gmail.com', 'pw')
+        sample_book(user=other, title='Python Cookbook')
+
+        self.assertEqual(self.search_titles('python'), ['Learning Python'])
+        self.assertEqual(self.search_titles('python programming'),
+                         ['Learning Python'])
+        self.assertEqual(self.search_titles('program'), ['Learning Python'])
+        self.assertEqual(self.search_titles('scoop'),
+                         ['Two Scoops of Django'])
+        self.assertEqual(self.search_titles('猫'), ['吾輩は猫である'])
+        self.assertEqual(self.search_titles('ruby'), [])
+
+    def test_search_books_similar_spelling(self):
+        """pg_trgm があれば綴りの似たタイトルとタグで検索できるテスト"""
+        if not trigram_available(connection):
+            self.skipTest('pg_trgm is not installed')
+        tag = sample_tag(user=self.user, name='Programming')
+        sample_book(user=self.user, title='Learning Python').tags.add(tag)
+        sample_book(user=self.user, title='Two Scoops of Django')
+
+        self.assertEqual(self.search_titles('Learning Pyhton'),
+                         ['Learning Python'])
+        self.assertEqual(self.search_titles('programing'),
+                         ['Learning Python'])
+
+    def test_search_books_uses_indexes(self):
+        """検索がタイトルと検索用ベクトルのインデックスを使うテスト"""
+        Book.objects.bulk_create(
+            Book(user=self.user, title=f'Book {i}', price=5)
+            for i in range(5000)
+        )
+        sample_book(user=self.user, title='Learning Python')
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE core_book')
+        with CaptureQueriesContext(connection) as ctx:
+            self.search_titles('python')
+        sql = next(query['sql'] for query in ctx.captured_queries
+                   if 'UNION' in query['sql'])
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN {sql}')
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+
+        self.assertIn('core_book_search_idx', plan)
+        if trigram_available(connection):
+            self.assertIn('core_book_title_trgm_idx', plan)
+            self.assertNotIn('Seq Scan on core_book ', plan)
+
+    def test_search_books_invalid(self):
+        """NULを含む検索語や長すぎる検索語が400になるテスト"""
+        for search in ('a\x00b', 'a' * 201):
+            res = self.client.get(BOOKS_URL, {'search': search})
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('search', res.data)
+
+    def test_search_books_follows_tag_changes(self):
+        """タグの追加・変更・削除が検索に反映されるテスト"""
+        book = sample_book(user=self.user, title='Learning Python')
+        tag = sample_tag(user=self.user, name='Beginner')
+        search_vector = Book.objects.values_list('search_vector', flat=True)
+
+        book.tags.add(tag)
+        self.assertIn('beginner', search_vector.get(id=book.id))
+
+        tag.name = 'Advanced'
+        tag.save()
+        self.assertIn('advanced', search_vector.get(id=book.id))
+        self.assertNotIn('beginner', search_vector.get(id=book.id))
+
+        book.tags.remove(tag)
+        self.assertNotIn('advanced', search_vector.get(id=book.id))
+
+    def test_list_books_paginated(self):
+        """本の一覧がカーソルでページ分けされるテスト"""
+        books = [
+            sample_book(user=self.user, title=f'Book {i}') for i in range(5)
+        ]
+
+        res = self.client.get(BOOKS_URL, {'page_size': 3})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [book['id'] for book in res.data['results']],
+            [book.id for book in books[:1:-1]]
+        )
+        self.assertIsNone(res.data['previous'])
+
+        res = self.client.get(res.data['next'])
+
+        self.assertEqual(
+            [book['id'] for book in res.data['results']],
+            [book.id for book in books[1::-1]]
+        )
+        self.assertIsNone(res.data['next'])
+
+    def test_bulk_create_books(self):
+        """本を一括で作成するテスト"""
+        tag = sample_tag(user=self.user)
+        payload = [
+            {'title': 'Book 1', 'price': '1.00', 'tags': [tag.id]},
+            {'title': 'Book 2', 'price': '2.00', 'tags': []},
+        ]
+
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([book['title'] for book in res.data],
+                         ['Book 1', 'Book 2'])
+        books = Book.objects.filter(user=self.user)
+        self.assertEqual(books.count(), 2)
+        self.assertEqual(list(books.get(title='Book 1').tags.all()), [tag])
+
+    def test_bulk_create_resolves_tags_in_one_query(self):
+        """項目の数に関係なく1回のクエリでタグを解決するテスト"""
+        tags = [sample_tag(user=self.user, name=f'Tag {i}') for i in range(3)]
+        other = get_user_model().objects.create_user('other@gmail.com', 'pw')
+        foreign = sample_tag(user=other)
+        payload = [
+            {'title': f'Book {i}', 'price': '1.00',
+             'tags': [tags[i % 3].id]}
+            for i in range(10)
+        ]
+
+        queries, res = self.count_tag_queries(
+            self.client.post, BULK_URL, payload
+        )
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(queries, 1)
+
+        payload[3]['tags'] = [foreign.id]
+        res = self.client.post(BULK_URL, payload, format='json')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data[0], {})
+        self.assertIn(str(foreign.id), res.data[3]['tags'][0])
+
+    def test_bulk_create_invalid_item_rolls_back(self):
+        """不正な項目がある場合は何も作成しないテスト"""
+        payload = [
+            {'title': 'Book 1', 'price': '1.00', 'tags': []},
+            {'title': '', 'price': '2.00', 'tags': []},
+        ]
+
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data[0], {})
+        self.assertIn('title', res.data[1])
+        self.assertFalse(Book.objects.exists())
+
+    def test_bulk_update_books(self):
+        """本を一括で部分更新するテスト"""
+        book1 = sample_book(user=self.user)
+        book2 = sample_book(user=self.user)
+        book2.tags.add(sample_tag(user=self.user))
+        tag = sample_tag(user=self.user, name='New tag')
+        payload = [
+            {'id': book1.id, 'title': 'Updated'},
+            {'id': book2.id, 'tags': [tag.id]},
+        ]
+
+        res = self.client.patch(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        book1.refresh_from_db()
+        self.assertEqual(book1.title, 'Updated')
+        self.assertEqual(list(book2.tags.all()), [tag])
+
+    def test_bulk_create_ignores_list_filters(self):
+        """一覧の絞り込みに合わない本も作成して返すテスト"""
+        tag = sample_tag(user=self.user)
+        payload = [{'title': 'Book 1', 'price': '1.00', 'tags': []}]
+
+        res = self.client.post(
+            f'{BULK_URL}?tags={tag.id}&search=nothing', payload,
+            format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data[0]['title'], 'Book 1')
+        self.assertEqual(Book.objects.count(), 1)
+
+    def test_bulk_update_duplicate_ids(self):
+        """同じIDを繰り返すと項目ごとのエラーを返し、何も更新しないテスト"""
+        book = sample_book(user=self.user)
+        tag = sample_tag(user=self.user)
+        payload = [
+            {'id': book.id, 'tags': [tag.id]},
+            {'id': book.id, 'tags': [tag.id], 'title': 'Updated'},
+        ]
+
+        res = self.client.patch(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data[0], {})
+        self.assertIn('id', res.data[1])
+        book.refresh_from_db()
+        self.assertEqual(book.title, 'Sample book')
+        self.assertFalse(book.tags.exists())
+
+    def test_bulk_update_other_users_book(self):
+        """他のユーザーの本を一括更新できないテスト"""
+        user2 = get_user_model().objects.create_user(
+            'other@example.com',
+            'pass'
+        )
+        book = sample_book(user=user2)
+
+        res = self.client.patch(
+            BULK_URL, [{'id': book.id, 'title': 'Updated'}], format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        book.refresh_from_db()
+        self.assertEqual(book.title, 'Sample book')
+
+    def test_bulk_delete_books(self):
+        """本を一括で削除するテスト"""
+        book1 = sample_book(user=self.user)
+        book2 = sample_book(user=self.user)
+
+        missing = book2.id + 1
+
+        res = self.client.delete(
+            BULK_URL, {'ids': [book1.id, missing]}, format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data,
+                         {'deleted': [book1.id], 'not_found': [missing]})
+        self.assertEqual(list(Book.objects.all()), [book2])
+
+    def test_bulk_delete_invalid_ids(self):
+        """整数でないIDを指定すると何も削除せず400を返すテスト"""
+        book = sample_book(user=self.user)
+
+        for ids in ([{}], [[book.id]], [True], [0]):
+            res = self.client.delete(BULK_URL, {'ids': ids}, format='json')
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('ids', res.data)
+        self.assertEqual(list(Book.objects.all()), [book])
+
+    def test_bulk_update_invalid_ids(self):
+        """整数でないIDの項目ごとにエラーを返し、何も更新しないテスト"""
+        book = sample_book(user=self.user)
+        payload = [
+            {'id': book.id, 'title': 'Updated'},
+            {'id': {}, 'title': 'Updated'},
+            {'id': [book.id], 'title': 'Updated'},
+            {'id': True, 'title': 'Updated'},
+        ]
+
+        res = self.client.patch(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data[0], {})
+        for error in res.data[1:]:
+            self.assertIn('id', error)
+        book.refresh_from_db()
+        self.assertEqual(book.title, 'Sample book')
+
+    def test_list_books_not_modified(self):
+        """本が変更されていなければクエリを実行せずに304を返すテスト"""
+        sample_book(user=self.user)
+        etag = self.client.get(BOOKS_URL)['ETag']
+
+        with self.assertNumQueries(1):
+            res = self.client.get(BOOKS_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res['ETag'], etag)
+
+    def test_list_books_etag_changes_on_write(self):
+        """本を書き込むとETagが変わるテスト"""
+        book = sample_book(user=self.user)
+        etag = self.client.get(BOOKS_URL)['ETag']
+
+        self.client.patch(detail_url(book.id), {'title': 'New title'})
+        res = self.client.get(BOOKS_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+        self.assertEqual(res.data['results'][0]['title'], 'New title')
+
+    def test_list_books_etag_depends_on_query(self):
+        """クエリパラメータごとにETagが異なるテスト"""
+        etag1 = self.client.get(BOOKS_URL)['ETag']
+        etag2 = self.client.get(BOOKS_URL, {'page_size': 1})['ETag']
+
+        self.assertNotEqual(etag1, etag2)
+
+    def test_list_books_cached(self):
+        """シリアライズ済みの一覧がキャッシュから返されるテスト"""
+        sample_book(user=self.user).tags.add(sample_tag(user=self.user))
+        expected = self.client.get(BOOKS_URL).data
+
+        with self.assertNumQueries(1):
+            res = self.client.get(BOOKS_URL)
+
+        self.assertEqual(res.data, expected)
+
+    def test_list_books_cache_invalidated_on_write(self):
+        """書き込み後の一覧がキャッシュから返されないテスト"""
+        self.client.get(BOOKS_URL)
+
+        self.client.post(BOOKS_URL, {'title': 'New book', 'price': 1.00})
+        res = self.client.get(BOOKS_URL)
+
+        self.assertEqual(res.data['results'][0]['title'], 'New book')
+
+    @override_settings(BOOK_RESPONSE_CACHE={
+        'BACKEND': None,
+        'MAX_SIZE': 0,
+        'TIMEOUT': 0,
+    })
+    def test_fast_list_serialization_identical(self):
+        """高速な一覧の経路がModelSerializerと同じJSONを返すテスト"""
+        tag1 = sample_tag(user=self.user, name='Tag 1')
+        tag2 = sample_tag(user=self.user, name='Tag 2')
+        sample_book(user=self.user, title='No tags', price='0.50')
+        sample_book(user=self.user, title='本', link='http://example.com') \
+            .tags.add(tag2, tag1)
+        sample_book(user=self.user, price='999.99').tags.add(tag1)
+
+        with override_settings(FAST_LIST_SERIALIZATION=True):
+            fast = self.client.get(BOOKS_URL, {'page_size': 2})
+            fast_next = self.client.get(fast.data['next'])
+        with override_settings(FAST_LIST_SERIALIZATION=False):
+            slow = self.client.get(BOOKS_URL, {'page_size': 2})
+            slow_next = self.client.get(slow.data['next'])
+
+        self.assertEqual(fast.content, slow.content)
+        self.assertEqual(fast_next.content, slow_next.content)
+
+    def test_row_serializer_without_aggregated_tags(self):
+        """集約したタグがない行にタグのIDをまとめて付けるテスト"""
+        tag1 = sample_tag(user=self.user, name='Tag 1')
+        tag2 = sample_tag(user=self.user, name='Tag 2')
+        sample_book(user=self.user).tags.add(tag2, tag1)
+        sample_book(user=self.user)
+        rows = Book.objects.order_by('id').values(*BookRowSerializer.columns)
+
+        with self.assertNumQueries(2):
+            data = BookRowSerializer(rows, many=True).data
+
+        self.assertEqual([row['tags'] for row in data],
+                         [[tag1.id, tag2.id], []])
+
+    @override_settings(BOOK_RESPONSE_CACHE={
+        'BACKEND': None,
+        'MAX_SIZE': 0,
+        'TIMEOUT': 0,
+    })
+    def test_list_books_query_count_constant(self):
+        """本の数に関係なく一覧のクエリ数が一定であるテスト"""
+        tag1 = sample_tag(user=self.user, name='Tag 1')
+        tag2 = sample_tag(user=self.user, name='Tag 2')
+        sample_book(user=self.user).tags.add(tag1, tag2)
+        expected = count_queries(self.client, BOOKS_URL)
+
+        for i in range(10):
+            sample_book(user=self.user, title=f'Book {i}').tags.add(tag1, tag2)
+
+        self.assertEqual(count_queries(self.client, BOOKS_URL), expected)
+
+    def test_retrieve_book_query_count_constant(self):
+        """タグの数に関係なく詳細のクエリ数が一定であるテスト"""
+        book = sample_book(user=self.user)
+        book.tags.add(sample_tag(user=self.user))
+        expected = count_queries(self.client, detail_url(book.id))
+
+        for i in range(10):
+            book.tags.add(sample_tag(user=self.user, name=f'Tag {i}'))
+
+        self.assertEqual(
+            count_queries(self.client, detail_url(book.id)),
+            expected
+        )
+
+    def test_library_stats(self):
+        """本の数と価格の集計がタグごとに返されるテスト"""
+        tag1 = sample_tag(user=self.user, name='Fiction')
+        tag2 = sample_tag(user=self.user, name='Novel')
+        sample_tag(user=self.user, name='Unused')
+        book1 = sample_book(user=self.user, price=10.00)
+        book1.tags.add(tag1, tag2)
+        book2 = sample_book(user=self.user, price=5.00)
+        book2.tags.add(tag1)
+        sample_book(user=self.user, price=3.00)
+        other = get_user_model().objects.create_user('other@gmail.com', 'pw')
+        sample_book(user=other, price=100.00)
+
+        res = self.client.get(STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, {
+            'books': 3,
+            'total_price': '18.00',
+            'average_price': '6.00',
+            'tags': [
+                {'id': tag1.id, 'name': 'Fiction', 'books': 2,
+                 'total_price': '15.00', 'average_price': '7.50'},
+                {'id': tag2.id, 'name': 'Novel', 'books': 1,
+                 'total_price': '10.00', 'average_price': '10.00'},
+            ],
+        })
+
+    def test_library_stats_empty(self):
+        """本がない場合の集計のテスト"""
+        res = self.client.get(STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, {
+            'books': 0,
+            'total_price': '0.00',
+            'average_price': None,
+            'tags': [],
+        })
+
+    def test_library_stats_follow_changes(self):
+        """更新・削除・一括操作の後も集計がデータベースと一致するテスト"""
+        tag1 = sample_tag(user=self.user, name='Tag 1')
+        tag2 = sample_tag(user=self.user, name='Tag 2')
+        res = self.client.post(BULK_URL, [
+            {'title': f'Book {i}', 'price': f'{i}.50', 'tags': [tag1.id]}
+            for i in range(5)
+        ], format='json')
+        book_ids = [book['id'] for book in res.data]
+        self.client.patch(detail_url(book_ids[0]),
+                          {'price': '20.00', 'tags': [tag2.id]})
+        self.client.delete(detail_url(book_ids[1]))
+        self.client.patch(BULK_URL, [{'id': book_ids[2], 'price': '9.99'}],
+                          format='json')
+        tag2.delete()
+
+        res = self.client.get(STATS_URL)
+
+        books = Book.objects.filter(user=self.user)
+        self.assertEqual(res.data['books'], books.count())
+        self.assertEqual(res.data['total_price'],
+                         str(sum(book.price for book in books)))
+        tagged = books.filter(tags=tag1)
+        self.assertEqual(res.data['tags'], [{
+            'id': tag1.id,
+            'name': 'Tag 1',
+            'books': tagged.count(),
+            'total_price': str(sum(book.price for book in tagged)),
+            'average_price': f'{sum(b.price for b in tagged) / 3:.2f}',
+        }])
+
+    def test_library_stats_rows_removed_with_owner(self):
+        """タグやユーザーの削除で集計の行も削除されるテスト"""
+        tag = sample_tag(user=self.user)
+        sample_book(user=self.user).tags.add(tag)
+
+        tag.delete()
+        self.user.delete()
+
+        with connection.cursor() as cursor:
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        self.assertFalse(LibrarySummary.objects.exists())
+        self.assertFalse(TagSummary.objects.exists())
+
+    def test_library_stats_query_count_constant(self):
+        """本の数に関係なく集計のクエリ数が一定であるテスト"""
+        tag = sample_tag(user=self.user)
+        sample_book(user=self.user).tags.add(tag)
+        expected = count_queries(self.client, STATS_URL)
+
+        for i in range(10):
+            sample_book(user=self.user, title=f'Book {i}').tags.add(tag)
+
+        self.assertEqual(count_queries(self.client, STATS_URL), expected)
+
+    def test_export_books_ndjson(self):
+        """本がタグと共にNDJSONで書き出されるテスト"""
+        tag1 = sample_tag(user=self.user, name='Tag 1')
+        tag2 = sample_tag(user=self.user, name='Tag 2')
+        book1 = sample_book(user=self.user, title='Book 1')
+        book1.tags.add(tag2, tag1)
+        book2 = sample_book(user=self.user, title='Book 2', price=12.5)
+        other = get_user_model().objects.create_user('other@gmail.com', 'pw')
+        sample_book(user=other, title='Other book')
+
+        res = self.client.get(EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res.streaming)
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(res.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], [
+            {'id': book1.id, 'title': 'Book 1', 'price': '5.00',
+             'link': '', 'tags': [{'id': tag1.id, 'name': 'Tag 1'},
+                                  {'id': tag2.id, 'name': 'Tag 2'}]},
+            {'id': book2.id, 'title': 'Book 2', 'price': '12.50',
+             'link': '', 'tags': []},
+        ])
+
+    def test_export_books_csv(self):
+        """本がCSVで書き出され、タグの名前が区切られるテスト"""
+        book = sample_book(user=self.user, title='Book, "quoted"')
+        book.tags.add(sample_tag(user=self.user, name='Tag 1'),
+                      sample_tag(user=self.user, name='Tag 2'))
+
+        res = self.client.get(EXPORT_URL, {'format': 'csv'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('books.csv', res['Content-Disposition'])
+        content = b''.join(res.streaming_content).decode()
+        self.assertEqual(list(csv.reader(content.splitlines())), [
+            ['id', 'title', 'price', 'link', 'tags'],
+            [str(book.id), 'Book, "quoted"', '5.00', '', 'Tag 1|Tag 2'],
+        ])
+
+    def test_export_books_filtered_by_tags(self):
+        """書き出しにタグの絞り込みが適用されるテスト"""
+        tag = sample_tag(user=self.user)
+        book = sample_book(user=self.user, title='Tagged')
+        book.tags.add(tag)
+        sample_book(user=self.user, title='Untagged')
+
+        res = self.client.get(EXPORT_URL, {'tags': f'{tag.id}'})
+
+        lines = b''.join(res.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in lines],
+                         [book.id])
+
+    def test_export_books_in_chunks(self):
+        """チャンクの境界をまたいでも全ての本とタグが書き出されるテスト"""
+        tag = sample_tag(user=self.user)
+        books = [sample_book(user=self.user, title=f'Book {i}')
+                 for i in range(5)]
+        for book in books:
+            book.tags.add(tag)
+
+        with patch('book.views.BookViewSet.export_chunk_size', 2):
+            res = self.client.get(EXPORT_URL)
+
+        lines = b''.join(res.streaming_content).decode().splitlines()
+        exported = [json.loads(line) for line in lines]
+        self.assertEqual([book['id'] for book in exported],
+                         [book.id for book in books])
+        self.assertTrue(all(book['tags'] == [{'id': tag.id,
+                                              'name': tag.name}]
+                            for book in exported))
+
+    def test_export_books_unsupported_format(self):
+        """対応していない形式を指定するとエラーになるテスト"""
+        res = self.client.get(EXPORT_URL, {'format': 'xml'})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
 
 class BookImageUploadTests(TestCase):
 
@@ -183,21 +876,153 @@ class BookImageUploadTests(TestCase):
         self.book = sample_book(user=self.user)
 
     def tearDown(self):
+        self.book.refresh_from_db()
         self.book.image.delete()
+        self.book.image_thumbnail.delete()
+        self.book.image_medium.delete()
+
+    def upload_image(self, size=(10, 10)):
+        """Bookに画像をアップロードしてレスポンスを返す"""
+        url = image_upload_url(self.book.id)
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            img = Image.new('RGB', size)
+            img.save(ntf, format='JPEG')
+            ntf.seek(0)
+            return self.client.post(url, {'image': ntf}, format='multipart')
 
     def test_upload_image_to_book(self):
         """Bookへの画像のアップロードのテスト"""
+        res = self.upload_image()
+
+        self.book.refresh_from_db()
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertIn('image', res.data)
+        self.assertEqual(res.data['image_status'], Book.IMAGE_PENDING)
+        self.assertTrue(os.path.exists(self.book.image.path))
+
+    @override_settings(BOOK_IMAGE_PROCESSING={'WORKERS': 1, 'EAGER': True})
+    def test_uploaded_images_readable_by_web_server(self):
+        """保存した画像と縮小画像をウェブサーバーが読めるテスト"""
+        self.upload_image(size=(1200, 800))
+
+        self.book.refresh_from_db()
+        for image in (self.book.image, self.book.image_thumbnail,
+                      self.book.image_medium):
+            self.assertEqual(os.stat(image.path).st_mode & 0o777, 0o644)
+
+    @override_settings(BOOK_IMAGE_PROCESSING={'WORKERS': 1, 'EAGER': True})
+    def test_upload_image_generates_variants(self):
+        """アップロードした画像から縮小画像が生成されるテスト"""
+        self.upload_image(size=(1200, 800))
+
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.image_status, Book.IMAGE_READY)
+        with Image.open(self.book.image_thumbnail.path) as thumbnail:
+            self.assertEqual(thumbnail.size, (150, 100))
+        with Image.open(self.book.image_medium.path) as medium:
+            self.assertEqual(medium.size, (600, 400))
+
+    def test_process_broken_image_fails(self):
+        """壊れた画像の処理が失敗として記録されるテスト"""
+        self.upload_image()
+        self.book.refresh_from_db()
+        with open(self.book.image.path, 'wb') as f:
+            f.write(b'broken')
+
+        process_book_image(self.book.id)
+
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.image_status, Book.IMAGE_FAILED)
+        self.assertFalse(self.book.image_thumbnail)
+
+    def stored_images(self):
+        """保存されている本の画像のファイル名の集合を返す"""
+        root = os.path.join(settings.MEDIA_ROOT, 'uploads', 'book')
+        return {os.path.join(directory, name)
+                for directory, _, names in os.walk(root) for name in names}
+
+    def test_process_failure_releases_variants(self):
+        """途中で失敗すると作成済みの縮小画像を削除するテスト"""
+        self.upload_image(size=(1200, 800))
+        before = self.stored_images()
+
+        with patch('book.images.render_variant',
+                   side_effect=[render_variant(Image.new('RGB', (5, 5)),
+                                               (150, 150)),
+                                ValueError('broken')]):
+            process_book_image(self.book.id)
+
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.image_status, Book.IMAGE_FAILED)
+        self.assertEqual(self.stored_images(), before)
+
+    def test_process_replaced_image_releases_variants(self):
+        """処理中に画像が差し替えられると縮小画像を削除するテスト"""
+        self.upload_image(size=(1200, 800))
+        self.book.refresh_from_db()
+        before = self.stored_images()
+
+        def replace(image, size):
+            Book.objects.filter(id=self.book.id).update(image='replaced.jpg')
+            return render_variant(image, size)
+
+        with patch('book.images.render_variant', side_effect=replace):
+            process_book_image(self.book.id)
+
+        self.assertEqual(self.stored_images(), before)
+        Book.objects.filter(id=self.book.id).update(image=self.book.image)
+
+    def test_upload_image_streamed_to_media_root(self):
+        """アップロードした画像が一時ファイルを残さずに保存されるテスト"""
+        staging = os.path.join(settings.MEDIA_ROOT, 'uploads', 'tmp')
+        self.upload_image()
+
+        self.book.refresh_from_db()
+        self.assertTrue(os.path.exists(self.book.image.path))
+        self.assertFalse(
+            [name for name in os.listdir(staging) if name.endswith('.jpg')]
+        )
+
+    @override_settings(BOOK_IMAGE_UPLOAD={
+        'MAX_BYTES': 1024,
+        'MAX_PIXELS': 10000,
+        'FORMATS': ('JPEG',),
+    })
+    def test_upload_image_too_large(self):
+        """上限を超えるサイズの画像が拒否されるテスト"""
         url = image_upload_url(self.book.id)
         with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
-            img = Image.new('RGB', (10, 10))
-            img.save(ntf, format='JPEG')
+            ntf.write(b'\0' * 2048)
             ntf.seek(0)
             res = self.client.post(url, {'image': ntf}, format='multipart')
 
         self.book.refresh_from_db()
-        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertIn('image', res.data)
-        self.assertTrue(os.path.exists(self.book.image.path))
+        self.assertFalse(self.book.image)
+
+    @override_settings(BOOK_IMAGE_UPLOAD={
+        'MAX_BYTES': 1024 * 1024,
+        'MAX_PIXELS': 10000,
+        'FORMATS': ('JPEG',),
+    })
+    def test_upload_image_too_many_pixels(self):
+        """上限を超えるピクセル数の画像が拒否されるテスト"""
+        res = self.upload_image(size=(101, 100))
+
+        self.book.refresh_from_db()
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(self.book.image)
+
+    def test_upload_image_not_an_image(self):
+        """画像ではないファイルが拒否されるテスト"""
+        url = image_upload_url(self.book.id)
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            ntf.write(b'not an image')
+            ntf.seek(0)
+            res = self.client.post(url, {'image': ntf}, format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
 
     def test_upload_image_bad_request(self):
         """無効なイメージがアップロードされた時のテスト"""
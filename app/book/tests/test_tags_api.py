@@ -1,13 +1,14 @@
 from django.contrib.auth import get_user_model
 from django.urls import reverse
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from core.models import Tag
+from core.models import Book, Tag
 
 from book.serializers import TagSerializer
+from book.tests.test_book_api import BOOKS_URL, count_queries
 
 
 TAGS_URL = reverse('book:tag-list')
@@ -47,7 +48,7 @@ class PrivateTagsApiTests(TestCase):
         tags = Tag.objects.all().order_by('-name')
         serializer = TagSerializer(tags, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_tags_limited_to_user(self):
         """返されたタグが認証されたユーザーのものであることを確認するテスト"""
@@ -61,8 +62,21 @@ class PrivateTagsApiTests(TestCase):
         res = self.client.get(TAGS_URL)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data[0]['name'], tag.name)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'][0]['name'], tag.name)
+
+    def test_tags_paginated_by_name(self):
+        """タグの一覧が名前の降順でページ分けされるテスト"""
+        for name in ('a', 'b', 'b', 'c'):
+            Tag.objects.create(user=self.user, name=name)
+
+        res = self.client.get(TAGS_URL, {'page_size': 2})
+        names = [tag['name'] for tag in res.data['results']]
+        res = self.client.get(res.data['next'])
+        names += [tag['name'] for tag in res.data['results']]
+
+        self.assertEqual(names, ['c', 'b', 'b', 'a'])
+        self.assertIsNone(res.data['next'])
 
     def test_create_tag_successful(self):
         """Test creating a new tag"""
@@ -82,3 +96,133 @@ class PrivateTagsApiTests(TestCase):
         res = self.client.post(TAGS_URL, payload)
 
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_tags_not_modified_until_tag_created(self):
+        """タグを作成するまで304を返すテスト"""
+        etag = self.client.get(TAGS_URL)['ETag']
+
+        res = self.client.get(TAGS_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.client.post(TAGS_URL, {'name': 'New tag'})
+        res = self.client.get(TAGS_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    @override_settings(BOOK_RESPONSE_CACHE={
+        'BACKEND': None,
+        'MAX_SIZE': 0,
+        'TIMEOUT': 0,
+    })
+    def test_fast_list_serialization_identical(self):
+        """高速な一覧の経路がModelSerializerと同じJSONを返すテスト"""
+        for name in ('本', 'b', 'a'):
+            Tag.objects.create(user=self.user, name=name)
+
+        with override_settings(FAST_LIST_SERIALIZATION=True):
+            fast = self.client.get(TAGS_URL)
+        with override_settings(FAST_LIST_SERIALIZATION=False):
+            slow = self.client.get(TAGS_URL)
+
+        self.assertEqual(fast.content, slow.content)
+
+    def tag_book(self, *tags):
+        """タグを付けた本を作成する"""
+        book = Book.objects.create(user=self.user, title='Book', price=5)
+        book.tags.add(*tags)
+
+        return book
+
+    def test_tags_with_counts(self):
+        """タグごとに本の数を返すテスト"""
+        tag1 = Tag.objects.create(user=self.user, name='a')
+        tag2 = Tag.objects.create(user=self.user, name='b')
+        Tag.objects.create(user=self.user, name='c')
+        self.tag_book(tag1, tag2)
+        self.tag_book(tag1)
+
+        res = self.client.get(TAGS_URL, {'with_counts': 1})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(tag['name'], tag['books']) for tag in res.data['results']],
+            [('c', 0), ('b', 1), ('a', 2)]
+        )
+
+    def test_tags_assigned_only(self):
+        """本に付いているタグだけを返すテスト"""
+        tag1 = Tag.objects.create(user=self.user, name='a')
+        tag2 = Tag.objects.create(user=self.user, name='b')
+        Tag.objects.create(user=self.user, name='c')
+        self.tag_book(tag1)
+        self.tag_book(tag2).delete()
+
+        res = self.client.get(TAGS_URL, {'assigned_only': 1})
+
+        self.assertEqual(res.data['results'], [{'id': tag1.id, 'name': 'a'}])
+
+    def test_tags_invalid_flag(self):
+        """0/1以外のフラグがエラーになるテスト"""
+        res = self.client.get(TAGS_URL, {'assigned_only': 'yes'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_tags_with_counts_modified_by_books(self):
+        """本を作成すると本の数を含む一覧のETagが変わるテスト"""
+        tag = Tag.objects.create(user=self.user, name='a')
+        etag = self.client.get(TAGS_URL, {'with_counts': 1})['ETag']
+
+        self.client.post(BOOKS_URL, {
+            'title': 'Book', 'price': '5.00', 'tags': [tag.id],
+        })
+        res = self.client.get(TAGS_URL, {'with_counts': 1},
+                              HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'][0]['books'], 1)
+
+    def test_tags_with_counts_versions_read_once(self):
+        """本の数を含む一覧の304とキャッシュの応答がバージョンを1回だけ読むテスト"""
+        self.tag_book(Tag.objects.create(user=self.user, name='a'))
+        params = {'with_counts': 1}
+        etag = self.client.get(TAGS_URL, params)['ETag']
+
+        with self.assertNumQueries(1):
+            res = self.client.get(TAGS_URL, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        with self.assertNumQueries(1):
+            res = self.client.get(TAGS_URL, params)
+        self.assertEqual(res.data['results'][0]['books'], 1)
+
+    @override_settings(BOOK_RESPONSE_CACHE={
+        'BACKEND': None,
+        'MAX_SIZE': 0,
+        'TIMEOUT': 0,
+    })
+    def test_tags_with_counts_query_count_constant(self):
+        """タグの数に関係なく本の数を含む一覧のクエリ数が一定であるテスト"""
+        url = f'{TAGS_URL}?with_counts=1&assigned_only=1'
+        self.tag_book(Tag.objects.create(user=self.user, name='tag'))
+        expected = count_queries(self.client, url)
+
+        for i in range(10):
+            self.tag_book(Tag.objects.create(user=self.user, name=f'{i}'))
+
+        self.assertEqual(count_queries(self.client, url), expected)
+
+    @override_settings(BOOK_RESPONSE_CACHE={
+        'BACKEND': None,
+        'MAX_SIZE': 0,
+        'TIMEOUT': 0,
+    })
+    def test_fast_list_with_counts_identical(self):
+        """本の数を含む高速な一覧がModelSerializerと同じJSONを返すテスト"""
+        self.tag_book(Tag.objects.create(user=self.user, name='本'))
+        Tag.objects.create(user=self.user, name='a')
+
+        with override_settings(FAST_LIST_SERIALIZATION=True):
+            fast = self.client.get(TAGS_URL, {'with_counts': 1})
+        with override_settings(FAST_LIST_SERIALIZATION=False):
+            slow = self.client.get(TAGS_URL, {'with_counts': 1})
+
+        self.assertEqual(fast.content, slow.content)
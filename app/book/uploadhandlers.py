@@ -0,0 +1,119 @@
+import io
+import os
+import tempfile
+
+from PIL import Image
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from django.utils.translation import ugettext_lazy as _
+
+from rest_framework.exceptions import ValidationError
+
+
+# ヘッダーを解析するために先頭から保持する最大バイト数
+HEADER_MAX_BYTES = 256 * 1024
+# マルチパートの境界や他のフィールドのために許容するバイト数
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class StagedImageFile(TemporaryUploadedFile):
+    """メディアストレージと同じディスク上に書き込まれるアップロードファイル
+
+    保存時にコピーではなくリネームで最終的な場所へ移動できる
+    """
+
+    def __init__(self, name, content_type, charset, content_type_extra,
+                 directory):
+        _, ext = os.path.splitext(name)
+        file = tempfile.NamedTemporaryFile(
+            suffix='.upload' + ext,
+            dir=directory
+        )
+        super(TemporaryUploadedFile, self).__init__(
+            file, name, content_type, 0, charset, content_type_extra
+        )
+        self.image_format = None
+        self.image_size = None
+
+
+class BookImageUploadHandler(FileUploadHandler):
+    """本の画像をストリーミングで受け取るアップロードハンドラー
+
+    チャンクをメモリに溜めずにそのまま書き込み、サイズの上限と
+    画像のヘッダーから読み取ったピクセル数を受信中に検証する。
+    画像全体はデコードしない
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        config = settings.BOOK_IMAGE_UPLOAD
+        self.max_bytes = config['MAX_BYTES']
+        self.max_pixels = config['MAX_PIXELS']
+        self.formats = config['FORMATS']
+        self.file = None
+
+    def _reject(self, message):
+        """受信中のファイルを破棄してアップロードを拒否する"""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        raise ValidationError({'image': [message]})
+
+    def handle_raw_input(self, input_data, META, content_length, boundary,
+                         encoding=None):
+        if content_length > self.max_bytes + MULTIPART_OVERHEAD:
+            self._reject(_('Image file is too large'))
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        directory = os.path.join(settings.MEDIA_ROOT, 'uploads', 'tmp')
+        os.makedirs(directory, exist_ok=True)
+        self.file = StagedImageFile(
+            self.file_name,
+            self.content_type,
+            self.charset,
+            self.content_type_extra,
+            directory
+        )
+        self.header = io.BytesIO()
+
+    def _parse_header(self, raw_data):
+        """先頭のバイト列から画像の形式とサイズを読み取る"""
+        self.header.write(raw_data[:HEADER_MAX_BYTES - self.header.tell()])
+        try:
+            # Image.open はヘッダーだけを読み、画素はデコードしない
+            image = Image.open(io.BytesIO(self.header.getvalue()))
+        except Image.DecompressionBombError:
+            self._reject(_('Image has too many pixels'))
+        except (IOError, SyntaxError, ValueError):
+            if self.header.tell() >= HEADER_MAX_BYTES:
+                self._reject(_('Upload a valid image'))
+            return
+
+        width, height = image.size
+        if image.format not in self.formats:
+            self._reject(_('Unsupported image format'))
+        if width * height > self.max_pixels:
+            self._reject(_('Image has too many pixels'))
+
+        self.file.image_format = image.format
+        self.file.image_size = image.size
+        self.header = None
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > self.max_bytes:
+            self._reject(_('Image file is too large'))
+        if self.header is not None:
+            self._parse_header(raw_data)
+
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        if self.file.image_format is None:
+            self._reject(_('Upload a valid image'))
+
+        self.file.seek(0)
+        self.file.size = file_size
+        return self.file
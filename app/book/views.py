@@ -1,39 +1,144 @@
+from django.conf import settings
+from django.db import connection, transaction
+from django.contrib.postgres.search import SearchQuery
+from django.db.models import Count, Prefetch, Q
+from django.db.models.functions import Coalesce
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.translation import ugettext_lazy as _
+
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.fields import empty
 from rest_framework.response import Response
 from rest_framework import viewsets, mixins, status
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 
-from core.models import Tag, Book
+from core.authentication import CachedTokenAuthentication
+from core.lookups import trigram_available
+from core.models import Tag, Book, LibrarySummary, LibraryVersion, \
+                        TagSummary
+from core.storage import release_images
 
 from book import serializers
+from book.exports import CSVRenderer, NDJSONRenderer, iter_books
+from book.images import schedule_book_image
+from book.mixins import CachedListMixin, ConditionalListMixin
+from book.pagination import BookCursorPagination, TagCursorPagination
+from book.uploadhandlers import BookImageUploadHandler
 
 
-class TagViewSet(viewsets.GenericViewSet,
+class TagViewSet(ConditionalListMixin,
+                 CachedListMixin,
+                 viewsets.GenericViewSet,
                  mixins.ListModelMixin,
                  mixins.CreateModelMixin,
                  ):
     """Manage tags in the database"""
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     queryset = Tag.objects.all()
     serializer_class = serializers.TagSerializer
+    pagination_class = TagCursorPagination
+    version_collection = 'tags'
+
+    def _param_to_bool(self, name):
+        """0/1のクエリパラメーターを真偽値に変換する"""
+        value = self.request.query_params.get(name, '0')
+        if value not in ('0', '1'):
+            raise ValidationError({name: _('Must be either 0 or 1')})
+
+        return value == '1'
+
+    def _with_counts(self):
+        """本の数を含めて一覧を返すかどうか"""
+        return self.action == 'list' and self._param_to_bool('with_counts')
+
+    def get_collection_version(self):
+        """本の数を使う一覧では本のバージョンもETagとキャッシュに含める"""
+        if hasattr(self, '_collection_version'):
+            return self._collection_version
+        if not (self.action == 'list' and (
+            self._with_counts() or self._param_to_bool('assigned_only')
+        )):
+            return super().get_collection_version()
+
+        tags, books = LibraryVersion.objects.get_versions(
+            self.request.user,
+            'tags',
+            'books'
+        )
+        self._collection_version = f'{tags}.{books}'
+
+        return self._collection_version
 
     def get_queryset(self):
-        """現在認証されているユーザーのオブジェクトを返す"""
-        return self.queryset.filter(user=self.request.user).order_by('-name')
+        """現在認証されているユーザーのオブジェクトを返す
+
+        本の数はトリガーが更新する TagSummary から読むため、
+        タグごとのクエリや本の集計は行わない
+        """
+        queryset = self.queryset.filter(user=self.request.user)
+        if self.action == 'list':
+            if self._param_to_bool('assigned_only'):
+                queryset = queryset.filter(summary__books__gt=0)
+            if self._with_counts():
+                queryset = queryset.annotate(
+                    books=Coalesce('summary__books', 0)
+                )
+            if settings.FAST_LIST_SERIALIZATION:
+                queryset = self.get_serializer_class().rows(queryset)
+
+        return queryset.order_by('-name')
+
+    def get_serializer_class(self):
+        """適切なシリアライザークラスを返す"""
+        if self.action == 'list' and settings.FAST_LIST_SERIALIZATION:
+            if self._with_counts():
+                return serializers.TagUsageRowSerializer
+            return serializers.TagRowSerializer
+        elif self._with_counts():
+            return serializers.TagUsageSerializer
+
+        return self.serializer_class
+
+    def perform_create(self, serializer):
+        """新しいタグを作成する"""
+        serializer.save(user=self.request.user)
+        self.bump_collection_version()
 
 
-class BookViewSet(viewsets.ModelViewSet):
+class BookViewSet(ConditionalListMixin,
+                  CachedListMixin,
+                  viewsets.ModelViewSet):
     """データベース内の本を管理する"""
     serializer_class = serializers.BookSerializer
     queryset = Book.objects.all()
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    pagination_class = BookCursorPagination
+    version_collection = 'books'
+    # アクションごとに事前読み込みするリレーション
+    # 更新系はDRFとtags.set()が事前読み込みを破棄するため含めない
+    # タグは高速な一覧の経路と同じくIDの順に並べる
+    prefetch_related_by_action = {
+        'list': (Prefetch('tags', queryset=Tag.objects.order_by('id')),),
+        'retrieve': (Prefetch('tags', queryset=Tag.objects.order_by('id')),),
+    }
+    # 一括操作で一度に受け付ける本の最大数
+    bulk_max_items = 10000
+    # 書き出しでデータベースから一度に読み込む本の数
+    export_chunk_size = 2000
+    # 検索語の最大の長さ
+    search_max_length = 200
 
     @action(methods=['POST'], detail=True, url_path='upload-image')
     def upload_image(self, request, pk=None):
-        """Bookに画像をアップロードする"""
+        """Bookに画像をアップロードする
+
+        元の画像だけを保存し、縮小画像はワーカーで非同期に生成する
+        """
+        request.upload_handlers = [BookImageUploadHandler(request)]
         book = self.get_object()
         serializer = self.get_serializer(
             book,
@@ -41,10 +146,23 @@ class BookViewSet(viewsets.ModelViewSet):
         )
 
         if serializer.is_valid():
-            serializer.save()
+            replaced = [
+                book.image.name,
+                book.image_thumbnail.name,
+                book.image_medium.name,
+            ]
+            book = serializer.save(
+                image_status=Book.IMAGE_PENDING,
+                image_status_updated=timezone.now(),
+                image_thumbnail=None,
+                image_medium=None
+            )
+            self.bump_collection_version()
+            schedule_book_image(book)
+            transaction.on_commit(lambda: release_images(replaced))
             return Response(
                 serializer.data,
-                status=status.HTTP_200_OK
+                status=status.HTTP_202_ACCEPTED
             )
 
         return Response(
@@ -52,22 +170,265 @@ class BookViewSet(viewsets.ModelViewSet):
             status=status.HTTP_400_BAD_REQUEST
         )
 
+    @action(methods=['POST', 'PATCH', 'DELETE'], detail=False)
+    def bulk(self, request):
+        """本を一括で作成・更新・削除する
+
+        全ての項目を検証してから1つのトランザクションで書き込む。
+        1件でも不正な項目があれば何も書き込まず、項目ごとのエラーを返す
+        """
+        items = request.data
+        if request.method == 'DELETE':
+            items = request.data.get('ids') \
+                if isinstance(request.data, dict) else None
+
+        if not isinstance(items, list):
+            raise ValidationError(_('Expected a list of items'))
+        if len(items) > self.bulk_max_items:
+            raise ValidationError(
+                _('Cannot process more than %d items at once')
+                % self.bulk_max_items
+            )
+
+        if request.method == 'POST':
+            return self._bulk_create(items)
+        elif request.method == 'PATCH':
+            return self._bulk_update(items)
+
+        return self._bulk_destroy(items)
+
+    def _user_books(self):
+        """一覧の絞り込みを適用しないユーザーの本を返す"""
+        return self.queryset.filter(user=self.request.user)
+
+    def _bulk_response(self, books, status_code):
+        """一括操作した本を入力と同じ順序で返す"""
+        ids = [book.id for book in books]
+        queryset = self._user_books().filter(id__in=ids) \
+            .prefetch_related('tags')
+        books = {book.id: book for book in queryset}
+        serializer = self.get_serializer(
+            [books[book_id] for book_id in ids],
+            many=True
+        )
+
+        return Response(serializer.data, status=status_code)
+
+    def _bulk_create(self, items):
+        """本を一括で作成する"""
+        serializer = self.get_serializer(data=items, many=True)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            books = serializer.save(user=self.request.user)
+            self.bump_collection_version()
+            return self._bulk_response(books, status.HTTP_201_CREATED)
+
+    def _bulk_update(self, items):
+        """IDで指定された本を一括で部分更新する"""
+        id_field = serializers.BookIdField()
+        ids, errors = [], []
+        for item in items:
+            try:
+                ids.append(id_field.run_validation(
+                    item.get('id', empty) if isinstance(item, dict)
+                    else empty
+                ))
+                errors.append({})
+            except ValidationError as exc:
+                ids.append(None)
+                errors.append({'id': exc.detail})
+
+        books = self._user_books().in_bulk(
+            [book_id for book_id in ids if book_id is not None]
+        )
+        seen = set()
+        for index, book_id in enumerate(ids):
+            if book_id is None:
+                continue
+            if book_id not in books:
+                errors[index] = {'id': [_('Not found.')]}
+            elif book_id in seen:
+                errors[index] = {'id': [_('Duplicate id.')]}
+            else:
+                seen.add(book_id)
+        if any(errors):
+            raise ValidationError(errors)
+
+        serializer = self.get_serializer(
+            [books[book_id] for book_id in ids],
+            data=items,
+            many=True,
+            partial=True
+        )
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            books = serializer.save()
+            self.bump_collection_version()
+            return self._bulk_response(books, status.HTTP_200_OK)
+
+    def _bulk_destroy(self, ids):
+        """IDで指定された本を一括で削除する"""
+        serializer = serializers.BookBulkDestroySerializer(data={'ids': ids})
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        queryset = self._user_books().filter(id__in=ids)
+        with transaction.atomic():
+            deleted = set(queryset.values_list('id', flat=True))
+            queryset.delete()
+            if deleted:
+                self.bump_collection_version()
+
+        return Response({
+            'deleted': [book_id for book_id in ids if book_id in deleted],
+            'not_found': [book_id for book_id in ids
+                          if book_id not in deleted],
+        })
+
+    @action(methods=['GET'], detail=False,
+            renderer_classes=(NDJSONRenderer, CSVRenderer))
+    def export(self, request):
+        """ユーザーの全ての本をNDJSONまたはCSVでストリーミングする
+
+        ?format=csv またはAcceptヘッダーで形式を選ぶ
+        """
+        renderer = request.accepted_renderer
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type += f'; charset={renderer.charset}'
+        books = iter_books(
+            self.get_queryset().order_by('id'),
+            chunk_size=self.export_chunk_size
+        )
+        response = StreamingHttpResponse(
+            renderer.stream(books),
+            content_type=content_type
+        )
+        response['Content-Disposition'] = \
+            f'attachment; filename="books.{renderer.format}"'
+
+        return response
+
+    @action(methods=['GET'], detail=False)
+    def stats(self, request):
+        """ユーザーの本の数と価格の集計をタグごとの内訳と共に返す
+
+        トリガーが更新する集計テーブルを読むため、本の数に関係なく
+        一定のクエリで返す
+        """
+        summary = LibrarySummary.objects.filter(user=request.user).first() \
+            or LibrarySummary(user=request.user)
+        summary.tags = TagSummary.objects.filter(
+            tag__user=request.user,
+            books__gt=0
+        ).select_related('tag').order_by('-books', 'tag__name', 'tag_id')
+        serializer = self.get_serializer(summary)
+
+        return Response(serializer.data)
+
+    def _params_to_ints(self, qs):
+        """カンマ区切りのID文字列を整数のリストに変換する"""
+        try:
+            return [int(str_id) for str_id in qs.split(',') if str_id]
+        except ValueError:
+            raise ValidationError(
+                {'tags': _('Tags must be a comma separated list of IDs')}
+            )
+
+    def _filter_tags(self, queryset, tag_ids, match):
+        """指定されたタグを持つ本に絞り込む
+
+        core_book_tags の (tag_id, book_id) インデックスだけで
+        本のIDを解決できるよう、JOINではなくサブクエリで絞り込む
+        """
+        books = Book.tags.through.objects.filter(tag_id__in=tag_ids)
+        if match == 'all':
+            books = books.values('book_id').annotate(
+                matched=Count('tag_id')
+            ).filter(matched=len(set(tag_ids)))
+
+        return queryset.filter(id__in=books.values('book_id'))
+
+    def _filter_search(self, queryset, search):
+        """タイトルとタグの名前で本を検索する
+
+        単語は検索用ベクトルのGINインデックスで、日本語などの部分一致は
+        pg_trgmのインデックスが使える icontains で探す。pg_trgm があれば
+        綴りの似たタイトルとタグの名前もトライグラムの類似度で探す。
+        OR でつなぐとどのインデックスも使えないため、それぞれの条件で
+        探した本のIDを UNION でまとめる
+        """
+        title = Q(title__icontains=search)
+        tag_name = Q(tag__name__icontains=search)
+        if trigram_available(connection):
+            title |= Q(title__upper_trigram_similar=search)
+            tag_name |= Q(tag__name__upper_trigram_similar=search)
+
+        books = Book.objects.filter(user=self.request.user)
+        matched = books.filter(
+            search_vector=SearchQuery(search, config='simple')
+        ).values('id').union(
+            books.filter(title).values('id'),
+            Book.tags.through.objects.filter(
+                tag_name,
+                tag__user=self.request.user
+            ).values('book_id')
+        )
+
+        return queryset.filter(id__in=matched)
+
     def get_queryset(self):
         """認証されたユーザーの本を取得する"""
         tags = self.request.query_params.get('tags')
-        queryset = self.queryset
+        search = self.request.query_params.get('search', '').strip()
+        match = self.request.query_params.get('tags_match', 'any')
+        queryset = self.queryset.filter(user=self.request.user)
+
+        if match not in ('any', 'all'):
+            raise ValidationError(
+                {'tags_match': _('Must be either "any" or "all"')}
+            )
+        # NUL はPostgreSQLの文字列に含められないため、SQLに渡す前に弾く
+        if '\x00' in search or len(search) > self.search_max_length:
+            raise ValidationError({'search': _('Invalid search query')})
+        if tags:
+            tag_ids = self._params_to_ints(tags)
+            queryset = self._filter_tags(queryset, tag_ids, match)
+        if search:
+            queryset = self._filter_search(queryset, search)
 
-        return queryset.filter(user=self.request.user)
+        if self.action == 'list' and settings.FAST_LIST_SERIALIZATION:
+            queryset = serializers.BookRowSerializer.rows(queryset)
+        else:
+            prefetch = self.prefetch_related_by_action.get(self.action)
+            if prefetch:
+                queryset = queryset.prefetch_related(*prefetch)
+
+        return queryset.order_by('-id')
 
     def get_serializer_class(self):
         """適切なシリアライザークラスを返す"""
         if self.action == 'retrieve':
             return serializers.BookDetailSerializer
+        elif self.action == 'list' and settings.FAST_LIST_SERIALIZATION:
+            return serializers.BookRowSerializer
         elif self.action == 'upload_image':
             return serializers.BookImageSerializer
+        elif self.action == 'stats':
+            return serializers.LibraryStatsSerializer
 
         return self.serializer_class
 
     def perform_create(self, serializer):
         """新しい本を作成する"""
         serializer.save(user=self.request.user)
+        self.bump_collection_version()
+
+    def perform_update(self, serializer):
+        """本を更新する"""
+        serializer.save()
+        self.bump_collection_version()
+
+    def perform_destroy(self, instance):
+        """本を削除する"""
+        instance.delete()
+        self.bump_collection_version()
@@ -0,0 +1,217 @@
+import asyncio
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+
+from core.pool import close_pools
+
+
+class ASGIAdapter:
+    """WSGIアプリケーションをASGIサーバーで動かすアダプター
+
+    接続の受け付けとリクエストの本文の受信はイベントループで行い、
+    本文を受け取り終えたリクエストだけを max_threads 個のスレッドで
+    処理する。本文を送るのが遅いクライアントや待機中の接続はスレッドを
+    占有しないため、1つのプロセスで多数の同時接続を保てる。スレッド数は
+    データベースの接続プールの大きさに合わせる
+
+    ストリーミングの応答(書き出しやメディア)は、クライアントが読み終える
+    までスレッドを占有し、書き出しではデータベースの接続も保持する。
+    クライアントが切断した場合は本文の生成をやめ、応答を閉じて接続を返す
+    """
+    # これより大きな本文は一時ファイルに書き出す
+    spool_size = 64 * 1024
+
+    def __init__(self, wsgi_application, max_threads=10,
+                 max_body_size=None):
+        self.wsgi_application = wsgi_application
+        # これを超える本文は読み込まずに413を返す
+        self.max_body_size = max_body_size
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_threads,
+            thread_name_prefix='asgi'
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise ValueError(f'Unsupported scope type {scope["type"]!r}')
+
+        try:
+            length = int(self.header(scope, b'content-length') or 0)
+        except ValueError:
+            return await self.error(send, 400, b'Invalid Content-Length')
+        if self.too_large(length):
+            return await self.error(send, 413, b'Request body too large')
+
+        with SpooledTemporaryFile(max_size=self.spool_size) as body:
+            received = 0
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    return
+                chunk = message.get('body', b'')
+                received += len(chunk)
+                # Content-Length のないチャンク形式の本文も制限する
+                if self.too_large(received):
+                    return await self.error(send, 413,
+                                            b'Request body too large')
+                body.write(chunk)
+                if not message.get('more_body'):
+                    break
+            body.seek(0)
+
+            loop = asyncio.get_running_loop()
+            disconnected = threading.Event()
+            watcher = loop.create_task(
+                self.wait_for_disconnect(receive, disconnected)
+            )
+            try:
+                await loop.run_in_executor(
+                    self.executor,
+                    self.run_wsgi,
+                    self.build_environ(scope, body),
+                    send,
+                    loop,
+                    disconnected
+                )
+            finally:
+                watcher.cancel()
+
+    @staticmethod
+    async def wait_for_disconnect(receive, disconnected):
+        """本文を受け取った後のクライアントの切断を待つ"""
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                disconnected.set()
+                return
+
+    def too_large(self, size):
+        """本文の大きさが上限を超えているかどうかを返す"""
+        return self.max_body_size is not None and size > self.max_body_size
+
+    @staticmethod
+    def header(scope, name):
+        """スコープから最初に見つかったヘッダーの値を返す"""
+        for key, value in scope.get('headers', []):
+            if key.lower() == name:
+                return value
+        return None
+
+    @staticmethod
+    async def error(send, status, message):
+        """アプリケーションを呼ばずにエラーを返す"""
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'text/plain; charset=utf-8'),
+                        (b'connection', b'close')],
+        })
+        await send({'type': 'http.response.body', 'body': message})
+
+    async def lifespan(self, receive, send):
+        """サーバーの起動と終了を扱う"""
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                # 処理中のリクエストを終えてから接続を閉じる
+                await asyncio.get_running_loop().run_in_executor(
+                    None, self.executor.shutdown
+                )
+                close_pools()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def build_environ(self, scope, body):
+        """ASGIのスコープからWSGIのenvironを作る"""
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '')
+            .encode('utf-8').decode('latin-1'),
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f'HTTP/{scope.get("http_version", "1.1")}',
+            'REMOTE_ADDR': client[0],
+            'REMOTE_PORT': str(client[1]),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                key = name
+            else:
+                key = f'HTTP_{name}'
+            if key in environ:
+                # Cookie ヘッダーだけは ; で区切る (RFC 6265)
+                separator = '; ' if key == 'HTTP_COOKIE' else ','
+                value = f'{environ[key]}{separator}{value}'
+            environ[key] = value
+
+        return environ
+
+    def run_wsgi(self, environ, send, loop, disconnected):
+        """スレッドでWSGIアプリケーションを実行し、応答を送る
+
+        クライアントが切断すると残りの本文を生成せずに応答を閉じる。
+        Djangoは応答を閉じるときにデータベースの接続を返す
+        """
+        if disconnected.is_set():
+            return
+
+        def sync_send(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and response.get('started'):
+                raise exc_info[1].with_traceback(exc_info[2])
+            response['start'] = {
+                'type': 'http.response.start',
+                'status': int(status.split(' ', 1)[0]),
+                'headers': [
+                    (name.lower().encode('latin-1'), value.encode('latin-1'))
+                    for name, value in headers
+                ],
+            }
+
+        def send_start():
+            if not response.get('started'):
+                response['started'] = True
+                sync_send(response['start'])
+
+        result = self.wsgi_application(environ, start_response)
+        try:
+            for chunk in result:
+                if disconnected.is_set():
+                    return
+                if chunk:
+                    send_start()
+                    sync_send({
+                        'type': 'http.response.body',
+                        'body': chunk,
+                        'more_body': True,
+                    })
+            if disconnected.is_set():
+                return
+            send_start()
+            sync_send({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
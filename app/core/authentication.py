@@ -0,0 +1,101 @@
+import copy
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.translation import ugettext_lazy as _
+
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from core.cache import LRUCache
+
+
+class TokenCache:
+    """トークンとユーザーの対応を保持するキャッシュ
+
+    共有のキャッシュバックエンドが設定されていれば、それだけを参照する。
+    削除は全てのプロセスに即座に反映される。設定されていなければ
+    プロセス内のLRUを参照する。他のプロセスでの削除は反映されないため、
+    失効したトークンは最大 local_timeout 秒受け付けられる
+    """
+    key_prefix = 'auth-token:'
+
+    def __init__(self, max_size=10000, timeout=60, local_timeout=5,
+                 backend=None):
+        self.local = LRUCache(max_size=max_size, timeout=local_timeout)
+        self.timeout = timeout
+        self.backend = backend
+
+    @property
+    def shared(self):
+        if self.backend is None:
+            return None
+        return caches[self.backend]
+
+    def get(self, key):
+        """キャッシュされたトークンを返す"""
+        if self.shared is not None:
+            token = self.shared.get(self.key_prefix + key)
+        else:
+            token = self.local.get(key)
+
+        # リクエスト間で同じインスタンスを共有しないように複製する
+        return copy.deepcopy(token)
+
+    def set(self, key, token):
+        """トークンをキャッシュする"""
+        if self.shared is not None:
+            self.shared.set(self.key_prefix + key, token, self.timeout)
+        else:
+            self.local.set(key, token)
+
+    def delete(self, key):
+        """トークンをキャッシュから削除する"""
+        self.local.delete(key)
+        if self.shared is not None:
+            self.shared.delete(self.key_prefix + key)
+
+    def delete_user(self, user):
+        """ユーザーの全てのトークンをキャッシュから削除する"""
+        keys = Token.objects.filter(user=user).values_list('key', flat=True)
+        for key in keys:
+            self.delete(key)
+
+    def clear(self):
+        """ローカルのキャッシュを全て削除する"""
+        self.local.clear()
+
+
+token_cache = TokenCache(
+    **{
+        k.lower(): v
+        for k, v in getattr(settings, 'TOKEN_AUTH_CACHE', {}).items()
+    }
+)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """トークンの検索結果をキャッシュするトークン認証
+
+    リクエストごとに authtoken_token を検索する代わりに、
+    token_cache に保持したトークンとユーザーを使用する
+    """
+
+    def authenticate_credentials(self, key):
+        token = token_cache.get(key)
+        if token is None:
+            model = self.get_model()
+            try:
+                token = model.objects.select_related('user').get(key=key)
+            except model.DoesNotExist:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+            token_cache.set(key, token)
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.')
+            )
+
+        return (token.user, token)
@@ -0,0 +1,123 @@
+from django.db.backends.postgresql import base
+from psycopg2 import extensions
+
+from core.backends.postgresql.creation import DatabaseCreation
+from core.pool import ConnectionPool, PoolTimeout, get_pool
+
+
+Database = base.Database
+
+DEFAULT_POOL = {
+    # 0の場合はプールを使わず、標準のバックエンドと同じように接続する
+    'MAX_SIZE': 0,
+    'TIMEOUT': 10,
+    'CHECK_INTERVAL': 30,
+    'MAX_LIFETIME': 3600,
+}
+
+
+def check_connection(conn):
+    """接続でクエリを実行できるかどうかを返す"""
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        if not conn.autocommit:
+            conn.rollback()
+    except Database.Error:
+        return False
+
+    return True
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """プロセス内の接続プールを使うPostgreSQLのバックエンド
+
+    settings_dict['POOL'] でプールを設定する。閉じた接続はプールに
+    返され、同じデータベースへの次の接続で再利用される
+    """
+    creation_class = DatabaseCreation
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool_options = {
+            **DEFAULT_POOL,
+            **self.settings_dict.get('POOL', {}),
+        }
+        self.pool = None
+
+    def get_pool(self, conn_params):
+        """接続先ごとのプールを返す。プールを使わない場合はNoneを返す"""
+        options = self.pool_options
+        if not options['MAX_SIZE']:
+            return None
+
+        key = (self.alias,) + tuple(sorted(
+            (name, str(value)) for name, value in conn_params.items()
+        ))
+        return get_pool(key, lambda: ConnectionPool(
+            check_connection,
+            name=f'{self.alias}:{self.settings_dict["NAME"]}',
+            max_size=options['MAX_SIZE'],
+            timeout=options['TIMEOUT'],
+            check_interval=options['CHECK_INTERVAL'],
+            max_lifetime=options['MAX_LIFETIME']
+        ))
+
+    def get_new_connection(self, conn_params):
+        pool = self.get_pool(conn_params)
+        if pool is None:
+            return super().get_new_connection(conn_params)
+
+        try:
+            connection = pool.acquire(
+                lambda: super(DatabaseWrapper, self)
+                .get_new_connection(conn_params)
+            )
+        except PoolTimeout as e:
+            raise Database.OperationalError(str(e)) from e
+
+        # 再利用した接続では get_new_connection が呼ばれないため設定する
+        self.isolation_level = self.settings_dict['OPTIONS'].get(
+            'isolation_level',
+            connection.isolation_level
+        )
+        self.pool = pool
+        return connection
+
+    def reset_connection(self, conn):
+        """プールに返す前に接続を初期状態に戻し、再利用できるかを返す
+
+        トランザクションを巻き戻してから DISCARD ALL で SET した設定、
+        一時テーブル、アドバイザリーロックなどのセッションの状態を消す。
+        文字コードとタイムゾーンは次に貸し出すときにDjangoが設定し直す
+        """
+        if conn.closed:
+            return False
+
+        status = conn.get_transaction_status()
+        if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        try:
+            if status != extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            # DISCARD ALL はトランザクションの外でしか実行できない
+            autocommit = conn.autocommit
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute('DISCARD ALL')
+            conn.autocommit = autocommit
+        except Database.Error:
+            return False
+
+        return True
+
+    def _close(self):
+        if self.connection is None or self.pool is None:
+            return super()._close()
+
+        pool, self.pool = self.pool, None
+        with self.wrap_database_errors:
+            pool.release(
+                self.connection,
+                reuse=self.reset_connection(self.connection)
+            )
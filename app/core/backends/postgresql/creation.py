@@ -0,0 +1,18 @@
+from django.db.backends.postgresql import creation
+
+from core.pool import close_pools
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    """プールに残った接続を閉じてからテスト用のデータベースを操作する
+
+    接続が残っているとデータベースの削除や複製ができない
+    """
+
+    def _clone_test_db(self, suffix, verbosity, keepdb=False):
+        close_pools()
+        super()._clone_test_db(suffix, verbosity, keepdb)
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        close_pools()
+        super()._destroy_test_db(test_database_name, verbosity)
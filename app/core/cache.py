@@ -0,0 +1,56 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """有効期限付きのスレッドセーフなLRUキャッシュ
+
+    プロセス内のメモリに保持し、max_sizeを超えると最も長く
+    使われていないエントリから破棄する
+    """
+
+    def __init__(self, max_size=1024, timeout=60):
+        self.max_size = max_size
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        """キーの値を返す。存在しないか期限切れの場合はdefaultを返す"""
+        with self._lock:
+            try:
+                expires, value = self._data[key]
+            except KeyError:
+                return default
+
+            if expires <= time.monotonic():
+                del self._data[key]
+                return default
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        """キーに値を保存する"""
+        if timeout is None:
+            timeout = self.timeout
+
+        with self._lock:
+            self._data[key] = (time.monotonic() + timeout, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        """キーを削除する"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """全てのキーを削除する"""
+        with self._lock:
+            self._data.clear()
@@ -0,0 +1,38 @@
+from django.db import DatabaseError
+from django.db.models import CharField, Lookup
+
+
+@CharField.register_lookup
+class UpperTrigramSimilar(Lookup):
+    """大文字に揃えた値同士のトライグラムの類似度で絞り込む
+
+    pg_trgm の % 演算子を使い、UPPER(...) gin_trgm_ops のインデックスで
+    似た綴りの値を探す。pg_trgm がない場合は使えない
+    """
+    lookup_name = 'upper_trigram_similar'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'UPPER({lhs}) %% UPPER({rhs})', lhs_params + rhs_params
+
+
+_trigram_available = {}
+
+
+def trigram_available(connection):
+    """データベースに pg_trgm がインストールされているかどうかを返す"""
+    if connection.alias not in _trigram_available:
+        available = False
+        if connection.vendor == 'postgresql':
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"
+                    )
+                    available = cursor.fetchone() is not None
+            except DatabaseError:
+                pass
+        _trigram_available[connection.alias] = available
+
+    return _trigram_available[connection.alias]
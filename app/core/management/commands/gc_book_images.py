@@ -0,0 +1,73 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.storage import ORPHAN_GRACE_SECONDS, image_references, \
+                         image_storage
+
+
+class Command(BaseCommand):
+    """どの本からも参照されていない画像ファイルを削除するコマンド"""
+    help = 'Delete book image files that are no longer referenced'
+    batch_size = 1000
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace',
+            type=int,
+            default=ORPHAN_GRACE_SECONDS,
+            help='Keep files modified within this many seconds'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report the files that would be deleted'
+        )
+
+    def walk(self, directory):
+        """ストレージ内のディレクトリ以下のファイル名を返す"""
+        if not image_storage.exists(directory):
+            return
+        directories, files = image_storage.listdir(directory)
+        for name in files:
+            yield f'{directory}/{name}'
+        for name in directories:
+            yield from self.walk(f'{directory}/{name}')
+
+    def collect(self, names, threshold, dry_run):
+        """参照されていない古いファイルを削除し、その数を返す"""
+        orphans = [
+            name for name in set(names) - image_references(names)
+            if os.path.getmtime(image_storage.path(name)) <= threshold
+        ]
+        if not dry_run:
+            for name in orphans:
+                image_storage.delete(name)
+
+        return len(orphans)
+
+    def handle(self, *args, **options):
+        threshold = time.time() - options['grace']
+        dry_run = options['dry_run']
+        deleted = 0
+
+        batch = []
+        for name in self.walk('uploads/book'):
+            batch.append(name)
+            if len(batch) >= self.batch_size:
+                deleted += self.collect(batch, threshold, dry_run)
+                batch = []
+        if batch:
+            deleted += self.collect(batch, threshold, dry_run)
+
+        # 中断されたアップロードの一時ファイルを削除する
+        for name in self.walk('uploads/tmp'):
+            path = image_storage.path(name)
+            if os.path.getmtime(path) <= threshold:
+                deleted += 1
+                if not dry_run:
+                    image_storage.delete(name)
+
+        verb = 'Would delete' if dry_run else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {deleted} files'))
@@ -0,0 +1,229 @@
+import csv
+import io
+import json
+import sys
+import time
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from core.models import Book, LibraryVersion, Tag
+from book.exports import TAG_SEPARATOR
+
+
+class Command(BaseCommand):
+    """NDJSONまたはCSVから本とタグを一括で取り込むコマンド
+
+    入力は書き出し(/api/book/books/export/)と同じ形式で、id は無視する
+    """
+    help = 'Import books and their tags from an NDJSON or CSV file'
+    fields = ('title', 'price', 'link')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help='File to import, or "-" to read from stdin'
+        )
+        parser.add_argument(
+            '--user',
+            required=True,
+            help='Email of the user who will own the books'
+        )
+        parser.add_argument(
+            '--format',
+            choices=('ndjson', 'csv'),
+            help='Input format (default: guessed from the file extension)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Number of books written per batch'
+        )
+        parser.add_argument(
+            '--no-copy',
+            action='store_true',
+            help='Use bulk_create even when COPY is available'
+        )
+
+    def read_ndjson(self, lines):
+        """NDJSONの各行を辞書として返す"""
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+
+    def read_csv(self, lines):
+        """CSVの各行を辞書として返す"""
+        for row in csv.DictReader(lines):
+            tags = row.get('tags') or ''
+            row['tags'] = tags.split(TAG_SEPARATOR) if tags else []
+            yield row
+
+    def clean(self, number, record):
+        """入力の1件を検証し (title, price, link, タグ名のリスト) を返す"""
+        if not isinstance(record, dict):
+            raise CommandError(f'Record {number}: expected an object')
+
+        values = []
+        try:
+            for name in self.fields:
+                field = Book._meta.get_field(name)
+                values.append(field.clean(record.get(name, ''), None))
+
+            name = 'tags'
+            tags = []
+            for tag in record.get('tags') or []:
+                if isinstance(tag, dict):
+                    tag = tag.get('name')
+                tags.append(Tag._meta.get_field('name').clean(tag, None))
+        except ValidationError as e:
+            raise CommandError(
+                f'Record {number}: {name}: {" ".join(e.messages)}'
+            )
+
+        return (*values, tags)
+
+    def resolve_tags(self, user, names):
+        """タグ名をIDに解決し、存在しないタグはまとめて作成する
+
+        新しく作成したタグの数を返す
+        """
+        missing = set(names) - self.tag_ids.keys()
+        if not missing:
+            return 0
+
+        existing = Tag.objects.filter(user=user, name__in=missing) \
+            .order_by('id').values_list('name', 'id')
+        for name, tag_id in existing:
+            self.tag_ids.setdefault(name, tag_id)
+
+        tags = [Tag(user=user, name=name)
+                for name in sorted(missing - self.tag_ids.keys())]
+        self.create(Tag, tags)
+        for tag in tags:
+            self.tag_ids[tag.name] = tag.id
+
+        return len(tags)
+
+    def create(self, model, objs):
+        """オブジェクトをまとめて作成し、IDを設定する"""
+        if connection.features.can_return_ids_from_bulk_insert:
+            model.objects.bulk_create(objs, batch_size=self.batch_size)
+        else:
+            for obj in objs:
+                obj.save(force_insert=True)
+
+    def copy(self, table, columns, rows, not_null=()):
+        """PostgreSQLのCOPYで行をまとめて書き込む"""
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+
+        quote = connection.ops.quote_name
+        sql = 'COPY %s (%s) FROM STDIN WITH (FORMAT csv%s)' % (
+            quote(table),
+            ', '.join(quote(column) for column in columns),
+            ', FORCE_NOT_NULL (%s)' % ', '.join(map(quote, not_null))
+            if not_null else ''
+        )
+        with connection.cursor() as cursor:
+            cursor.copy_expert(sql, buffer)
+
+    def write_books_copy(self, user, records):
+        """IDをシーケンスから確保し、本とタグの関連をCOPYで書き込む"""
+        table = Book._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT nextval(pg_get_serial_sequence(%s, 'id')) "
+                "FROM generate_series(1, %s)",
+                [table, len(records)]
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+
+        self.copy(
+            table,
+            ('id', 'user_id', 'title', 'price', 'link', 'image_status'),
+            ((book_id, user.id, title, price, link, '')
+             for book_id, (title, price, link, _)
+             in zip(ids, records)),
+            not_null=('title', 'link', 'image_status')
+        )
+        self.copy(
+            Book.tags.through._meta.db_table,
+            ('book_id', 'tag_id'),
+            ((book_id, tag_id)
+             for book_id, (*_, tags) in zip(ids, records)
+             for tag_id in dict.fromkeys(self.tag_ids[name]
+                                         for name in tags))
+        )
+
+    def write_books(self, user, records):
+        """本とタグの関連をbulk_createで書き込む"""
+        books = [Book(user=user, title=title, price=price, link=link)
+                 for title, price, link, _ in records]
+        self.create(Book, books)
+
+        through = Book.tags.through
+        through.objects.bulk_create(
+            [through(book_id=book.id, tag_id=tag_id)
+             for book, (*_, tags) in zip(books, records)
+             for tag_id in dict.fromkeys(self.tag_ids[name]
+                                         for name in tags)],
+            batch_size=self.batch_size
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(email=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'User "{options["user"]}" does not exist')
+
+        path = options['path']
+        input_format = options['format'] or \
+            ('csv' if path.lower().endswith('.csv') else 'ndjson')
+        read = self.read_csv if input_format == 'csv' else self.read_ndjson
+        use_copy = connection.vendor == 'postgresql' and \
+            not options['no_copy']
+        write = self.write_books_copy if use_copy else self.write_books
+        self.batch_size = options['batch_size']
+        self.tag_ids = {}
+
+        try:
+            stream = sys.stdin if path == '-' else \
+                open(path, newline='', encoding='utf-8')
+        except OSError as e:
+            raise CommandError(f'cannot read {path}: {e}')
+        start = time.monotonic()
+        books = tags = 0
+        try:
+            records = enumerate(read(stream), start=1)
+            with transaction.atomic():
+                for batch in iter(
+                    lambda: list(islice(records, self.batch_size)), []
+                ):
+                    batch = [self.clean(number, record)
+                             for number, record in batch]
+                    tags += self.resolve_tags(user, (
+                        name for *_, names in batch for name in names
+                    ))
+                    write(user, batch)
+                    books += len(batch)
+                    if options['verbosity'] > 1:
+                        self.stdout.write(f'Imported {books} books...')
+
+                LibraryVersion.objects.bump(user, 'books', 'tags')
+        except (ValueError, csv.Error) as e:
+            raise CommandError(f'Invalid {input_format} input: {e}')
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        elapsed = time.monotonic() - start
+        rate = books / elapsed if elapsed else books
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {books} books and {tags} new tags '
+            f'in {elapsed:.1f}s ({rate:.0f} books/s)'
+        ))
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+
+from book.images import process_book_image, stale_book_images
+
+
+class Command(BaseCommand):
+    """処理が止まったままの本の画像を処理し直すコマンド
+
+    画像の処理はワーカープロセス内のスレッドで行うため、デプロイや
+    ワーカーの強制終了で予約が失われると pending または processing の
+    ままになる。定期的に実行し、このプロセス内で処理する
+    """
+    help = 'Process book images stuck in pending or processing'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than',
+            type=int,
+            default=900,
+            help='Only books whose status has not changed for this many '
+                 'seconds'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report the books that would be processed'
+        )
+
+    def handle(self, *args, **options):
+        book_ids = list(
+            stale_book_images(options['older_than'])
+            .order_by('id').values_list('id', flat=True)
+        )
+        if options['dry_run']:
+            self.stdout.write(
+                f'Would process {len(book_ids)} book images'
+            )
+            return
+
+        for book_id in book_ids:
+            process_book_image(book_id)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed {len(book_ids)} book images'
+        ))
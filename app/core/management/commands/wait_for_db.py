@@ -1,21 +1,74 @@
+import random
 import time
 
 from django.db import connections
 from django.db.utils import OperationalError
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
 
 class Command(BaseCommand):
-    """データベースが利用可能になるまで実行を一時停止するコマンド"""
+    """データベースが利用可能になるまで実行を一時停止するコマンド
+
+    実際にクエリを送って確かめ、失敗した場合はジッター付きの
+    指数バックオフで期限まで再試行する
+    """
+    help = 'Wait until the database accepts queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database',
+            default='default',
+            help='Database alias to probe'
+        )
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            default=60,
+            help='Give up after this many seconds'
+        )
+        parser.add_argument(
+            '--initial-delay',
+            type=float,
+            default=0.1,
+            help='Delay before the first retry in seconds'
+        )
+        parser.add_argument(
+            '--max-delay',
+            type=float,
+            default=5,
+            help='Upper bound of the delay between retries in seconds'
+        )
+
+    def probe(self, alias):
+        """データベースにクエリを送り、応答を待つ"""
+        with connections[alias].cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
 
     def handle(self, *args, **options):
         self.stdout.write('Waiting for database...')
-        db_conn = None
-        while not db_conn:
+        deadline = time.monotonic() + options['timeout']
+        delay = options['initial_delay']
+        attempt = 1
+        while True:
             try:
-                db_conn = connections['default']
-            except OperationalError:
-                self.stdout.write('Database unavailable, waiting 1 second...')
-                time.sleep(1)
+                self.probe(options['database'])
+                break
+            except OperationalError as e:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise CommandError(
+                        f'Database unavailable after {attempt} attempts: {e}'
+                    )
+
+                # 多数のコンテナが同時に再試行しないよう待ち時間を揺らす
+                wait = min(delay / 2 + random.uniform(0, delay / 2),
+                           remaining)
+                self.stdout.write(
+                    f'Database unavailable, waiting {wait:.2f} seconds...'
+                )
+                time.sleep(wait)
+                delay = min(delay * 2, options['max_delay'])
+                attempt += 1
 
         self.stdout.write(self.style.SUCCESS('Database available!'))
@@ -0,0 +1,174 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Gauge, \
+    Histogram, generate_latest, multiprocess
+
+from rest_framework import serializers
+
+from core.pool import pool_stats
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'Request latency',
+    ('view', 'method', 'status'), buckets=LATENCY_BUCKETS
+)
+REQUEST_DB_QUERIES = Histogram(
+    'http_request_db_queries', 'Database queries per request',
+    ('view', 'method'), buckets=QUERY_BUCKETS
+)
+REQUEST_DB_SECONDS = Histogram(
+    'http_request_db_seconds', 'Time spent in database queries per request',
+    ('view', 'method'), buckets=LATENCY_BUCKETS
+)
+REQUEST_SERIALIZE_SECONDS = Histogram(
+    'http_request_serialize_seconds', 'Time spent in serializers per request',
+    ('view', 'method'), buckets=LATENCY_BUCKETS
+)
+REQUEST_RENDER_SECONDS = Histogram(
+    'http_request_render_seconds',
+    'Time spent rendering the response per request',
+    ('view', 'method'), buckets=LATENCY_BUCKETS
+)
+RESPONSE_SIZE = Histogram(
+    'http_response_size_bytes', 'Response body size',
+    ('view', 'method'), buckets=SIZE_BUCKETS
+)
+# 複数のプロセスの値は生きているプロセスの合計にする
+POOL_CONNECTIONS = Gauge(
+    'db_pool_connections', 'Pooled database connections',
+    ('pool', 'state'), multiprocess_mode='livesum'
+)
+POOL_EVENTS = Counter(
+    'db_pool_events', 'Connection pool events',
+    ('pool', 'event')
+)
+
+_published = {}
+_published_lock = threading.Lock()
+
+
+def publish_pool_stats():
+    """接続プールの状態をメトリクスに反映する
+
+    プールの累計の回数は前回からの差分だけカウンターに加える
+    """
+    with _published_lock:
+        for name, stats in pool_stats().items():
+            for state in ('idle', 'in_use'):
+                POOL_CONNECTIONS.labels(name, state).set(stats[state])
+            last = _published.get(name, {})
+            for event in ('created', 'waits', 'timeouts'):
+                delta = stats[event] - last.get(event, 0)
+                if delta < 0:
+                    # プールが作り直された
+                    delta = stats[event]
+                if delta:
+                    POOL_EVENTS.labels(name, event).inc(delta)
+            _published[name] = stats
+
+
+def render_metrics():
+    """全てのメトリクスをPrometheusのテキスト形式で返す
+
+    PROMETHEUS_MULTIPROC_DIR が設定されている場合は、そのディレクトリに
+    書き出された全てのワーカープロセスの値を集計する
+    """
+    publish_pool_stats()
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+
+    return generate_latest(registry)
+
+
+class RequestMetrics:
+    """処理中の1つのリクエストの計測値"""
+
+    def __init__(self, keep_statements=False):
+        self.db_queries = 0
+        self.db_seconds = 0
+        self.serialize_seconds = 0
+        self.render_seconds = 0
+        # 遅いリクエストを記録するための (秒, SQL) のリスト
+        self.statements = [] if keep_statements else None
+
+    def execute(self, execute, sql, params, many, context):
+        """connection.execute_wrapper に渡すクエリの計測"""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.db_queries += 1
+            self.db_seconds += elapsed
+            if self.statements is not None:
+                self.statements.append((elapsed, sql))
+
+    def record(self, view, method, status, duration, size):
+        """リクエストの計測値をメトリクスに記録する"""
+        REQUEST_DURATION.labels(view, method, status).observe(duration)
+        REQUEST_DB_QUERIES.labels(view, method).observe(self.db_queries)
+        REQUEST_DB_SECONDS.labels(view, method).observe(self.db_seconds)
+        REQUEST_SERIALIZE_SECONDS.labels(view, method) \
+            .observe(self.serialize_seconds)
+        REQUEST_RENDER_SECONDS.labels(view, method) \
+            .observe(self.render_seconds)
+        if size is not None:
+            RESPONSE_SIZE.labels(view, method).observe(size)
+
+
+_local = threading.local()
+
+
+def start_request(keep_statements=False):
+    """現在のスレッドでリクエストの計測を始める"""
+    _local.current = RequestMetrics(keep_statements)
+    return _local.current
+
+
+def end_request():
+    _local.current = None
+
+
+def current_request():
+    """現在のスレッドで計測中のリクエストを返す"""
+    return getattr(_local, 'current', None)
+
+
+@contextmanager
+def timer(phase):
+    """ブロックの実行時間を計測中のリクエストの phase に加える"""
+    current = current_request()
+    if current is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        attr = f'{phase}_seconds'
+        setattr(current, attr,
+                getattr(current, attr) + time.perf_counter() - start)
+
+
+class TimedSerializerMixin:
+    """シリアライズにかかった時間を計測するシリアライザーのミックスイン"""
+
+    @property
+    def data(self):
+        with timer('serialize'):
+            return super().data
+
+
+class TimedListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    """シリアライズにかかった時間を計測する一覧のシリアライザー"""
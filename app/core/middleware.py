@@ -0,0 +1,87 @@
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from core import metrics
+
+
+logger = logging.getLogger('core.metrics')
+
+
+class MetricsMiddleware:
+    """ビューごとのレイテンシ、クエリの数と時間、応答の大きさを記録する
+
+    MIDDLEWARE の先頭に置く。SLOW_REQUEST_SECONDS を超えたリクエストは
+    時間のかかったSQLと共にログに出力する。ストリーミングの応答は
+    本文を送り終える前に記録するため、大きさとその間のクエリは含まない
+    """
+
+    def __init__(self, get_response):
+        options = settings.METRICS
+        if not options['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.slow_request_seconds = options['SLOW_REQUEST_SECONDS']
+        self.slow_request_sql = options['SLOW_REQUEST_SQL']
+
+    def __call__(self, request):
+        current = metrics.start_request(
+            keep_statements=self.slow_request_seconds is not None
+        )
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(current.execute)
+                    )
+                response = self.get_response(request)
+        finally:
+            metrics.end_request()
+        duration = time.perf_counter() - start
+
+        match = request.resolver_match
+        # 解決できなかったパスはラベルの種類を増やさないようにまとめる
+        view = match.view_name if match else 'unresolved'
+        size = None if response.streaming else len(response.content)
+        current.record(
+            view, request.method, str(response.status_code), duration, size
+        )
+        metrics.publish_pool_stats()
+
+        if self.slow_request_seconds is not None and \
+                duration >= self.slow_request_seconds:
+            self.log_slow_request(request, view, duration, current)
+
+        return response
+
+    def process_template_response(self, request, response):
+        # 先頭のミドルウェアは最後に呼ばれるため、この直後に描画が始まる
+        current = metrics.current_request()
+        if current is not None:
+            start = time.perf_counter()
+
+            def rendered(response):
+                current.render_seconds += time.perf_counter() - start
+
+            response.add_post_render_callback(rendered)
+
+        return response
+
+    def log_slow_request(self, request, view, duration, current):
+        """遅いリクエストを時間のかかった順のSQLと共にログに出力する"""
+        statements = sorted(current.statements, reverse=True)
+        lines = [
+            f'Slow request {request.method} {request.path} ({view}) '
+            f'{duration:.3f}s, {current.db_queries} queries '
+            f'in {current.db_seconds:.3f}s'
+        ]
+        lines.extend(
+            f'  {elapsed * 1000:8.2f} ms  {sql}'
+            for elapsed, sql in statements[:self.slow_request_sql]
+        )
+        logger.warning('\n'.join(lines))
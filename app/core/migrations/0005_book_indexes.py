@@ -0,0 +1,22 @@
+# Generated by Django 2.2.28 on 2026-10-17 20:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_book_image'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['user', '-id'], name='core_book_user_id_idx'),
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX core_book_tags_tag_id_book_id_idx '
+            'ON core_book_tags (tag_id, book_id);',
+            'DROP INDEX core_book_tags_tag_id_book_id_idx;',
+        ),
+    ]
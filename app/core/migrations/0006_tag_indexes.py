@@ -0,0 +1,17 @@
+# Generated by Django 2.2.28 on 2026-10-17 20:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_book_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['user', '-name', '-id'], name='core_tag_user_name_idx'),
+        ),
+    ]
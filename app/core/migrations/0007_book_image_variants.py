@@ -0,0 +1,29 @@
+# Generated by Django 2.2.28 on 2026-10-17 20:11
+
+import core.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_tag_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='image_medium',
+            field=models.ImageField(blank=True, null=True, upload_to=core.models.book_image_file_path),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='image_status',
+            field=models.CharField(blank=True, choices=[('pending', 'Pending'), ('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], max_length=16),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='image_thumbnail',
+            field=models.ImageField(blank=True, null=True, upload_to=core.models.book_image_file_path),
+        ),
+    ]
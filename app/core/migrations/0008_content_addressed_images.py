@@ -0,0 +1,30 @@
+# Generated by Django 2.2.28 on 2026-10-17 20:13
+
+import core.models
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_book_image_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='book',
+            name='image',
+            field=models.ImageField(null=True, storage=core.storage.ContentAddressedStorage(), upload_to=core.models.book_image_file_path),
+        ),
+        migrations.AlterField(
+            model_name='book',
+            name='image_medium',
+            field=models.ImageField(blank=True, null=True, storage=core.storage.ContentAddressedStorage(), upload_to=core.models.book_image_file_path),
+        ),
+        migrations.AlterField(
+            model_name='book',
+            name='image_thumbnail',
+            field=models.ImageField(blank=True, null=True, storage=core.storage.ContentAddressedStorage(), upload_to=core.models.book_image_file_path),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 2.2.28 on 2026-10-17 20:15
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_content_addressed_images'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LibraryVersion',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('books', models.BigIntegerField(default=0)),
+                ('tags', models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
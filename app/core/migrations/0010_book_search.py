@@ -0,0 +1,126 @@
+# Generated by Django 2.2.28 on 2026-10-17 20:26
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+# タイトル(重みA)とタグの名前(重みB)から検索用ベクトルを作るトリガー
+# 本・本とタグの関連・タグの名前が変わるたびにベクトルを作り直す
+SEARCH_TRIGGERS = """
+CREATE FUNCTION core_book_search_vector_trigger() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('simple', NEW.title), 'A') ||
+        setweight(to_tsvector('simple', coalesce((
+            SELECT string_agg(t.name, ' ')
+            FROM core_book_tags bt JOIN core_tag t ON t.id = bt.tag_id
+            WHERE bt.book_id = NEW.id
+        ), '')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER core_book_search_vector_update
+    BEFORE INSERT OR UPDATE OF title ON core_book
+    FOR EACH ROW EXECUTE PROCEDURE core_book_search_vector_trigger();
+
+CREATE FUNCTION core_book_tags_search_vector_trigger() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        UPDATE core_book SET title = title
+        WHERE id IN (SELECT book_id FROM old_rows);
+    ELSE
+        UPDATE core_book SET title = title
+        WHERE id IN (SELECT book_id FROM new_rows);
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER core_book_tags_search_vector_insert
+    AFTER INSERT ON core_book_tags
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE core_book_tags_search_vector_trigger();
+
+CREATE TRIGGER core_book_tags_search_vector_delete
+    AFTER DELETE ON core_book_tags
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE core_book_tags_search_vector_trigger();
+
+CREATE FUNCTION core_tag_search_vector_trigger() RETURNS trigger AS $$
+BEGIN
+    UPDATE core_book SET title = title
+    WHERE id IN (SELECT book_id FROM core_book_tags WHERE tag_id = NEW.id);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER core_tag_search_vector_update
+    AFTER UPDATE OF name ON core_tag
+    FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name)
+    EXECUTE PROCEDURE core_tag_search_vector_trigger();
+
+UPDATE core_book SET title = title;
+"""
+
+DROP_SEARCH_TRIGGERS = """
+DROP TRIGGER core_tag_search_vector_update ON core_tag;
+DROP TRIGGER core_book_tags_search_vector_delete ON core_book_tags;
+DROP TRIGGER core_book_tags_search_vector_insert ON core_book_tags;
+DROP TRIGGER core_book_search_vector_update ON core_book;
+DROP FUNCTION core_tag_search_vector_trigger();
+DROP FUNCTION core_book_tags_search_vector_trigger();
+DROP FUNCTION core_book_search_vector_trigger();
+"""
+
+# 部分一致(icontains)の検索に使うトライグラムのインデックス
+# Djangoは UPPER(列) LIKE UPPER(値) を発行するため式インデックスにする
+TRIGRAM_INDEXES = {
+    'core_book_title_trgm_idx': 'core_book USING gin (UPPER(title) gin_trgm_ops)',
+    'core_tag_name_trgm_idx': 'core_tag USING gin (UPPER(name) gin_trgm_ops)',
+}
+
+
+def create_trigram_indexes(apps, schema_editor):
+    """pg_trgmが利用できる場合にトライグラムのインデックスを作成する
+
+    利用できない場合も部分一致の検索はインデックスなしで動作する
+    """
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'"
+        )
+        if cursor.fetchone() is None:
+            return
+
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, definition in TRIGRAM_INDEXES.items():
+        schema_editor.execute(f'CREATE INDEX {name} ON {definition}')
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    """トライグラムのインデックスを削除する"""
+    for name in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_libraryversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='core_book_search_idx'),
+        ),
+        migrations.RunSQL(SEARCH_TRIGGERS, DROP_SEARCH_TRIGGERS),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
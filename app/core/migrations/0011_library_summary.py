@@ -0,0 +1,181 @@
+# Generated by Django 2.2.28 on 2026-10-17 20:28
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# 本・本とタグの関連が変わるたびに、差分だけを集計テーブルに足し込むトリガー
+# COPYや一括操作を含む全ての書き込みで集計が保たれる
+SUMMARY_TRIGGERS = """
+CREATE FUNCTION core_book_summary_trigger() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO core_librarysummary AS s (user_id, books, total_price)
+        SELECT user_id, count(*), sum(price) FROM new_rows GROUP BY user_id
+        ON CONFLICT (user_id) DO UPDATE SET
+            books = s.books + EXCLUDED.books,
+            total_price = s.total_price + EXCLUDED.total_price;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO core_librarysummary AS s (user_id, books, total_price)
+        SELECT user_id, -count(*), -sum(price) FROM old_rows GROUP BY user_id
+        ON CONFLICT (user_id) DO UPDATE SET
+            books = s.books + EXCLUDED.books,
+            total_price = s.total_price + EXCLUDED.total_price;
+    ELSE
+        INSERT INTO core_librarysummary AS s (user_id, books, total_price)
+        SELECT user_id, sum(books), sum(total_price) FROM (
+            SELECT o.user_id, -1 AS books, -o.price AS total_price
+            FROM old_rows o JOIN new_rows n ON n.id = o.id
+            WHERE (o.user_id, o.price) IS DISTINCT FROM (n.user_id, n.price)
+            UNION ALL
+            SELECT n.user_id, 1, n.price
+            FROM old_rows o JOIN new_rows n ON n.id = o.id
+            WHERE (o.user_id, o.price) IS DISTINCT FROM (n.user_id, n.price)
+        ) changes GROUP BY user_id
+        ON CONFLICT (user_id) DO UPDATE SET
+            books = s.books + EXCLUDED.books,
+            total_price = s.total_price + EXCLUDED.total_price;
+
+        INSERT INTO core_tagsummary AS s (tag_id, books, total_price)
+        SELECT bt.tag_id, 0, sum(n.price - o.price)
+        FROM old_rows o
+        JOIN new_rows n ON n.id = o.id
+        JOIN core_book_tags bt ON bt.book_id = n.id
+        WHERE o.price <> n.price
+        GROUP BY bt.tag_id
+        ON CONFLICT (tag_id) DO UPDATE SET
+            total_price = s.total_price + EXCLUDED.total_price;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER core_book_summary_insert
+    AFTER INSERT ON core_book
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE core_book_summary_trigger();
+
+CREATE TRIGGER core_book_summary_update
+    AFTER UPDATE ON core_book
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE core_book_summary_trigger();
+
+CREATE TRIGGER core_book_summary_delete
+    AFTER DELETE ON core_book
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE core_book_summary_trigger();
+
+CREATE FUNCTION core_book_tags_summary_trigger() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO core_tagsummary AS s (tag_id, books, total_price)
+        SELECT r.tag_id, count(*), coalesce(sum(b.price), 0)
+        FROM new_rows r LEFT JOIN core_book b ON b.id = r.book_id
+        GROUP BY r.tag_id
+        ON CONFLICT (tag_id) DO UPDATE SET
+            books = s.books + EXCLUDED.books,
+            total_price = s.total_price + EXCLUDED.total_price;
+    ELSE
+        INSERT INTO core_tagsummary AS s (tag_id, books, total_price)
+        SELECT r.tag_id, -count(*), -coalesce(sum(b.price), 0)
+        FROM old_rows r LEFT JOIN core_book b ON b.id = r.book_id
+        GROUP BY r.tag_id
+        ON CONFLICT (tag_id) DO UPDATE SET
+            books = s.books + EXCLUDED.books,
+            total_price = s.total_price + EXCLUDED.total_price;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER core_book_tags_summary_insert
+    AFTER INSERT ON core_book_tags
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE core_book_tags_summary_trigger();
+
+CREATE TRIGGER core_book_tags_summary_delete
+    AFTER DELETE ON core_book_tags
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE core_book_tags_summary_trigger();
+
+-- タグやユーザーを削除するときに集計の行も削除する
+CREATE FUNCTION core_tag_summary_delete_trigger() RETURNS trigger AS $$
+BEGIN
+    DELETE FROM core_tagsummary WHERE tag_id IN (SELECT id FROM old_rows);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER core_tag_summary_delete
+    AFTER DELETE ON core_tag
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE core_tag_summary_delete_trigger();
+
+CREATE FUNCTION core_user_summary_delete_trigger() RETURNS trigger AS $$
+BEGIN
+    DELETE FROM core_librarysummary WHERE user_id IN (SELECT id FROM old_rows);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER core_user_summary_delete
+    AFTER DELETE ON core_user
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE core_user_summary_delete_trigger();
+
+INSERT INTO core_librarysummary (user_id, books, total_price)
+SELECT user_id, count(*), sum(price) FROM core_book GROUP BY user_id;
+
+INSERT INTO core_tagsummary (tag_id, books, total_price)
+SELECT bt.tag_id, count(*), sum(b.price)
+FROM core_book_tags bt JOIN core_book b ON b.id = bt.book_id
+GROUP BY bt.tag_id;
+"""
+
+DROP_SUMMARY_TRIGGERS = """
+DROP TRIGGER core_user_summary_delete ON core_user;
+DROP TRIGGER core_tag_summary_delete ON core_tag;
+DROP TRIGGER core_book_tags_summary_delete ON core_book_tags;
+DROP TRIGGER core_book_tags_summary_insert ON core_book_tags;
+DROP TRIGGER core_book_summary_delete ON core_book;
+DROP TRIGGER core_book_summary_update ON core_book;
+DROP TRIGGER core_book_summary_insert ON core_book;
+DROP FUNCTION core_user_summary_delete_trigger();
+DROP FUNCTION core_tag_summary_delete_trigger();
+DROP FUNCTION core_book_tags_summary_trigger();
+DROP FUNCTION core_book_summary_trigger();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_book_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LibrarySummary',
+            fields=[
+                ('books', models.BigIntegerField(default=0)),
+                ('total_price', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='library_summary', serialize=False, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='TagSummary',
+            fields=[
+                ('books', models.BigIntegerField(default=0)),
+                ('total_price', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('tag', models.OneToOneField(on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='summary', serialize=False, to='core.Tag')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.RunSQL(SUMMARY_TRIGGERS, DROP_SUMMARY_TRIGGERS),
+    ]
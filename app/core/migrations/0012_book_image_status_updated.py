@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-17 21:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_library_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='image_status_updated',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 2.2.28 on 2026-10-17 21:19
+
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_book_image_status_updated'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='book',
+            name='image',
+            field=models.ImageField(null=True, storage=core.storage.ContentAddressedStorage(), upload_to='uploads/book/'),
+        ),
+        migrations.AlterField(
+            model_name='book',
+            name='image_medium',
+            field=models.ImageField(blank=True, null=True, storage=core.storage.ContentAddressedStorage(), upload_to='uploads/book/'),
+        ),
+        migrations.AlterField(
+            model_name='book',
+            name='image_thumbnail',
+            field=models.ImageField(blank=True, null=True, storage=core.storage.ContentAddressedStorage(), upload_to='uploads/book/'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 2.2.28 on 2026-10-17 21:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_book_image_upload_dir'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['image'], name='core_book_image_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['image_thumbnail'], name='core_book_image_thumbnail_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['image_medium'], name='core_book_image_medium_idx'),
+        ),
+    ]
@@ -1,17 +1,25 @@
-import uuid
 import os
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, \
                                         PermissionsMixin
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.conf import settings
 
+from core.storage import image_storage
+
+
+# 本の画像を保存するディレクトリ。ファイル名はストレージが内容から決める
+BOOK_IMAGE_DIR = 'uploads/book/'
+
 
 def book_image_file_path(instance, filename):
-    """新しい本の画像のファイルパスを生成する"""
-    ext = filename.split('.')[-1]
-    filename = f'{uuid.uuid4()}.{ext}'
+    """本の画像のファイルパスを返す
 
-    return os.path.join('uploads/book/', filename)
+    以前のマイグレーションが参照するため残している
+    """
+    return os.path.join(BOOK_IMAGE_DIR, filename)
 
 
 class UserManager(BaseUserManager):
@@ -56,12 +64,32 @@ class Tag(models.Model):
         on_delete=models.CASCADE
     )
 
+    class Meta:
+        indexes = [
+            # ユーザーごとの一覧(-name順)のカーソルページネーションのため
+            models.Index(
+                fields=['user', '-name', '-id'],
+                name='core_tag_user_name_idx'
+            ),
+        ]
+
     def __str__(self):
         return self.name
 
 
 class Book(models.Model):
     """Bookオブジェクト"""
+    IMAGE_PENDING = 'pending'
+    IMAGE_PROCESSING = 'processing'
+    IMAGE_READY = 'ready'
+    IMAGE_FAILED = 'failed'
+    IMAGE_STATUS_CHOICES = (
+        (IMAGE_PENDING, 'Pending'),
+        (IMAGE_PROCESSING, 'Processing'),
+        (IMAGE_READY, 'Ready'),
+        (IMAGE_FAILED, 'Failed'),
+    )
+
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE
@@ -70,7 +98,145 @@ class Book(models.Model):
     price = models.DecimalField(max_digits=5, decimal_places=2)
     link = models.CharField(max_length=255, blank=True)
     tags = models.ManyToManyField('Tag')
-    image = models.ImageField(null=True, upload_to=book_image_file_path)
+    image = models.ImageField(
+        null=True,
+        upload_to=BOOK_IMAGE_DIR,
+        storage=image_storage
+    )
+    image_status = models.CharField(
+        max_length=16,
+        choices=IMAGE_STATUS_CHOICES,
+        blank=True
+    )
+    # image_status を最後に変更した日時。止まった処理の検出に使う
+    image_status_updated = models.DateTimeField(null=True, editable=False)
+    image_thumbnail = models.ImageField(
+        null=True,
+        blank=True,
+        upload_to=BOOK_IMAGE_DIR,
+        storage=image_storage
+    )
+    image_medium = models.ImageField(
+        null=True,
+        blank=True,
+        upload_to=BOOK_IMAGE_DIR,
+        storage=image_storage
+    )
+    # タイトルとタグの名前の検索用ベクトル
+    # データベースのトリガーが更新するため、アプリケーションからは書き込まない
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # ユーザーごとの一覧(-id順)をインデックスだけで返すため
+            models.Index(fields=['user', '-id'], name='core_book_user_id_idx'),
+            GinIndex(fields=['search_vector'], name='core_book_search_idx'),
+            # 画像のファイルを参照している本を探すため
+            models.Index(fields=['image'], name='core_book_image_idx'),
+            models.Index(fields=['image_thumbnail'],
+                         name='core_book_image_thumbnail_idx'),
+            models.Index(fields=['image_medium'],
+                         name='core_book_image_medium_idx'),
+        ]
 
     def __str__(self):
         return self.title
+
+
+class LibraryVersionManager(models.Manager):
+
+    def get_version(self, user, collection):
+        """ユーザーのコレクションの現在のバージョンを返す"""
+        version = self.filter(user=user) \
+            .values_list(collection, flat=True).first()
+
+        return version or 0
+
+    def get_versions(self, user, *collections):
+        """ユーザーの複数のコレクションのバージョンを1つのクエリで返す"""
+        versions = self.filter(user=user) \
+            .values_list(*collections).first()
+
+        return versions or (0,) * len(collections)
+
+    def bump(self, user, *collections):
+        """ユーザーのコレクションのバージョンを上げる"""
+        values = {name: F(name) + 1 for name in collections}
+        if self.filter(user=user).update(**values):
+            return
+
+        try:
+            with transaction.atomic():
+                self.create(user=user, **{name: 1 for name in collections})
+        except IntegrityError:
+            # 同時に作成された場合は作成された行を更新する
+            self.filter(user=user).update(**values)
+
+
+class LibraryVersion(models.Model):
+    """ユーザーの本とタグのコレクションのバージョン
+
+    ビューセットから書き込むたびに上がり、一覧のETagに使われる
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True
+    )
+    books = models.BigIntegerField(default=0)
+    tags = models.BigIntegerField(default=0)
+
+    objects = LibraryVersionManager()
+
+    def __str__(self):
+        return f'{self.user} (books {self.books}, tags {self.tags})'
+
+
+class PriceSummary(models.Model):
+    """本の数と価格の合計
+
+    データベースのトリガーが更新するため、アプリケーションからは書き込まない
+    """
+    books = models.BigIntegerField(default=0)
+    total_price = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0
+    )
+
+    class Meta:
+        abstract = True
+
+    @property
+    def average_price(self):
+        """本の価格の平均を返す"""
+        if not self.books:
+            return None
+
+        return self.total_price / self.books
+
+
+class LibrarySummary(PriceSummary):
+    """ユーザーの全ての本の集計"""
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.DO_NOTHING,
+        primary_key=True,
+        related_name='library_summary'
+    )
+
+    def __str__(self):
+        return f'{self.user} ({self.books} books)'
+
+
+class TagSummary(PriceSummary):
+    """タグが付いた本の集計"""
+    tag = models.OneToOneField(
+        'Tag',
+        on_delete=models.DO_NOTHING,
+        primary_key=True,
+        related_name='summary'
+    )
+
+    def __str__(self):
+        return f'{self.tag} ({self.books} books)'
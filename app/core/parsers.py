@@ -0,0 +1,26 @@
+import codecs
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+
+from core.renderers import FastJSONRenderer, orjson
+
+
+class FastJSONParser(JSONParser):
+    """orjsonでJSONを解析するパーサー
+
+    orjsonがインストールされていない場合やUTF-8以外の文字コードの
+    場合は JSONParser の処理をそのまま使う
+    """
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', 'utf-8')
+        if orjson is None or codecs.lookup(encoding).name != 'utf-8':
+            return super().parse(stream, media_type, parser_context)
+
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
@@ -0,0 +1,195 @@
+import os
+import threading
+import time
+from collections import Counter, deque
+
+
+class PoolTimeout(Exception):
+    """接続プールから時間内に接続を取得できなかったときの例外"""
+
+
+class ConnectionPool:
+    """スレッド間で共有するデータベース接続のプール
+
+    最後に返された接続から貸し出し、check_interval 秒以上使われて
+    いなかった接続は check で使えることを確かめてから渡す。
+    max_lifetime 秒を超えた接続は作り直す
+    """
+
+    def __init__(self, check, name='', max_size=10, timeout=10,
+                 check_interval=30, max_lifetime=3600):
+        self.check = check
+        self.name = name
+        self.max_size = max_size
+        self.timeout = timeout
+        self.check_interval = check_interval
+        self.max_lifetime = max_lifetime
+        self.pid = os.getpid()
+        self.closed = False
+        self.counters = Counter()
+        self._condition = threading.Condition()
+        # (接続, 返された時刻) を返された順に保持する
+        self._idle = deque()
+        self._created = {}
+        self._size = 0
+
+    def acquire(self, connect):
+        """接続を貸し出す。空きがなければ connect で新しく作る"""
+        deadline = time.monotonic() + self.timeout
+        waited = False
+        with self._condition:
+            while True:
+                if self.closed:
+                    raise PoolTimeout('Connection pool is closed')
+                if self._idle:
+                    conn, released = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    conn = None
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.counters['timeouts'] += 1
+                    raise PoolTimeout(
+                        f'No connection available within {self.timeout}s '
+                        f'(max_size={self.max_size})'
+                    )
+                if not waited:
+                    waited = True
+                    self.counters['waits'] += 1
+                self._condition.wait(remaining)
+
+        if conn is not None:
+            if self._usable(conn, released):
+                with self._condition:
+                    self.counters['reused'] += 1
+                return conn
+            # 使えない接続を閉じ、同じ枠で新しい接続を作る
+            self._close(conn)
+
+        try:
+            conn = connect()
+        except Exception:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+
+        with self._condition:
+            self._created[conn] = time.monotonic()
+            self.counters['created'] += 1
+        return conn
+
+    def release(self, conn, reuse=True):
+        """接続を返す。reuse が偽であれば閉じる"""
+        if os.getpid() != self.pid:
+            # フォーク前のプロセスの接続には触れない
+            return
+
+        with self._condition:
+            created = self._created.get(conn)
+            if reuse and not self.closed and created is not None and \
+                    not self._expired(created):
+                self._idle.append((conn, time.monotonic()))
+                self._condition.notify()
+                return
+
+            self._created.pop(conn, None)
+            self._size -= 1
+            self._condition.notify()
+
+        self._close(conn)
+
+    def close(self):
+        """プールを閉じ、使われていない接続を全て閉じる
+
+        貸し出し中の接続は返されたときに閉じる
+        """
+        with self._condition:
+            self.closed = True
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+            for conn in idle:
+                self._created.pop(conn, None)
+            self._size -= len(idle)
+            self._condition.notify_all()
+
+        if os.getpid() == self.pid:
+            for conn in idle:
+                self._close(conn)
+
+    def stats(self):
+        """プールの大きさと利用状況を返す"""
+        with self._condition:
+            return {
+                'max_size': self.max_size,
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'created': self.counters['created'],
+                'reused': self.counters['reused'],
+                'discarded': self.counters['discarded'],
+                'waits': self.counters['waits'],
+                'timeouts': self.counters['timeouts'],
+            }
+
+    def _expired(self, created):
+        return self.max_lifetime and \
+            time.monotonic() - created > self.max_lifetime
+
+    def _usable(self, conn, released):
+        """貸し出す前に接続が使えるかどうかを確かめる"""
+        if self._expired(self._created[conn]):
+            return False
+        if time.monotonic() - released < self.check_interval:
+            return True
+
+        return self.check(conn)
+
+    def _close(self, conn):
+        """接続を閉じてプールから外す"""
+        with self._condition:
+            self._created.pop(conn, None)
+            self.counters['discarded'] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(key, factory):
+    """キーに対応するプールを返す。なければ factory で作る
+
+    閉じたプールと、フォークした子プロセスでの親のプールは作り直す
+    """
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool.closed or pool.pid != os.getpid():
+            pool = _pools[key] = factory()
+
+        return pool
+
+
+def close_pools():
+    """全てのプールを閉じる"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+
+    for pool in pools:
+        pool.close()
+
+
+def pool_stats():
+    """プールの名前ごとの利用状況を返す"""
+    with _pools_lock:
+        pools = dict(_pools)
+
+    return {pool.name: pool.stats() for pool in pools.values()
+            if pool.pid == os.getpid()}
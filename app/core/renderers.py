@@ -0,0 +1,39 @@
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """orjsonでJSONを生成するレンダラー
+
+    DRFの JSONRenderer と同じバイト列を返す。orjsonがインストール
+    されていない場合やインデントを指定された場合は JSONRenderer の
+    処理をそのまま使う
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if orjson is None or indent is not None or not self.compact:
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+
+        # Decimal、日時、遅延評価の文字列などはDRFのエンコーダーで
+        # 変換し、JSONRenderer と同じ表現にする
+        ret = orjson.dumps(
+            data,
+            default=self.encoder_class().default,
+            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        )
+
+        # JSONRenderer と同様に U+2028 と U+2029 をエスケープする
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028') \
+                .replace(b'\xe2\x80\xa9', b'\\u2029')
+
+        return ret
@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from core.authentication import token_cache
+from core.models import Book
+from core.storage import release_images
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    """削除されたトークンをキャッシュから取り除く"""
+    token_cache.delete(instance.key)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_user_tokens(sender, instance, created, **kwargs):
+    """更新されたユーザーのトークンをキャッシュから取り除く"""
+    if not created:
+        token_cache.delete_user(instance)
+
+
+@receiver(post_delete, sender=Book)
+def release_deleted_book_images(sender, instance, **kwargs):
+    """削除された本だけが参照していた画像ファイルを削除する"""
+    names = [
+        instance.image.name,
+        instance.image_thumbnail.name,
+        instance.image_medium.name,
+    ]
+    if any(names):
+        transaction.on_commit(lambda: release_images(names))
@@ -0,0 +1,90 @@
+import hashlib
+import os
+import posixpath
+import time
+
+from django.core.files.storage import FileSystemStorage
+from django.db.models import Q
+
+
+# 参照がなくなってから削除できるようになるまでの猶予(秒)
+# 重複排除で同じファイルを使い始めた直後のアップロードを守るため
+ORPHAN_GRACE_SECONDS = 60
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """内容のハッシュをファイル名にして保存するストレージ
+
+    同じ内容のファイルは upload_to のディレクトリに1つだけ保存され、
+    ファイル名が変わらない限り内容も変わらない
+    """
+
+    def content_hash(self, content):
+        """ファイルの内容のSHA-256を返す"""
+        sha = hashlib.sha256()
+        for chunk in content.chunks():
+            sha.update(chunk)
+
+        return sha.hexdigest()
+
+    def content_name(self, name, content):
+        """内容を保存するときのファイル名を返す"""
+        directory, basename = posixpath.split(name)
+        ext = os.path.splitext(basename)[1].lower()
+        digest = self.content_hash(content)
+
+        return posixpath.join(directory, digest[:2], digest + ext)
+
+    def _save(self, name, content):
+        name = self.content_name(name, content)
+
+        if self.exists(name):
+            # 既存のファイルを使い回し、削除の猶予期間を延ばす
+            os.utime(self.path(name))
+            return name
+
+        return super()._save(name, content)
+
+
+image_storage = ContentAddressedStorage()
+
+
+def image_references(names):
+    """本から参照されているファイル名の集合を返す"""
+    from core.models import Book
+
+    names = list(names)
+    fields = ('image', 'image_thumbnail', 'image_medium')
+    query = Q()
+    for field in fields:
+        query |= Q(**{f'{field}__in': names})
+
+    referenced = set()
+    for row in Book.objects.filter(query).values_list(*fields):
+        referenced.update(row)
+
+    return referenced
+
+
+def release_images(names, grace=ORPHAN_GRACE_SECONDS):
+    """どの本からも参照されなくなったファイルを削除する
+
+    参照数はデータベースから数えるので、削除した本や差し替えた画像の
+    ファイル名を渡すだけでよい。削除したファイル名のリストを返す
+    """
+    names = set(filter(None, names))
+    if not names:
+        return []
+
+    deleted = []
+    threshold = time.time() - grace
+    for name in names - image_references(names):
+        try:
+            if os.path.getmtime(image_storage.path(name)) > threshold:
+                continue
+        except FileNotFoundError:
+            continue
+        image_storage.delete(name)
+        deleted.append(name)
+
+    return deleted
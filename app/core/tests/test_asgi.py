@@ -0,0 +1,230 @@
+import asyncio
+import threading
+
+from django.core.wsgi import get_wsgi_application
+from django.test import SimpleTestCase
+
+from core.asgi import ASGIAdapter
+
+
+def echo_app(environ, start_response):
+    """受け取ったリクエストを本文として返すWSGIアプリケーション"""
+    body = environ['wsgi.input'].read()
+    start_response('201 Created', [('Content-Type', 'text/plain'),
+                                   ('X-Path', environ['PATH_INFO'])])
+    return [
+        f'{environ["REQUEST_METHOD"]} {environ["QUERY_STRING"]} '.encode(),
+        environ.get('HTTP_X_TEST', '').encode(),
+        b' ' + body,
+    ]
+
+
+def request(app, path='/', method='GET', body=b'', headers=(),
+            query_string=b''):
+    """アプリケーションにリクエストを送り、送られたメッセージを返す"""
+    messages = [
+        {'type': 'http.request', 'body': body[:3], 'more_body': True},
+        {'type': 'http.request', 'body': body[3:]},
+    ]
+    sent = []
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        # 本文の後はクライアントが切断するまで待つ
+        await asyncio.Event().wait()
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        'type': 'http',
+        'http_version': '1.1',
+        'method': method,
+        'path': path,
+        'query_string': query_string,
+        'headers': list(headers),
+        'server': ('testserver', 80),
+        'client': ('127.0.0.1', 1234),
+    }
+    asyncio.run(app(scope, receive, send))
+
+    return sent
+
+
+class ASGIAdapterTests(SimpleTestCase):
+
+    def adapter(self, wsgi_app, max_threads=2):
+        app = ASGIAdapter(wsgi_app, max_threads=max_threads)
+        self.addCleanup(app.executor.shutdown)
+
+        return app
+
+    def test_request_passed_to_wsgi(self):
+        """本文、ヘッダー、クエリ文字列がWSGIアプリケーションに渡るテスト"""
+        sent = request(
+            self.adapter(echo_app),
+            path='/ほん/',
+            method='POST',
+            body=b'hello world',
+            headers=[(b'x-test', b'a'), (b'x-test', b'b')],
+            query_string=b'q=1'
+        )
+
+        start, *body = sent
+        self.assertEqual(start['status'], 201)
+        self.assertIn((b'content-type', b'text/plain'), start['headers'])
+        self.assertIn((b'x-path', '/ほん/'.encode()), start['headers'])
+        self.assertEqual(b''.join(message['body'] for message in body),
+                         b'POST q=1 a,b hello world')
+        self.assertFalse(body[-1].get('more_body'))
+
+    def test_cookie_headers_joined_with_semicolon(self):
+        """複数の Cookie ヘッダーが ; で結合されるテスト"""
+        environ = self.adapter(echo_app).build_environ({
+            'method': 'GET',
+            'path': '/',
+            'headers': [(b'cookie', b'a=1'), (b'cookie', b'b=2')],
+        }, None)
+
+        self.assertEqual(environ['HTTP_COOKIE'], 'a=1; b=2')
+
+    def test_content_length_too_large(self):
+        """Content-Length が上限を超えると本文を読まずに413を返すテスト"""
+        def fail(environ, start_response):
+            raise AssertionError('Should not be called')
+
+        app = self.adapter(fail)
+        app.max_body_size = 10
+        sent = request(app, method='POST', body=b'x' * 11,
+                       headers=[(b'content-length', b'11')])
+
+        self.assertEqual(sent[0]['status'], 413)
+
+    def test_streamed_body_too_large(self):
+        """Content-Length のない本文も上限を超えると413を返すテスト"""
+        app = self.adapter(echo_app)
+        app.max_body_size = 10
+
+        self.assertEqual(
+            request(app, method='POST', body=b'x' * 11)[0]['status'], 413
+        )
+        self.assertEqual(
+            request(app, method='POST', body=b'x' * 10)[0]['status'], 201
+        )
+
+    def test_requests_limited_to_max_threads(self):
+        """同時に処理するリクエストが max_threads 個までに制限されるテスト"""
+        lock = threading.Lock()
+        running = []
+        peak = []
+
+        def slow_app(environ, start_response):
+            with lock:
+                running.append(1)
+                peak.append(len(running))
+            threading.Event().wait(0.02)
+            with lock:
+                running.pop()
+            start_response('200 OK', [])
+            return [b'ok']
+
+        app = self.adapter(slow_app, max_threads=2)
+
+        async def many():
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(*[
+                loop.run_in_executor(None, request, app) for _ in range(8)
+            ])
+
+        asyncio.run(many())
+        self.assertEqual(max(peak), 2)
+
+    def test_disconnect_before_body(self):
+        """本文を受け取る前に切断されると処理しないテスト"""
+        def fail(environ, start_response):
+            raise AssertionError('Should not be called')
+
+        sent = []
+
+        async def receive():
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {'type': 'http', 'method': 'GET', 'path': '/'}
+        asyncio.run(self.adapter(fail)(scope, receive, send))
+
+        self.assertEqual(sent, [])
+
+    def test_streaming_stops_on_disconnect(self):
+        """切断されるとストリーミングの本文の生成をやめて閉じるテスト"""
+        produced = []
+        closed = threading.Event()
+
+        def stream():
+            try:
+                for i in range(100):
+                    produced.append(i)
+                    yield b'x'
+            finally:
+                closed.set()
+
+        def streaming_app(environ, start_response):
+            start_response('200 OK', [])
+            return stream()
+
+        sent = []
+
+        async def run():
+            messages = [{'type': 'http.request', 'body': b''}]
+            body_sent = asyncio.Event()
+
+            async def receive():
+                if messages:
+                    return messages.pop(0)
+                await body_sent.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                sent.append(message)
+                if message['type'] == 'http.response.body':
+                    body_sent.set()
+                    # 切断の通知が届くまで送信を終えない
+                    await asyncio.sleep(0.05)
+
+            scope = {'type': 'http', 'method': 'GET', 'path': '/'}
+            await self.adapter(streaming_app)(scope, receive, send)
+
+        asyncio.run(run())
+
+        self.assertTrue(closed.is_set())
+        self.assertLess(len(produced), 100)
+        self.assertTrue(sent[-1].get('more_body'))
+
+    def test_django_application(self):
+        """Djangoのアプリケーションが応答を返すテスト"""
+        sent = request(self.adapter(get_wsgi_application()),
+                       path='/healthz')
+
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertEqual(sent[1]['body'], b'{"status": "ok"}')
+
+    def test_lifespan(self):
+        """起動と終了の通知に応答するテスト"""
+        app = self.adapter(echo_app)
+        messages = [{'type': 'lifespan.startup'},
+                    {'type': 'lifespan.shutdown'}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        asyncio.run(app({'type': 'lifespan'}, receive, send))
+
+        self.assertEqual(sent, ['lifespan.startup.complete',
+                                'lifespan.shutdown.complete'])
@@ -0,0 +1,134 @@
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.authentication import TokenCache, token_cache
+from core.cache import LRUCache
+
+
+ME_URL = reverse('user:me')
+
+
+class LRUCacheTests(TestCase):
+
+    def test_evicts_least_recently_used(self):
+        """上限を超えると最も使われていないキーが破棄されるテスト"""
+        cache = LRUCache(max_size=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+
+    @patch('time.monotonic')
+    def test_expires_after_timeout(self, monotonic):
+        """有効期限が切れたキーが返されないテスト"""
+        monotonic.return_value = 100
+        cache = LRUCache(timeout=10)
+        cache.set('a', 1)
+
+        monotonic.return_value = 109
+        self.assertEqual(cache.get('a'), 1)
+        monotonic.return_value = 110
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(len(cache), 0)
+
+
+class CachedTokenAuthenticationTests(TestCase):
+
+    def setUp(self):
+        token_cache.clear()
+        self.user = get_user_model().objects.create_user(
+            'test@example.com',
+            'testpass',
+            name='Test name'
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_token_lookup_cached(self):
+        """2回目以降のリクエストでトークンを検索しないテスト"""
+        with self.assertNumQueries(1):
+            res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['email'], self.user.email)
+
+    def test_invalid_token(self):
+        """無効なトークンで認証に失敗するテスト"""
+        self.client.credentials(HTTP_AUTHORIZATION='Token invalid')
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deleted_token_invalidated(self):
+        """削除されたトークンがキャッシュから取り除かれるテスト"""
+        self.client.get(ME_URL)
+        self.token.delete()
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_invalidated(self):
+        """無効化されたユーザーがキャッシュから取り除かれるテスト"""
+        self.client.get(ME_URL)
+        self.user.is_active = False
+        self.user.save()
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_updated_user_invalidated(self):
+        """UserSerializerで更新したユーザーが次のリクエストに反映されるテスト"""
+        self.client.get(ME_URL)
+        self.client.patch(ME_URL, {'name': 'New name'})
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.data['name'], 'New name')
+
+
+class TokenCacheTests(TestCase):
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(
+            'test@example.com',
+            'testpass'
+        )
+        self.token = Token.objects.create(user=user)
+
+    def test_shared_backend_revokes_in_all_workers(self):
+        """共有のバックエンドでは他のワーカーでの削除が即座に反映されるテスト"""
+        worker = TokenCache(backend='default')
+        other = TokenCache(backend='default')
+        worker.set(self.token.key, self.token)
+        self.assertIsNotNone(other.get(self.token.key))
+
+        worker.delete(self.token.key)
+
+        self.assertIsNone(other.get(self.token.key))
+
+    @patch('time.monotonic')
+    def test_local_cache_expires_after_local_timeout(self, monotonic):
+        """ローカルのキャッシュは LOCAL_TIMEOUT 秒で期限が切れるテスト"""
+        monotonic.return_value = 100
+        cache = TokenCache(timeout=60, local_timeout=5)
+        cache.set(self.token.key, self.token)
+
+        monotonic.return_value = 105
+        self.assertIsNone(cache.get(self.token.key))
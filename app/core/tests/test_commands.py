@@ -1,23 +1,244 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
 from unittest.mock import patch
 
+from PIL import Image
+
+from django.contrib.auth import get_user_model
 from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.files.base import ContentFile
 from django.db.utils import OperationalError
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from core.models import Book, LibraryVersion, Tag
+from core.storage import image_storage
+
+
+PROBE = 'core.management.commands.wait_for_db.Command.probe'
 
 
 class CommandTests(TestCase):
 
     def test_wait_for_db_ready(self):
         """データベースを利用可能時にデータベースを待機するテスト"""
-        with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
-            gi.return_value = True
-            call_command('wait_for_db')
-            self.assertEqual(gi.call_count, 1)
+        out = StringIO()
+        call_command('wait_for_db', stdout=out)
+
+        self.assertIn('Database available!', out.getvalue())
 
     @patch('time.sleep', return_value=True)
     def test_wait_for_db(self, ts):
         """データベースを待機するテスト"""
-        with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
-            gi.side_effect = [OperationalError] * 5 + [True]
-            call_command('wait_for_db')
-            self.assertEqual(gi.call_count, 6)
+        with patch(PROBE) as probe:
+            probe.side_effect = [OperationalError] * 5 + [None]
+            call_command('wait_for_db', stdout=StringIO())
+            self.assertEqual(probe.call_count, 6)
+
+    @patch('random.uniform', return_value=0)
+    @patch('time.sleep', return_value=True)
+    def test_wait_for_db_backoff(self, ts, uniform):
+        """待ち時間が倍になり、上限で止まるテスト"""
+        with patch(PROBE) as probe:
+            probe.side_effect = [OperationalError] * 5 + [None]
+            call_command('wait_for_db', '--initial-delay', '1',
+                         '--max-delay', '4', stdout=StringIO())
+
+        self.assertEqual([c.args[0] for c in ts.call_args_list],
+                         [0.5, 1, 2, 2, 2])
+
+    @patch('time.sleep', return_value=True)
+    def test_wait_for_db_deadline(self, ts):
+        """期限を過ぎるとエラーで終了するテスト"""
+        with patch(PROBE, side_effect=OperationalError('refused')):
+            with self.assertRaisesMessage(CommandError, 'refused'):
+                call_command('wait_for_db', '--timeout', '0',
+                             stdout=StringIO())
+
+        ts.assert_not_called()
+
+
+class ImportBooksCommandTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@gmail.com',
+            'testpass'
+        )
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write_file(self, name, content):
+        """取り込むファイルを作成し、そのパスを返す"""
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+
+        return path
+
+    def import_books(self, path, *args):
+        """import_booksを実行し、その出力を返す"""
+        out = StringIO()
+        call_command('import_books', path, '--user', self.user.email,
+                     *args, stdout=out)
+
+        return out.getvalue()
+
+    def assert_imported(self, existing):
+        """取り込まれた本とタグを確認する"""
+        books = Book.objects.filter(user=self.user).order_by('id')
+        self.assertEqual(
+            [(book.title, str(book.price), book.link,
+              sorted(tag.name for tag in book.tags.all()))
+             for book in books],
+            [('Book 1', '5.00', 'http://example.com', ['Fiction', 'New']),
+             ('Book 2', '12.50', '', [])]
+        )
+        self.assertEqual(
+            Tag.objects.filter(user=self.user, name='Fiction').get(),
+            existing
+        )
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(
+            LibraryVersion.objects.get_version(self.user, 'books'),
+            1
+        )
+
+    def test_import_books_ndjson(self):
+        """NDJSONから本を取り込み、既存のタグを再利用するテスト"""
+        existing = Tag.objects.create(user=self.user, name='Fiction')
+        path = self.write_file('books.ndjson', '\n'.join([
+            json.dumps({'id': 99, 'title': 'Book 1', 'price': '5.00',
+                        'link': 'http://example.com',
+                        'tags': [{'id': 1, 'name': 'Fiction'}, 'New',
+                                 'New']}),
+            '',
+            json.dumps({'title': 'Book 2', 'price': 12.5}),
+        ]))
+
+        out = self.import_books(path, '--batch-size', '1')
+
+        self.assert_imported(existing)
+        self.assertIn('Imported 2 books and 1 new tags', out)
+
+    def test_import_books_csv(self):
+        """CSVから本を取り込むテスト"""
+        existing = Tag.objects.create(user=self.user, name='Fiction')
+        path = self.write_file('books.csv', (
+            'id,title,price,link,tags\n'
+            '1,Book 1,5.00,http://example.com,Fiction|New\n'
+            '2,Book 2,12.50,,\n'
+        ))
+
+        self.import_books(path)
+
+        self.assert_imported(existing)
+
+    def test_import_books_without_copy(self):
+        """COPYを使わずに本を取り込むテスト"""
+        existing = Tag.objects.create(user=self.user, name='Fiction')
+        path = self.write_file('books.csv', (
+            'title,price,link,tags\n'
+            'Book 1,5.00,http://example.com,New|Fiction\n'
+            'Book 2,12.50,,\n'
+        ))
+
+        self.import_books(path, '--no-copy')
+
+        self.assert_imported(existing)
+
+    def test_import_books_invalid_record(self):
+        """不正な行があると何も取り込まないテスト"""
+        path = self.write_file('books.ndjson', '\n'.join([
+            json.dumps({'title': 'Book 1', 'price': '5.00', 'tags': ['A']}),
+            json.dumps({'title': 'Book 2', 'price': 'free'}),
+        ]))
+
+        with self.assertRaisesMessage(CommandError, 'Record 2: price'):
+            self.import_books(path, '--batch-size', '1')
+
+        self.assertFalse(Book.objects.filter(user=self.user).exists())
+        self.assertFalse(Tag.objects.filter(user=self.user).exists())
+
+    def test_import_books_unreadable_file(self):
+        """読めないファイルを指定するとエラーになるテスト"""
+        for path in (os.path.join(self.directory.name, 'missing.ndjson'),
+                     self.directory.name):
+            with self.assertRaisesMessage(CommandError,
+                                          f'cannot read {path}'):
+                self.import_books(path)
+
+    def test_import_books_unknown_user(self):
+        """存在しないユーザーを指定するとエラーになるテスト"""
+        path = self.write_file('books.ndjson', '')
+
+        with self.assertRaisesMessage(CommandError, 'does not exist'):
+            call_command('import_books', path, '--user', 'no@gmail.com')
+
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class RequeueBookImagesCommandTests(TestCase):
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(
+            'test@example.com',
+            'testpass'
+        )
+        content = io.BytesIO()
+        Image.new('RGB', (300, 200)).save(content, format='JPEG')
+        image = image_storage.save('uploads/book/a.jpg',
+                                   ContentFile(content.getvalue()))
+        self.book = Book.objects.create(user=user, title='Book', price=5,
+                                        image=image)
+
+    def tearDown(self):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def set_status(self, status, seconds_ago):
+        Book.objects.filter(id=self.book.id).update(
+            image_status=status,
+            image_status_updated=timezone.now()
+            - timedelta(seconds=seconds_ago)
+        )
+
+    def test_stale_images_processed(self):
+        """止まったままの画像が処理し直されるテスト"""
+        for status in (Book.IMAGE_PENDING, Book.IMAGE_PROCESSING):
+            self.set_status(status, 3600)
+            out = StringIO()
+
+            call_command('requeue_book_images', stdout=out)
+
+            self.book.refresh_from_db()
+            self.assertEqual(self.book.image_status, Book.IMAGE_READY)
+            self.assertTrue(self.book.image_thumbnail)
+            self.assertIn('Processed 1 book images', out.getvalue())
+
+    def test_recent_images_left_alone(self):
+        """最近予約された画像は処理しないテスト"""
+        self.set_status(Book.IMAGE_PENDING, 10)
+
+        call_command('requeue_book_images', stdout=StringIO())
+
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.image_status, Book.IMAGE_PENDING)
+
+    def test_dry_run(self):
+        """--dry-run では処理せずに数だけを表示するテスト"""
+        self.set_status(Book.IMAGE_PROCESSING, 3600)
+        out = StringIO()
+
+        call_command('requeue_book_images', '--dry-run', stdout=out)
+
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.image_status, Book.IMAGE_PROCESSING)
+        self.assertIn('Would process 1 book images', out.getvalue())
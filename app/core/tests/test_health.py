@@ -0,0 +1,58 @@
+import tempfile
+from unittest.mock import patch
+
+from django.db.utils import OperationalError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+
+HEALTHZ_URL = reverse('healthz')
+READYZ_URL = reverse('readyz')
+
+
+@override_settings(MEDIA_ROOT=tempfile.gettempdir())
+class HealthCheckTests(TestCase):
+
+    def test_healthz(self):
+        """プロセスが動いていれば200を返すテスト"""
+        with patch('core.views.check_database') as check_database:
+            res = self.client.get(HEALTHZ_URL)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json(), {'status': 'ok'})
+        check_database.assert_not_called()
+
+    def test_readyz(self):
+        """データベースとメディアが使えれば200を返すテスト"""
+        res = self.client.get(READYZ_URL)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json(), {
+            'status': 'ok',
+            'checks': {'database': 'ok', 'media': 'ok'},
+        })
+        self.assertIn('no-cache', res['Cache-Control'])
+
+    def test_readyz_database_unavailable(self):
+        """データベースに接続できなければ503を返すテスト"""
+        with patch('core.views.connection.cursor',
+                   side_effect=OperationalError):
+            res = self.client.get(READYZ_URL)
+
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res.json()['checks']['database'], 'failing')
+
+    @override_settings(MEDIA_ROOT='/nonexistent/media')
+    def test_readyz_media_unavailable(self):
+        """メディアのディレクトリがなければ503を返すテスト"""
+        res = self.client.get(READYZ_URL)
+
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res.json(), {
+            'status': 'unavailable',
+            'checks': {'database': 'ok', 'media': 'failing'},
+        })
+
+    def test_probes_reject_post(self):
+        """プローブはGETとHEADだけを受け付けるテスト"""
+        self.assertEqual(self.client.post(READYZ_URL).status_code, 405)
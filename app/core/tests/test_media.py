@@ -0,0 +1,135 @@
+import os
+import shutil
+import tempfile
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+
+MEDIA_ROOT = tempfile.mkdtemp()
+HASHED_NAME = 'a' * 64 + '.jpg'
+
+
+def media_url(path):
+    """メディアファイルのURLを返す"""
+    return reverse('media', args=[path])
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ServeMediaTests(TestCase):
+
+    def setUp(self):
+        for directory in ('book', 'tmp'):
+            os.makedirs(os.path.join(MEDIA_ROOT, 'uploads', directory),
+                        exist_ok=True)
+        for name in ('book/cover.jpg', f'book/{HASHED_NAME}',
+                     'tmp/staged.upload.jpg'):
+            with open(os.path.join(MEDIA_ROOT, 'uploads', name), 'wb') as f:
+                f.write(b'0123456789')
+
+    def tearDown(self):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def test_serve_file(self):
+        """ファイルが検証用のヘッダーと共に返されるテスト"""
+        res = self.client.get(media_url('uploads/book/cover.jpg'))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(b''.join(res.streaming_content), b'0123456789')
+        self.assertEqual(res['Content-Type'], 'image/jpeg')
+        self.assertIn('ETag', res)
+        self.assertIn('Last-Modified', res)
+        self.assertEqual(res['Cache-Control'], 'public, max-age=3600')
+
+    def test_content_addressed_file_immutable(self):
+        """ハッシュ名のファイルが永続的にキャッシュされるテスト"""
+        res = self.client.get(media_url(f'uploads/book/{HASHED_NAME}'))
+
+        self.assertIn('immutable', res['Cache-Control'])
+
+    def test_not_modified(self):
+        """ETagが一致する場合に304を返すテスト"""
+        etag = self.client.get(media_url('uploads/book/cover.jpg'))['ETag']
+
+        res = self.client.get(
+            media_url('uploads/book/cover.jpg'),
+            HTTP_IF_NONE_MATCH=etag
+        )
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res['ETag'], etag)
+
+    def test_range_request(self):
+        """Rangeで指定した部分だけを返すテスト"""
+        res = self.client.get(
+            media_url('uploads/book/cover.jpg'),
+            HTTP_RANGE='bytes=2-5'
+        )
+
+        self.assertEqual(res.status_code, 206)
+        self.assertEqual(b''.join(res.streaming_content), b'2345')
+        self.assertEqual(res['Content-Range'], 'bytes 2-5/10')
+
+    def test_suffix_range_request(self):
+        """末尾からのRangeを返すテスト"""
+        res = self.client.get(
+            media_url('uploads/book/cover.jpg'),
+            HTTP_RANGE='bytes=-3'
+        )
+
+        self.assertEqual(b''.join(res.streaming_content), b'789')
+
+    def test_range_not_satisfiable(self):
+        """満たせないRangeで416を返すテスト"""
+        res = self.client.get(
+            media_url('uploads/book/cover.jpg'),
+            HTTP_RANGE='bytes=20-'
+        )
+
+        self.assertEqual(res.status_code, 416)
+        self.assertEqual(res['Content-Range'], 'bytes */10')
+
+    def test_missing_file(self):
+        """存在しないファイルとディレクトリの外側で404を返すテスト"""
+        self.assertEqual(
+            self.client.get(media_url('uploads/book/missing.jpg')).status_code,
+            404
+        )
+        self.assertEqual(
+            self.client.get(media_url('../etc/passwd')).status_code,
+            404
+        )
+
+    def test_outside_book_images_not_served(self):
+        """本の画像のディレクトリの外のファイルで404を返すテスト"""
+        for path in ('uploads/tmp/staged.upload.jpg',
+                     'uploads/book/../tmp/staged.upload.jpg'):
+            self.assertEqual(self.client.get(media_url(path)).status_code,
+                             404)
+
+    def test_content_addressed_etag_stable(self):
+        """重複排除で更新日時が変わってもETagが変わらないテスト"""
+        url = media_url(f'uploads/book/{HASHED_NAME}')
+        etag = self.client.get(url)['ETag']
+        os.utime(os.path.join(MEDIA_ROOT, 'uploads', 'book', HASHED_NAME),
+                 (1, 1))
+
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(etag, f'"{"a" * 64}"')
+        self.assertEqual(res.status_code, 304)
+
+    @override_settings(MEDIA_SERVE={
+        'MODE': 'x-accel-redirect',
+        'INTERNAL_PREFIX': '/protected-media/',
+    })
+    def test_x_accel_redirect(self):
+        """ファイルの送信をnginxに任せるテスト"""
+        res = self.client.get(media_url('uploads/book/cover.jpg'))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            res['X-Accel-Redirect'],
+            '/protected-media/uploads/book/cover.jpg'
+        )
+        self.assertEqual(res.content, b'')
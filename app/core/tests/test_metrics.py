@@ -0,0 +1,168 @@
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core.metrics import render_metrics
+from core.models import Book
+
+
+METRICS_URL = reverse('metrics')
+BOOKS_URL = reverse('book:book-list')
+
+
+def metric_value(content, name, **labels):
+    """メトリクスの出力から指定したラベルの値を返す"""
+    for line in content.splitlines():
+        match = re.match(r'^(\w+)\{(.*)\} (\S+)$', line)
+        if not match or match.group(1) != name:
+            continue
+        found = dict(re.findall(r'(\w+)="((?:[^"\\]|\\.)*)"',
+                                match.group(2)))
+        if all(found.get(key) == value for key, value in labels.items()):
+            return float(match.group(3))
+
+    return None
+
+
+def with_metrics(**options):
+    """METRICS の設定の一部を置き換える"""
+    return override_settings(METRICS={**settings.METRICS, **options})
+
+
+class MultiProcessMetricsTests(SimpleTestCase):
+
+    def test_workers_aggregated(self):
+        """複数のワーカープロセスの値が合計されるテスト"""
+        code = (
+            'import django; django.setup()\n'
+            'from core.metrics import REQUEST_DURATION\n'
+            "REQUEST_DURATION.labels('view', 'GET', '200').observe(0.1)\n"
+        )
+        with tempfile.TemporaryDirectory() as path:
+            env = {**os.environ, 'PROMETHEUS_MULTIPROC_DIR': path}
+            workers = [
+                subprocess.Popen([sys.executable, '-c', code],
+                                 cwd=settings.BASE_DIR, env=env)
+                for _ in range(2)
+            ]
+            for worker in workers:
+                self.assertEqual(worker.wait(timeout=60), 0)
+
+            with patch.dict(os.environ, PROMETHEUS_MULTIPROC_DIR=path):
+                content = render_metrics().decode()
+
+        self.assertEqual(metric_value(
+            content, 'http_request_duration_seconds_count',
+            view='view', method='GET', status='200'
+        ), 2)
+
+
+@with_metrics(TOKEN='secret')
+class MetricsMiddlewareTests(TestCase):
+    """メトリクスはプロセス全体で累計するため、前後の差で確かめる"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@gmail.com',
+            'testpass'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def scrape(self):
+        """メトリクスの出力を返す"""
+        res = self.client.get(METRICS_URL, HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(res.status_code, 200)
+        return res.content.decode()
+
+    def increase(self, before, after, name, **labels):
+        """2回の出力の間のメトリクスの増加量を返す"""
+        return (metric_value(after, name, **labels) or 0) - \
+            (metric_value(before, name, **labels) or 0)
+
+    def test_request_recorded_per_view(self):
+        """ビューごとにレイテンシ、クエリ、応答の大きさが記録されるテスト"""
+        Book.objects.create(user=self.user, title='Book', price=5)
+        before = self.scrape()
+        self.client.get(BOOKS_URL)
+        self.client.get(BOOKS_URL)
+
+        after = self.scrape()
+
+        view = {'view': 'book:book-list', 'method': 'GET'}
+        self.assertEqual(self.increase(
+            before, after, 'http_request_duration_seconds_count',
+            status='200', **view
+        ), 2)
+        for name in ('http_request_db_queries_sum',
+                     'http_request_serialize_seconds_sum',
+                     'http_request_render_seconds_sum'):
+            self.assertGreater(self.increase(before, after, name, **view), 0)
+        self.assertEqual(self.increase(
+            before, after, 'http_response_size_bytes_count', **view
+        ), 2)
+
+    def test_unresolved_paths_grouped(self):
+        """解決できないパスが1つのラベルにまとめられるテスト"""
+        before = self.scrape()
+        self.client.get('/no/such/path/1')
+        self.client.get('/no/such/path/2')
+
+        self.assertEqual(self.increase(
+            before, self.scrape(), 'http_request_duration_seconds_count',
+            view='unresolved', status='404'
+        ), 2)
+
+    def test_pool_stats_exported(self):
+        """接続プールの状態が出力されるテスト"""
+        self.assertIn('# TYPE db_pool_connections gauge', self.scrape())
+
+    @with_metrics(TOKEN='secret', SLOW_REQUEST_SECONDS=0)
+    def test_slow_request_logged_with_sql(self):
+        """遅いリクエストがSQLと共にログに出力されるテスト"""
+        with self.assertLogs('core.metrics', 'WARNING') as logs:
+            self.client.get(BOOKS_URL)
+
+        self.assertIn('Slow request GET /api/book/books/', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+
+    def test_token_required(self):
+        """トークンを設定すると Bearer トークンが必要になるテスト"""
+        self.assertEqual(self.client.get(METRICS_URL).status_code, 401)
+        res = self.client.get(METRICS_URL,
+                              HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEqual(res.status_code, 401)
+
+        res = self.client.get(METRICS_URL,
+                              HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res['Content-Type'].startswith('text/plain'))
+
+    @with_metrics(TOKEN=None)
+    def test_hidden_without_token_in_production(self):
+        """DEBUG が無効でトークンがなければ公開しないテスト"""
+        self.assertEqual(self.client.get(METRICS_URL).status_code, 403)
+
+        with self.settings(DEBUG=True):
+            self.assertEqual(self.client.get(METRICS_URL).status_code, 200)
+
+    @with_metrics(TOKEN='secret', ENABLED=False)
+    def test_disabled(self):
+        """無効にするとリクエストが記録されないテスト"""
+        before = self.scrape()
+        self.client.get(BOOKS_URL)
+
+        self.assertEqual(self.increase(
+            before, self.scrape(), 'http_request_duration_seconds_count',
+            view='book:book-list'
+        ), 0)
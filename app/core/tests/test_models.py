@@ -1,8 +1,10 @@
+import hashlib
+import tempfile
+
+from django.core.files.base import ContentFile
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 
-from unittest.mock import patch
-
 from core import models
 
 
@@ -66,12 +68,14 @@ class ModelTest(TestCase):
 
         self.assertEqual(str(book), book.title)
 
-    @patch('uuid.uuid4')
-    def test_book_file_name_uuid(self, mock_uuid):
-        """画像が正しい場所に保存されているかのテスト"""
-        uuid = 'test-uuid'
-        mock_uuid.return_value = uuid
-        file_path = models.book_image_file_path(None, 'myimage.jpg')
-
-        exp_path = f'uploads/book/{uuid}.jpg'
-        self.assertEqual(file_path, exp_path)
+    def test_book_image_file_path(self):
+        """画像が内容のハッシュの名前で正しい場所に保存されるかのテスト"""
+        book = models.Book(user=sample_user(), title='Book', price=5)
+        content = b'image'
+        with tempfile.TemporaryDirectory() as media_root, \
+                self.settings(MEDIA_ROOT=media_root):
+            book.image.save('myimage.JPG', ContentFile(content), save=False)
+
+        digest = hashlib.sha256(content).hexdigest()
+        exp_path = f'uploads/book/{digest[:2]}/{digest}.jpg'
+        self.assertEqual(book.image.name, exp_path)
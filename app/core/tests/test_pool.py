@@ -0,0 +1,207 @@
+import threading
+from unittest.mock import patch
+
+from django.db import connection
+from django.db.utils import OperationalError
+from django.test import SimpleTestCase, TestCase
+
+from core.backends.postgresql.base import DatabaseWrapper
+from core.pool import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+    """接続の代わりに使うオブジェクト"""
+
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(SimpleTestCase):
+
+    def setUp(self):
+        self.healthy = True
+        self.pool = ConnectionPool(lambda conn: self.healthy, max_size=2,
+                                   timeout=0.05)
+
+    def test_reuses_released_connection(self):
+        """返された接続が再利用されるテスト"""
+        conn = self.pool.acquire(FakeConnection)
+        self.pool.release(conn)
+
+        self.assertIs(self.pool.acquire(FakeConnection), conn)
+        stats = self.pool.stats()
+        self.assertEqual((stats['created'], stats['reused']), (1, 1))
+        self.assertEqual((stats['size'], stats['in_use']), (1, 1))
+
+    def test_timeout_when_exhausted(self):
+        """全ての接続が使われていると時間切れになるテスト"""
+        self.pool.acquire(FakeConnection)
+        self.pool.acquire(FakeConnection)
+
+        with self.assertRaises(PoolTimeout):
+            self.pool.acquire(FakeConnection)
+        self.assertEqual(self.pool.stats()['timeouts'], 1)
+
+    def test_waits_for_released_connection(self):
+        """空きを待っている間に返された接続を受け取るテスト"""
+        self.pool.timeout = 5
+        conn = self.pool.acquire(FakeConnection)
+        self.pool.acquire(FakeConnection)
+        timer = threading.Timer(0.05, self.pool.release, [conn])
+        timer.start()
+
+        self.assertIs(self.pool.acquire(FakeConnection), conn)
+        timer.join()
+        self.assertEqual(self.pool.stats()['waits'], 1)
+
+    def test_unhealthy_connection_replaced(self):
+        """確認に失敗した接続が作り直されるテスト"""
+        self.pool.check_interval = 0
+        conn = self.pool.acquire(FakeConnection)
+        self.pool.release(conn)
+        self.healthy = False
+
+        new = self.pool.acquire(FakeConnection)
+
+        self.assertIsNot(new, conn)
+        self.assertTrue(conn.closed)
+        self.assertEqual(self.pool.stats()['size'], 1)
+
+    def test_expired_connection_replaced(self):
+        """寿命を過ぎた接続が作り直されるテスト"""
+        conn = self.pool.acquire(FakeConnection)
+        self.pool.max_lifetime = 0.01
+        with patch('core.pool.time.monotonic', return_value=10 ** 9):
+            self.pool.release(conn)
+
+        self.assertTrue(conn.closed)
+        self.assertEqual(self.pool.stats()['size'], 0)
+
+    def test_release_without_reuse_closes(self):
+        """再利用しない接続が閉じられ、枠が空くテスト"""
+        conn = self.pool.acquire(FakeConnection)
+
+        self.pool.release(conn, reuse=False)
+
+        self.assertTrue(conn.closed)
+        self.assertEqual(self.pool.stats()['discarded'], 1)
+        self.assertEqual(self.pool.stats()['size'], 0)
+
+    def test_failed_connect_frees_slot(self):
+        """接続に失敗しても枠が空くテスト"""
+        def connect():
+            raise OSError
+
+        with self.assertRaises(OSError):
+            self.pool.acquire(connect)
+        self.assertEqual(self.pool.stats()['size'], 0)
+
+    def test_close_closes_idle_connections(self):
+        """プールを閉じると使われていない接続が閉じられるテスト"""
+        idle = self.pool.acquire(FakeConnection)
+        busy = self.pool.acquire(FakeConnection)
+        self.pool.release(idle)
+
+        self.pool.close()
+        self.assertTrue(idle.closed)
+        self.assertFalse(busy.closed)
+
+        self.pool.release(busy)
+        self.assertTrue(busy.closed)
+
+
+class PooledBackendTests(TestCase):
+    """ローカルのPostgreSQLに接続してプールを使うバックエンドのテスト"""
+
+    def database(self, alias='pool_test', **pool):
+        """テスト用のデータベースに接続するバックエンドを返す"""
+        settings_dict = {
+            **connection.settings_dict,
+            'POOL': {'MAX_SIZE': 2, 'TIMEOUT': 0.1, **pool},
+        }
+        wrapper = DatabaseWrapper(settings_dict, alias=alias)
+        self.addCleanup(wrapper.close)
+        self.addCleanup(
+            lambda: wrapper.get_pool(wrapper.get_connection_params()).close()
+        )
+
+        return wrapper
+
+    def backend_pid(self, wrapper):
+        """データベース側のプロセスIDを返す"""
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT pg_backend_pid()')
+            return cursor.fetchone()[0]
+
+    def test_connection_reused_after_close(self):
+        """閉じた接続が次の接続で再利用されるテスト"""
+        db = self.database()
+        pid = self.backend_pid(db)
+        db.close()
+
+        self.assertEqual(self.backend_pid(db), pid)
+
+    def test_open_transaction_rolled_back(self):
+        """トランザクションの途中で閉じた接続が巻き戻されるテスト"""
+        db = self.database()
+        db.set_autocommit(False)
+        with db.cursor() as cursor:
+            cursor.execute('CREATE TEMPORARY TABLE pool_test (id int)')
+        db.close()
+
+        with db.cursor() as cursor:
+            cursor.execute("SELECT to_regclass('pool_test')")
+            self.assertIsNone(cursor.fetchone()[0])
+
+    def test_session_state_reset(self):
+        """設定やアドバイザリーロックが次の利用者に残らないテスト"""
+        db = self.database()
+        pid = self.backend_pid(db)
+        with db.cursor() as cursor:
+            cursor.execute("SET statement_timeout = '1s'")
+            cursor.execute('SELECT pg_advisory_lock(42)')
+        db.close()
+
+        self.assertEqual(self.backend_pid(db), pid)
+        with db.cursor() as cursor:
+            cursor.execute('SHOW statement_timeout')
+            self.assertEqual(cursor.fetchone()[0], '0')
+            cursor.execute(
+                "SELECT count(*) FROM pg_locks WHERE locktype = 'advisory' "
+                'AND pid = pg_backend_pid()'
+            )
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_failed_reset_discards_connection(self):
+        """初期状態に戻せなかった接続をプールに返さないテスト"""
+        db = self.database()
+        pid = self.backend_pid(db)
+        other = self.database(alias='pool_test_other')
+        with other.cursor() as cursor:
+            cursor.execute('SELECT pg_terminate_backend(%s)', [pid])
+        db.close()
+
+        self.assertNotEqual(self.backend_pid(db), pid)
+
+    def test_terminated_connection_replaced(self):
+        """切断された接続が確認で見つかり作り直されるテスト"""
+        db = self.database(CHECK_INTERVAL=0)
+        pid = self.backend_pid(db)
+        db.close()
+        other = self.database(alias='pool_test_other')
+        with other.cursor() as cursor:
+            cursor.execute('SELECT pg_terminate_backend(%s)', [pid])
+
+        self.assertNotEqual(self.backend_pid(db), pid)
+
+    def test_pool_timeout(self):
+        """プールが一杯の場合は OperationalError になるテスト"""
+        first = self.database(MAX_SIZE=1)
+        second = self.database(MAX_SIZE=1)
+        first.ensure_connection()
+
+        with self.assertRaisesMessage(OperationalError, 'No connection'):
+            second.ensure_connection()
@@ -0,0 +1,82 @@
+import datetime
+import decimal
+import io
+import uuid
+from collections import OrderedDict
+from unittest.mock import patch
+
+from django.test import TestCase
+from django.utils.translation import gettext_lazy
+
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+
+from core.parsers import FastJSONParser
+from core.renderers import FastJSONRenderer
+
+
+SAMPLE_DATA = OrderedDict((
+    ('id', 1),
+    ('title', '本のタイトル "quoted" \u2028 \u2029'),
+    ('price', decimal.Decimal('12.50')),
+    ('uuid', uuid.UUID('12345678-1234-5678-1234-567812345678')),
+    ('created', datetime.datetime(
+        2021, 2, 11, 1, 48, 0, 123456, tzinfo=datetime.timezone.utc
+    )),
+    ('message', gettext_lazy('Invalid token.')),
+    ('tags', [1, 2, 3]),
+    ('extra', {1: None, 'ok': True, 'ratio': 0.5}),
+))
+
+
+class FastJSONRendererTests(TestCase):
+
+    def test_same_output_as_json_renderer(self):
+        """JSONRendererと同じバイト列を返すテスト"""
+        self.assertEqual(
+            FastJSONRenderer().render(SAMPLE_DATA),
+            JSONRenderer().render(SAMPLE_DATA)
+        )
+
+    def test_indent_falls_back_to_json_renderer(self):
+        """インデントの指定をJSONRendererと同じく扱うテスト"""
+        media_type = 'application/json; indent=4'
+
+        self.assertEqual(
+            FastJSONRenderer().render(SAMPLE_DATA, media_type),
+            JSONRenderer().render(SAMPLE_DATA, media_type)
+        )
+
+    def test_none_renders_empty(self):
+        """Noneを空のバイト列にするテスト"""
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+
+    @patch('core.renderers.orjson', None)
+    def test_without_orjson(self):
+        """orjsonがない場合にJSONRendererと同じ処理をするテスト"""
+        self.assertEqual(
+            FastJSONRenderer().render(SAMPLE_DATA),
+            JSONRenderer().render(SAMPLE_DATA)
+        )
+
+
+class FastJSONParserTests(TestCase):
+
+    def parse(self, content):
+        return FastJSONParser().parse(io.BytesIO(content))
+
+    def test_parse(self):
+        """JSONを解析するテスト"""
+        data = self.parse('{"title": "本", "tags": [1, 2]}'.encode())
+
+        self.assertEqual(data, {'title': '本', 'tags': [1, 2]})
+
+    def test_parse_error(self):
+        """不正なJSONでParseErrorが発生するテスト"""
+        with self.assertRaises(ParseError):
+            self.parse(b'{"title": ')
+
+    @patch('core.parsers.orjson', None)
+    def test_without_orjson(self):
+        """orjsonがない場合にJSONParserと同じ処理をするテスト"""
+        self.assertEqual(self.parse(b'[1, 2]'), [1, 2])
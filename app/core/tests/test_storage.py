@@ -0,0 +1,127 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from core.models import Book
+from core.storage import image_references, image_storage, \
+                         release_images
+
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def sample_book(user, image=None):
+    """画像を持つサンプルBookを作り返す"""
+    return Book.objects.create(
+        user=user,
+        title='Sample book',
+        price=5.00,
+        image=image
+    )
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ContentAddressedStorageTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@example.com',
+            'testpass'
+        )
+
+    def tearDown(self):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def test_identical_content_stored_once(self):
+        """同じ内容のファイルが1つだけ保存されるテスト"""
+        name1 = image_storage.save('uploads/book/a.jpg', ContentFile(b'x'))
+        name2 = image_storage.save('uploads/book/b.JPG', ContentFile(b'x'))
+        name3 = image_storage.save('uploads/book/c.jpg', ContentFile(b'y'))
+
+        self.assertEqual(name1, name2)
+        self.assertNotEqual(name1, name3)
+        self.assertTrue(name1.startswith('uploads/book/'))
+        self.assertTrue(name1.endswith('.jpg'))
+
+    def test_release_only_unreferenced_images(self):
+        """参照されていないファイルだけが削除されるテスト"""
+        used = image_storage.save('uploads/book/a.jpg', ContentFile(b'x'))
+        unused = image_storage.save('uploads/book/b.jpg', ContentFile(b'y'))
+        sample_book(self.user, image=used)
+
+        deleted = release_images([used, unused], grace=0)
+
+        self.assertEqual(deleted, [unused])
+        self.assertTrue(image_storage.exists(used))
+        self.assertFalse(image_storage.exists(unused))
+
+    def test_image_references_use_indexes(self):
+        """参照の確認が本を全て読まずに画像のインデックスを使うテスト"""
+        Book.objects.bulk_create(
+            Book(user=self.user, title=f'Book {i}', price=5, image='')
+            for i in range(5000)
+        )
+        sample_book(self.user, image='uploads/book/ab/abc.jpg')
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE core_book')
+
+        with CaptureQueriesContext(connection) as ctx:
+            referenced = image_references(['uploads/book/ab/abc.jpg'])
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN {ctx.captured_queries[0]["sql"]}')
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+
+        self.assertEqual(referenced, {'uploads/book/ab/abc.jpg', ''})
+        self.assertNotIn('Seq Scan on core_book', plan)
+
+    def test_release_respects_grace_period(self):
+        """猶予期間内のファイルが削除されないテスト"""
+        name = image_storage.save('uploads/book/a.jpg', ContentFile(b'x'))
+
+        self.assertEqual(release_images([name]), [])
+        self.assertTrue(image_storage.exists(name))
+
+    def test_gc_command_deletes_orphans(self):
+        """コマンドで参照されていないファイルが削除されるテスト"""
+        used = image_storage.save('uploads/book/a.jpg', ContentFile(b'x'))
+        unused = image_storage.save('uploads/book/b.jpg', ContentFile(b'y'))
+        sample_book(self.user, image=used)
+        stdout = StringIO()
+
+        call_command('gc_book_images', grace=0, stdout=stdout)
+
+        self.assertTrue(image_storage.exists(used))
+        self.assertFalse(image_storage.exists(unused))
+        self.assertIn('Deleted 1 files', stdout.getvalue())
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class BookDeleteReleasesImageTests(TransactionTestCase):
+
+    def tearDown(self):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def test_delete_book_releases_shared_image_last(self):
+        """最後に参照していた本の削除でファイルが削除されるテスト"""
+        user = get_user_model().objects.create_user(
+            'test@example.com',
+            'testpass'
+        )
+        name = image_storage.save('uploads/book/a.jpg', ContentFile(b'x'))
+        os.utime(image_storage.path(name), (0, 0))
+        book1 = sample_book(user, image=name)
+        book2 = sample_book(user, image=name)
+
+        book1.delete()
+        self.assertTrue(image_storage.exists(name))
+
+        book2.delete()
+        self.assertFalse(image_storage.exists(name))
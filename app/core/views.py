@@ -0,0 +1,227 @@
+import mimetypes
+import os
+import re
+import stat
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.db import DatabaseError, connection
+from django.http import FileResponse, Http404, HttpResponse, \
+                        JsonResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.crypto import constant_time_compare
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.cache import never_cache
+from django.views.decorators.http import require_safe
+
+from prometheus_client import CONTENT_TYPE_LATEST
+
+from core.metrics import render_metrics
+from core.models import BOOK_IMAGE_DIR
+
+
+# ContentAddressedStorage が保存したファイル名(内容のハッシュ)
+CONTENT_ADDRESSED_NAME = re.compile(r'^[0-9a-f]{64}\.\w+$')
+RANGE_HEADER = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def parse_range(header, size):
+    """Rangeヘッダーから (開始, 終了) を返す
+
+    単一の範囲だけに対応し、解釈できないヘッダーはNoneとして無視する。
+    満たせない範囲の場合は ValueError を送出する
+    """
+    match = RANGE_HEADER.match(header or '')
+    if not match or match.groups() == ('', ''):
+        return None
+
+    first, last = match.groups()
+    if not first:
+        # 末尾から指定されたバイト数
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+
+    if start >= size or start > end:
+        raise ValueError('Range not satisfiable')
+
+    return start, end
+
+
+def iter_range(f, start, length):
+    """ファイルの指定範囲をチャンクごとに返す"""
+    with f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def media_headers(response, path, etag, st):
+    """キャッシュと検証のためのヘッダーを設定する"""
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(st.st_mtime)
+    response['Accept-Ranges'] = 'bytes'
+    if CONTENT_ADDRESSED_NAME.match(os.path.basename(path)):
+        # 内容が変わるとファイル名も変わるため永続的にキャッシュできる
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        response['Cache-Control'] = 'public, max-age=3600'
+
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    """本の画像のファイルを返す
+
+    条件付きGETとRangeに対応する。MEDIA_SERVE の MODE に
+    x-accel-redirect または x-sendfile を指定すると、ファイルの送信を
+    フロントのウェブサーバーに任せてPythonのワーカーを占有しない。
+    アップロード中の一時ファイルなど、BOOK_IMAGE_DIR の外は返さない
+    """
+    try:
+        directory = safe_join(settings.MEDIA_ROOT, BOOK_IMAGE_DIR)
+        fullpath = safe_join(settings.MEDIA_ROOT, path)
+        if not fullpath.startswith(directory + os.sep):
+            raise Http404
+        st = os.stat(fullpath)
+    except (SuspiciousFileOperation, ValueError, OSError):
+        raise Http404
+    if not stat.S_ISREG(st.st_mode):
+        raise Http404
+
+    basename = os.path.basename(fullpath)
+    if CONTENT_ADDRESSED_NAME.match(basename):
+        # 重複排除で更新日時が変わっても、内容のハッシュは変わらない
+        etag = quote_etag(os.path.splitext(basename)[0])
+    else:
+        etag = quote_etag(f'{int(st.st_mtime):x}-{st.st_size:x}')
+    response = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=int(st.st_mtime)
+    )
+    if response is not None:
+        return media_headers(response, path, etag, st)
+
+    content_type = mimetypes.guess_type(fullpath)[0] or \
+        'application/octet-stream'
+    mode = settings.MEDIA_SERVE['MODE']
+
+    if mode == 'x-accel-redirect':
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = \
+            settings.MEDIA_SERVE['INTERNAL_PREFIX'] + path
+        return media_headers(response, path, etag, st)
+    elif mode == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = fullpath
+        return media_headers(response, path, etag, st)
+
+    byte_range = None
+    if request.META.get('HTTP_IF_RANGE', etag) == etag:
+        try:
+            byte_range = parse_range(request.META.get('HTTP_RANGE'),
+                                     st.st_size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{st.st_size}'
+            return response
+
+    if byte_range is None:
+        response = FileResponse(
+            open(fullpath, 'rb'),
+            content_type=content_type
+        )
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = StreamingHttpResponse(
+            iter_range(open(fullpath, 'rb'), start, length),
+            status=206,
+            content_type=content_type
+        )
+        response['Content-Length'] = str(length)
+        response['Content-Range'] = f'bytes {start}-{end}/{st.st_size}'
+
+    return media_headers(response, path, etag, st)
+
+
+def check_database():
+    """データベースがクエリに応答するかどうかを返す"""
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+    except DatabaseError:
+        return False
+
+    return True
+
+
+def check_media():
+    """メディアのディレクトリに書き込めるかどうかを返す"""
+    return os.path.isdir(settings.MEDIA_ROOT) and \
+        os.access(settings.MEDIA_ROOT, os.W_OK)
+
+
+@never_cache
+@require_safe
+def healthz(request):
+    """プロセスが応答できることを返す(liveness probe)
+
+    外部の依存先は確かめないため、データベースの障害で
+    再起動が繰り返されることはない
+    """
+    return JsonResponse({'status': 'ok'})
+
+
+@never_cache
+@require_safe
+def readyz(request):
+    """リクエストを受け付けられるかどうかを返す(readiness probe)
+
+    データベースとメディアのストレージを確かめ、
+    どちらかが使えない場合は503を返す
+    """
+    checks = {
+        'database': check_database(),
+        'media': check_media(),
+    }
+    ready = all(checks.values())
+
+    return JsonResponse(
+        {
+            'status': 'ok' if ready else 'unavailable',
+            'checks': {name: 'ok' if passed else 'failing'
+                       for name, passed in checks.items()},
+        },
+        status=200 if ready else 503
+    )
+
+
+@never_cache
+@require_safe
+def metrics(request):
+    """リクエストと接続プールのメトリクスをPrometheusの形式で返す
+
+    METRICS の TOKEN の Bearer トークンを要求する。DEBUG が無効で
+    トークンが設定されていない場合は公開しない
+    """
+    token = settings.METRICS['TOKEN']
+    if not token:
+        if not settings.DEBUG:
+            return HttpResponse(status=403)
+    elif not constant_time_compare(
+        request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'
+    ):
+        return HttpResponse(status=401)
+
+    return HttpResponse(render_metrics(), content_type=CONTENT_TYPE_LATEST)
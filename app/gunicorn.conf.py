@@ -0,0 +1,91 @@
+"""本番環境で使うgunicornの設定
+
+manage.py と同じディレクトリから起動する::
+
+    gunicorn -c gunicorn.conf.py app.wsgi
+
+ASGIで動かす場合は uvicorn のワーカーを使う::
+
+    gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker app.asgi
+
+各値は環境変数 GUNICORN_* で上書きできる。マスタープロセスに
+HUPシグナルを送ると、処理中のリクエストを終えてから新しい
+コードのワーカーに入れ替わる
+"""
+import glob
+import multiprocessing
+import os
+
+
+def env_int(name, default):
+    """環境変数を整数として返す"""
+    return int(os.environ.get(name, default))
+
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+
+# データベースを待つ間も他のリクエストを処理できるようスレッドを使う
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = env_int('GUNICORN_THREADS', 4)
+
+# ワーカーごとの接続プールは、全てのスレッドと画像処理のワーカーが
+# 同時に接続を持てる大きさにする。ワーカーがDjangoを読み込む前に設定する
+pool_size = env_int(
+    'DB_POOL_MAX_SIZE',
+    threads + env_int('BOOK_IMAGE_WORKERS', 2)
+)
+os.environ['DB_POOL_MAX_SIZE'] = str(pool_size)
+
+# CPUコアあたり2つのワーカーに1つを加える。ただし全てのワーカーの接続の
+# 合計 (workers * DB_POOL_MAX_SIZE) が、PostgreSQL の max_connections から
+# マイグレーションや管理コマンドの分を残した数を超えないようにする
+db_connections = env_int('DB_MAX_CONNECTIONS', 100) - \
+    env_int('DB_RESERVED_CONNECTIONS', 10)
+workers = min(
+    env_int('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1),
+    max(db_connections // pool_size, 1)
+)
+
+# フロントのプロキシとの接続を使い回す秒数
+keepalive = env_int('GUNICORN_KEEPALIVE', 5)
+timeout = env_int('GUNICORN_TIMEOUT', 30)
+graceful_timeout = env_int('GUNICORN_GRACEFUL_TIMEOUT', 30)
+
+# メモリの増加を抑えるため、一定数のリクエストごとにワーカーを入れ替える。
+# 全てのワーカーが同時に入れ替わらないよう揺らす
+max_requests = env_int('GUNICORN_MAX_REQUESTS', 1000)
+max_requests_jitter = env_int('GUNICORN_MAX_REQUESTS_JITTER', 100)
+
+# 接続プールと画像処理のスレッドはワーカーごとに作るため、
+# アプリケーションはフォークしてから読み込む
+preload_app = False
+worker_tmp_dir = '/dev/shm'
+
+accesslog = '-'
+errorlog = '-'
+
+# ワーカーごとのメトリクスをこのディレクトリのファイルで集計する。
+# ワーカーがDjangoを読み込む前に設定する必要がある
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/dev/shm/metrics')
+
+
+def on_starting(server):
+    """前回の起動で残ったメトリクスのファイルを消す"""
+    path = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    os.makedirs(path, exist_ok=True)
+    for name in glob.glob(os.path.join(path, '*.db')):
+        os.remove(name)
+
+
+def child_exit(server, worker):
+    """終了したワーカーのゲージを集計から外す"""
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def worker_exit(server, worker):
+    """ワーカーの終了時にプールの接続を閉じる"""
+    from core.pool import close_pools
+
+    close_pools()
@@ -64,21 +64,30 @@ const useStyles = makeStyles((theme) => ({
 
 class books extends Component {    
     state = {
-        book: []
+        book: [],
+        next: null,
+        loading: false
     };
 
     componentDidMount() {
-        this.getBook();
+        this.getBook('http://localhost:8000/api/book/books');
     }
 
-    getBook() {
+    // 一覧はカーソルでページ分けされるため、next のURLで続きを読み込む
+    getBook(url) {
+        this.setState({ loading: true });
         axios
-        .get('http://localhost:8000/api/book/books')
+        .get(url)
         .then(res => {
-        this.setState({ book: res.data });
+        this.setState(state => ({
+            book: state.book.concat(res.data.results),
+            next: res.data.next,
+            loading: false
+        }));
             })
         .catch(err => {
             console.log(err);
+            this.setState({ loading: false });
         });
     }
 
@@ -99,7 +108,7 @@ class books extends Component {
                         {/* End hero unit */}
                         <Grid container spacing={4}>
                             {this.state.book.map(item => (
-                                <Grid item key={item} xs={12} sm={6} md={4}>
+                                <Grid item key={item.id} xs={12} sm={6} md={4}>
                                     <Card className={useStyles.card}>
                                         <CardMedia
                                             className={useStyles.cardMedia}
@@ -126,6 +135,17 @@ class books extends Component {
                                 </Grid>
                             ))}
                         </Grid>
+                        {this.state.next && (
+                            <Button
+                                className={useStyles.heroButtons}
+                                variant="outlined"
+                                color="primary"
+                                disabled={this.state.loading}
+                                onClick={() => this.getBook(this.state.next)}
+                            >
+                            Load more
+                            </Button>
+                        )}
                     </Container>
                 </main>
                 {/* Footer */}